@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+"""
+Запись загружаемых файлов на диск без блокировки цикла событий.
+
+Данные пишутся порциями по мере получения (aiofiles) в уникальный временный файл
+<имя>.*.part рядом с итоговым (одновременные загрузки в одно имя не мешают друг другу),
+который по окончании атомарно переименовывается в итоговое имя. При ошибке временный
+файл удаляется, поэтому недокачанный файл никогда не оказывается на месте итогового.
+DownloadStats собирает скорость записи и пик данных, одновременно находящихся в памяти.
+"""
+
+import asyncio
+import base64
+import os
+import tempfile
+import time
+
+import aiofiles
+
+DISK_WRITE_CHUNK_SIZE = int(os.getenv("DISK_WRITE_CHUNK_SIZE", 64 * 1024))
+
+
+class DownloadStats:
+    """Общая статистика записи для нескольких (в т.ч. одновременных) загрузок."""
+
+    def __init__(self):
+        self.files = 0
+        self.bytes = 0
+        self.buffered = 0  # байт получено, но еще не записано
+        self.peak_buffered = 0
+        self._started_at = None
+        self._finished_at = None
+
+    def _hold(self, size):
+        if self._started_at is None:
+            self._started_at = time.monotonic()
+        self.buffered += size
+        self.peak_buffered = max(self.peak_buffered, self.buffered)
+
+    def _release(self, size, written):
+        self.buffered -= size
+        if written:
+            self.bytes += size
+            self._finished_at = time.monotonic()
+
+    @property
+    def elapsed(self):
+        # ни одна запись не завершилась (все упали или записей не было) - считаем до текущего момента
+        if self._started_at is None:
+            return 0.0
+        finished_at = self._finished_at if self._finished_at is not None else time.monotonic()
+        return finished_at - self._started_at
+
+    @property
+    def bytes_per_sec(self):
+        return self.bytes / self.elapsed if self.elapsed else 0.0
+
+    def report(self):
+        return (f"Записано файлов: {self.files}, {self.bytes / 2 ** 20:.1f} МБ, "
+                f"{self.bytes_per_sec / 2 ** 20:.2f} МБ/сек, пик в памяти: {self.peak_buffered / 2 ** 10:.0f} КБ")
+
+
+def _remove_quietly(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+async def stream_to_file(chunks, file_path, stats=None, hasher=None):
+    """
+    Записывает асинхронный итератор байтовых порций в file_path через временный файл.
+    hasher - объект hashlib, который нужно обновить записанными данными.
+    Возвращает размер файла.
+    """
+    directory = os.path.dirname(file_path)
+    if directory:
+        await asyncio.to_thread(os.makedirs, directory, exist_ok=True)
+    fd, tmp_path = await asyncio.to_thread(
+        tempfile.mkstemp, dir=directory or None, prefix=f"{os.path.basename(file_path)}.", suffix=".part")
+    os.close(fd)
+
+    size = 0
+    try:
+        async with aiofiles.open(tmp_path, "wb") as f:
+            async for chunk in chunks:
+                if stats is not None:
+                    stats._hold(len(chunk))
+                written = False
+                try:
+                    if hasher is not None:
+                        hasher.update(chunk)
+                    await f.write(chunk)
+                    written = True
+                finally:
+                    if stats is not None:
+                        stats._release(len(chunk), written)
+                size += len(chunk)
+        await asyncio.to_thread(os.replace, tmp_path, file_path)
+    except BaseException:
+        await asyncio.shield(asyncio.to_thread(_remove_quietly, tmp_path))
+        raise
+
+    if stats is not None:
+        stats.files += 1
+    return size
+
+
+async def save_response(response, file_path, stats=None, hasher=None, chunk_size=DISK_WRITE_CHUNK_SIZE):
+    """Сохраняет тело ответа aiohttp в файл, не читая его целиком в память."""
+    return await stream_to_file(response.content.iter_chunked(chunk_size), file_path, stats, hasher)
+
+
+async def iter_base64_decoded(data, chunk_size=DISK_WRITE_CHUNK_SIZE):
+    """
+    Декодирует base64 строку порциями (кратными 4 символам), чтобы не держать
+    в памяти все декодированные байты сразу. Пробелы и переносы строк пропускаются,
+    как в base64.b64decode.
+    """
+    data = data[:0].join(data.split())  # иначе порции по 4 символа сбиваются
+    step = chunk_size // 3 * 4
+    for start in range(0, len(data), step):
+        yield base64.b64decode(data[start:start + step])
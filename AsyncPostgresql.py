@@ -1,20 +1,35 @@
-import re
 import asyncio
+import atexit
+import io
 import os
 import sys
+import time
 import traceback
 import warnings
-from concurrent.futures import ProcessPoolExecutor
+from contextlib import aclosing, asynccontextmanager
+from functools import lru_cache
 from concurrent.futures import ThreadPoolExecutor
-from functools import partial
 from pathlib import Path
 
-import asyncpg
-import pandas as pd
-import requests
 from dotenv import load_dotenv
-from sqlalchemy import create_engine
-from sqlalchemy.ext.asyncio import create_async_engine
+
+from LazyImport import lazy_import
+from PgInstrumentation import (
+    instrument_sqlalchemy_engine,
+    pool_wait_var,
+    psycopg2_cursor_factory,
+    record_query,
+    rows_from_status,
+    track_query,
+)
+from PgQueryCache import query_cache, tables_in_sql
+
+# тяжелые зависимости загружаются при первом обращении, а не при импорте модуля
+aiohttp = lazy_import("aiohttp", optional=True)  # нужен только для загрузки JSON по HTTP
+asyncpg = lazy_import("asyncpg")
+np = lazy_import("numpy")
+pd = lazy_import("pandas")
+requests = lazy_import("requests", optional=True)
 
 
 # --- 1. Конфигурация и загрузка переменных окружения ---
@@ -26,6 +41,7 @@ BASENAME = os.getenv("PG_DBNAME")  # Имя БД PostgreSQL
 HOSTNAME_PUBLIC = os.getenv("PG_HOST_LOCAL")  # Хост PostgreSQL
 PORT = os.getenv("PG_PORT")  # Порт PostgreSQL
 URL_CONST = os.getenv("URL_1C")
+PG_ECHO = os.getenv("PG_ECHO", "").lower() in ("1", "true", "yes")  # логировать каждый запрос SQLAlchemy
 
 CONN_PARAMS = {
     "user": USERNAME,
@@ -38,44 +54,190 @@ CONN_PARAMS = {
 
 warnings.filterwarnings("ignore", message="pandas only supports SQLAlchemy connectable")
 
-pg_engine_async = create_async_engine(
-    'postgresql+asyncpg://%s:%s@%s:%s/%s' % (USERNAME, PSW, HOSTNAME_PUBLIC, PORT, BASENAME),
-    echo=True)
 
-engine = create_engine('postgresql://%s:%s@%s:%s/%s' % (USERNAME, PSW, HOSTNAME_PUBLIC, PORT, BASENAME))
+@lru_cache(maxsize=None)
+def get_async_engine():
+    from sqlalchemy.ext.asyncio import create_async_engine
+
+    pg_engine_async = create_async_engine(
+        'postgresql+asyncpg://%s:%s@%s:%s/%s' % (USERNAME, PSW, HOSTNAME_PUBLIC, PORT, BASENAME),
+        echo=PG_ECHO)
+    # время и строки запросов через SQLAlchemy (pd.read_sql и т.п.) попадают в общую статистику
+    instrument_sqlalchemy_engine(pg_engine_async.sync_engine)
+    return pg_engine_async
+
+
+@lru_cache(maxsize=None)
+def get_engine():
+    from sqlalchemy import create_engine
+
+    engine = create_engine('postgresql://%s:%s@%s:%s/%s' % (USERNAME, PSW, HOSTNAME_PUBLIC, PORT, BASENAME))
+    instrument_sqlalchemy_engine(engine)
+    return engine
+
+
+@lru_cache(maxsize=None)
+def get_executor():
+    return ThreadPoolExecutor(max_workers=4)
+
+
+# engine, pg_engine_async и executor создаются при первом обращении (AsyncPostgresql.engine и т.п.)
+_LAZY_ATTRIBUTES = {"engine": get_engine, "pg_engine_async": get_async_engine, "executor": get_executor}
+
+
+def __getattr__(name):
+    if name in _LAZY_ATTRIBUTES:
+        return _LAZY_ATTRIBUTES[name]()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+# --- 2. Пул соединений asyncpg ---
+# Параметры пула можно переопределить через .env
+POOL_MIN_SIZE = int(os.getenv("PG_POOL_MIN_SIZE", 1))
+POOL_MAX_SIZE = int(os.getenv("PG_POOL_MAX_SIZE", 10))
+# Кэш подготовленных выражений на каждое соединение пула (0 - отключить)
+POOL_STATEMENT_CACHE_SIZE = int(os.getenv("PG_STATEMENT_CACHE_SIZE", 100))
+# Через сколько секунд простоя соединение закрывается пулом
+POOL_MAX_INACTIVE_LIFETIME = float(os.getenv("PG_POOL_MAX_INACTIVE_LIFETIME", 300))
+# Как часто (сек) проверять соединение перед выдачей из пула
+POOL_HEALTH_CHECK_INTERVAL = float(os.getenv("PG_POOL_HEALTH_CHECK_INTERVAL", 30))
+
+_pool = None
+_pool_loop = None
+_pool_lock = None
+_last_health_check = {}  # pid серверного процесса -> время последней проверки
+
+
+async def _check_connection(conn):
+    # вызывается пулом при каждой выдаче соединения.
+    # SELECT 1 выполняем не чаще POOL_HEALTH_CHECK_INTERVAL, чтобы не платить лишний round trip
+    pid = conn.get_server_pid()
+    now = time.monotonic()
+    if now - _last_health_check.get(pid, 0) < POOL_HEALTH_CHECK_INTERVAL:
+        return
+    await conn.execute("SELECT 1")
+    _last_health_check[pid] = now
+
+
+async def get_pool():
+    """Возвращает общий для процесса пул asyncpg, создавая его при первом обращении."""
+    global _pool, _pool_loop, _pool_lock
+
+    loop = asyncio.get_running_loop()
+    if _pool is not None and _pool_loop is loop and not _pool.is_closing():
+        return _pool
+
+    if _pool_lock is None or _pool_loop is not loop:
+        # пул привязан к event loop. Каждый asyncio.run() создает новый loop,
+        # поэтому старый пул (если остался) просто обрываем
+        if _pool is not None and _pool_loop is not loop:
+            _pool.terminate()
+            _pool = None
+        _pool_loop = loop
+        _pool_lock = asyncio.Lock()
+
+    async with _pool_lock:
+        if _pool is None or _pool.is_closing():
+            _last_health_check.clear()
+            _pool = await asyncpg.create_pool(
+                **CONN_PARAMS,
+                min_size=POOL_MIN_SIZE,
+                max_size=POOL_MAX_SIZE,
+                statement_cache_size=POOL_STATEMENT_CACHE_SIZE,
+                max_inactive_connection_lifetime=POOL_MAX_INACTIVE_LIFETIME,
+                setup=_check_connection,
+            )
+    return _pool
+
+
+@asynccontextmanager
+async def acquire_connection(timeout=None):
+    """Выдает соединение из пула и возвращает его обратно после использования."""
+    pool = await get_pool()
+    start = time.perf_counter()
+    try:
+        conn = await pool.acquire(timeout=timeout)
+    except (OSError, asyncpg.exceptions.PostgresConnectionError, asyncpg.exceptions.InterfaceError):
+        # соединение не прошло проверку (сервер перезапущен, сеть и т.п.).
+        # Пул его уже закрыл, пробуем получить другое
+        conn = await pool.acquire(timeout=timeout)
+    # время ожидания соединения попадает в статистику запросов, выполненных на нем
+    token = pool_wait_var.set(time.perf_counter() - start)
+    try:
+        yield conn
+    finally:
+        pool_wait_var.reset(token)
+        await pool.release(conn)
+
+
+async def close_pool():
+    """Корректно закрывает пул (дожидается возврата всех соединений)."""
+    global _pool
+    if _pool is not None:
+        pool, _pool = _pool, None
+        if pool.is_closing():
+            return
+        if _pool_loop is asyncio.get_running_loop():
+            await pool.close()
+        else:
+            pool.terminate()
+
+
+@atexit.register
+def _terminate_pool():
+    # к моменту выхода loop уже закрыт, поэтому соединения просто обрываем
+    if _pool is not None and not _pool.is_closing():
+        _pool.terminate()
+
 
-# Create a ThreadPoolExecutor
-executor = ThreadPoolExecutor(max_workers=4)
+async def cached_query(kind, sql, args, cache_ttl, loader):
+    """
+    Возвращает результат loader() из кэша query_cache или выполняет его и кэширует на cache_ttl секунд.
+    Запись кэша привязывается к таблицам запроса и сбрасывается при записи в них.
+    """
+    key = query_cache.make_key(kind, sql, args)
+    hit, value = query_cache.get(key)
+    if hit:
+        return value
+    value = await loader()
+    if value is not None:
+        query_cache.put(key, value, tables_in_sql(sql), cache_ttl)
+    return value
 
 
 # обработчик, для получения из базы одной записи/строки
-async def get_result_one_column(sql, *args):
-    conn = await asyncpg.connect(**CONN_PARAMS)
+# cache_ttl - включает кэширование результата на указанное количество секунд
+async def get_result_one_column(sql, *args, cache_ttl=None):
+    if cache_ttl:
+        return await cached_query("column", sql, args, cache_ttl, lambda: get_result_one_column(sql, *args))
     try:
-        if len(args) == 0:
-            result = await conn.fetchval(sql)
-        else:
-            result = await conn.fetchval(sql, *args)
-        return result
+        async with acquire_connection() as conn:
+            with track_query(sql) as timer:
+                if len(args) == 0:
+                    result = await conn.fetchval(sql)
+                else:
+                    result = await conn.fetchval(sql, *args)
+                timer.rows = int(result is not None)
+            return result
     except Exception as e:
         sms = "ERROR:get_result_one_column: %s " % e
         print(sms)
 
-    finally:
-        if conn and not conn.is_closed():
-            await conn.close()
-
     return None
 
 
 # обработчик, для получения из базы одной записи/строки
-async def get_result_one_row(sql, *args):
-    conn = await asyncpg.connect(**CONN_PARAMS)
+async def get_result_one_row(sql, *args, cache_ttl=None):
+    if cache_ttl:
+        return await cached_query("row", sql, args, cache_ttl, lambda: get_result_one_row(sql, *args))
     try:
-        if len(args) == 0:
-            records = await conn.fetchrow(sql)
-        else:
-            records = await conn.fetchrow(sql, *args)
+        async with acquire_connection() as conn:
+            with track_query(sql) as timer:
+                if len(args) == 0:
+                    records = await conn.fetchrow(sql)
+                else:
+                    records = await conn.fetchrow(sql, *args)
+                timer.rows = int(records is not None)
 
         record_dict = dict(records)
         df = pd.DataFrame([record_dict])
@@ -84,49 +246,350 @@ async def get_result_one_row(sql, *args):
         sms = "ERROR:get_result_one_row: %s " % e
         print(sms)
 
+    return None
+
+
+# --- 3. Преобразование результата запроса в DataFrame по колонкам ---
+# OID типов PostgreSQL (см. pg_type)
+PG_BOOL_OID = 16
+PG_INT_OIDS = {20, 21, 23, 26}  # int8, int2, int4, oid
+PG_FLOAT_OIDS = {700, 701}  # float4, float8
+PG_NUMERIC_OID = 1700
+PG_TEXT_OIDS = {19, 25, 1042, 1043}  # name, text, bpchar, varchar
+PG_DATE_OID = 1082
+PG_TIMESTAMP_OID = 1114
+PG_TIMESTAMPTZ_OID = 1184
+
+
+def statement_columns(stmt):
+    """Список (имя колонки, OID типа) подготовленного выражения asyncpg."""
+    return [(attr.name, attr.type.oid) for attr in stmt.get_attributes()]
+
+
+def _object_array(values):
+    # np.array(list) пытается "развернуть" вложенные списки (array, json), поэтому заполняем вручную
+    array = np.empty(len(values), dtype=object)
+    array[:] = values
+    return array
+
+
+def _column_to_array(values, oid, as_category, numeric_as_float):
+    if oid in PG_INT_OIDS:
+        if None in values:
+            return pd.array(values, dtype="Int64")
+        return np.array(values, dtype=np.int64)
+    if oid in PG_FLOAT_OIDS or (oid == PG_NUMERIC_OID and numeric_as_float):
+        return np.array(values, dtype=np.float64)  # None -> NaN
+    if oid == PG_BOOL_OID:
+        if None in values:
+            return pd.array(values, dtype="boolean")
+        return np.array(values, dtype=bool)
+    if oid in (PG_DATE_OID, PG_TIMESTAMP_OID):
+        try:
+            return np.array(values, dtype="datetime64[ns]")  # None -> NaT
+        except (OverflowError, ValueError):
+            # 'infinity' и даты вне диапазона datetime64[ns] оставляем объектами
+            return _object_array(values)
+    if oid == PG_TIMESTAMPTZ_OID:
+        return pd.to_datetime(values, utc=True).array
+    if oid in PG_TEXT_OIDS and as_category:
+        return pd.Categorical(values)
+    return _object_array(values)
+
+
+def records_to_df(records, columns, category_columns=None, numeric_as_float=False, as_arrow=False):
+    """
+    Строит DataFrame из записей asyncpg по колонкам, без промежуточного dict на каждую строку.
+    columns - список (имя, OID типа), см. statement_columns.
+    category_columns - имена текстовых колонок, которые нужно хранить как category (True - все текстовые).
+    numeric_as_float - numeric переводится в float64 (быстрее, но с ошибками округления); по умолчанию
+    остаются объекты Decimal, как в суммах из get_df/sql_to_df_async.
+    as_arrow - вернуть pyarrow.Table вместо DataFrame.
+    """
+    values_by_column = list(zip(*records)) if records else [() for _ in columns]
+    data = {}
+    for (name, oid), values in zip(columns, values_by_column):
+        as_category = category_columns is True or (category_columns is not None and name in category_columns)
+        data[name] = _column_to_array(values, oid, as_category, numeric_as_float)
+
+    df = pd.DataFrame(data, columns=list(data))
+    return _df_to_arrow(df) if as_arrow else df
+
+
+def _df_to_arrow(df):
+    try:
+        import pyarrow as pa
+    except ImportError:
+        raise ImportError("Для as_arrow=True установите pyarrow: pip install pyarrow")
+    return pa.Table.from_pandas(df, preserve_index=False)
+
+
+async def fetch_df(sql, *args, category_columns=None, numeric_as_float=False, as_arrow=False):
+    """Выполняет запрос и возвращает результат как DataFrame с типами колонок из PostgreSQL."""
+    async with acquire_connection() as conn:
+        with track_query(sql) as timer:
+            stmt = await conn.prepare(sql)
+            records = await stmt.fetch(*args)
+            df = records_to_df(records, statement_columns(stmt), category_columns, numeric_as_float)
+            timer.rows = len(records)
+            timer.nbytes = int(df.memory_usage(index=False).sum())
+    return _df_to_arrow(df) if as_arrow else df
+
+
+# Размер порции по умолчанию для потокового чтения
+STREAM_CHUNK_SIZE = int(os.getenv("PG_STREAM_CHUNK_SIZE", 10000))
+
+
+async def _iter_cursor_chunks(sql, args, chunk_size):
+    # серверный курсор asyncpg работает только внутри транзакции.
+    # В статистику идет только время выборки, без времени обработки порций потребителем
+    fetch_time = 0.0
+    rows = 0
+    error = None
+    async with acquire_connection() as conn:
+        try:
+            async with conn.transaction():
+                start = time.perf_counter()
+                stmt = await conn.prepare(sql)
+                cursor = await stmt.cursor(*args)
+                while True:
+                    records = await cursor.fetch(chunk_size)
+                    fetch_time += time.perf_counter() - start
+                    if not records:
+                        break
+                    rows += len(records)
+                    yield stmt, records
+                    start = time.perf_counter()
+        except GeneratorExit:
+            # потребитель прекратил чтение раньше времени - это не ошибка запроса
+            raise
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            record_query(sql, fetch_time, rows, pool_wait=pool_wait_var.get(), error=error)
+
+
+async def iter_records(sql, *args, chunk_size=STREAM_CHUNK_SIZE):
+    """
+    Асинхронный генератор: читает результат запроса через серверный курсор
+    и отдает списки записей asyncpg длиной не более chunk_size.
+    Соединение и транзакция заняты, пока генератор не закрыт. Если цикл может прерваться
+    раньше (break, return, исключение), оборачивайте генератор в contextlib.aclosing:
+        async with aclosing(iter_records(sql)) as chunks:
+            async for records in chunks: ...
+    """
+    async with aclosing(_iter_cursor_chunks(sql, args, chunk_size)) as chunks:
+        async for _, records in chunks:
+            yield records
+
+
+async def iter_df_chunks(sql, *args, chunk_size=STREAM_CHUNK_SIZE, category_columns=None,
+                         numeric_as_float=False, as_arrow=False):
+    """
+    Асинхронный генератор DataFrame (или pyarrow.Table при as_arrow=True) по chunk_size строк.
+    В памяти одновременно находится только одна порция, обработку можно начинать
+    на первых строках, пока остальные еще читаются с сервера.
+    При досрочном выходе из цикла используйте contextlib.aclosing, как для iter_records.
+    """
+    columns = None
+    async with aclosing(_iter_cursor_chunks(sql, args, chunk_size)) as chunks:
+        async for stmt, records in chunks:
+            if columns is None:
+                columns = statement_columns(stmt)
+            yield records_to_df(records, columns, category_columns, numeric_as_float, as_arrow)
+
+
+def iter_df_chunks_sync(sql, chunk_size=STREAM_CHUNK_SIZE, params=None, conn=None):
+    """
+    Синхронный генератор DataFrame по chunk_size строк через именованный (серверный) курсор psycopg2.
+    Если conn не передан, используется con_postgres_psycopg2() и соединение закрывается по окончании.
+    """
+    own_conn = conn is None
+    if own_conn:
+        conn = con_postgres_psycopg2()
+    try:
+        with conn.cursor(name="iter_df_chunks_sync") as cursor:
+            cursor.itersize = chunk_size
+            cursor.execute(sql, params)
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    break
+                # у именованного курсора description заполняется только после первой выборки
+                columns = [column.name for column in cursor.description]
+                yield pd.DataFrame.from_records(rows, columns=columns)
     finally:
-        if conn and not conn.is_closed():
-            await conn.close()
+        if own_conn and conn:
+            conn.close()
+
+
+# --- 4. Массовая загрузка DataFrame через COPY ---
+
+def pg_type_for_dtype(dtype):
+    """Возвращает тип PostgreSQL, соответствующий dtype колонки DataFrame."""
+    if isinstance(dtype, pd.DatetimeTZDtype):
+        return "timestamptz"
+    if pd.api.types.is_bool_dtype(dtype):
+        return "boolean"
+    if pd.api.types.is_integer_dtype(dtype):
+        return {2: "smallint", 4: "integer"}.get(dtype.itemsize, "bigint")
+    if pd.api.types.is_float_dtype(dtype):
+        return "real" if dtype.itemsize == 4 else "double precision"
+    if pd.api.types.is_datetime64_dtype(dtype):
+        return "timestamp"
+    if pd.api.types.is_timedelta64_dtype(dtype):
+        return "interval"
+    return "text"
+
+
+def _split_table_name(table_name):
+    # asyncpg экранирует имена, поэтому "schema.table" надо передавать раздельно
+    if "." in table_name:
+        schema_name, table = table_name.split(".", 1)
+        return schema_name, table
+    return None, table_name
+
+
+def _quoted_columns(columns):
+    return ", ".join(f'"{column}"' for column in columns)
+
+
+def create_table_sql(df, table_name):
+    """CREATE TABLE IF NOT EXISTS с колонками и типами из DataFrame (аналог to_sql if_exists='append')."""
+    columns = ", ".join(f'"{column}" {pg_type_for_dtype(dtype)}' for column, dtype in df.dtypes.items())
+    return f"CREATE TABLE IF NOT EXISTS {table_name} ({columns})"
+
+
+def _df_to_records(df):
+    # бинарный COPY принимает только питоновские объекты: numpy-скаляры, NaN и NaT заменяем
+    columns = []
+    for _, series in df.items():
+        values = series.astype(object)
+        columns.append(values.where(series.notna(), None).tolist())
+    return list(zip(*columns))
+
+
+async def copy_df_to_table(df, table_name, unqkey=None, create_table=False, timeout=None):
+    """
+    Загружает DataFrame в таблицу бинарным COPY (copy_records_to_table).
+    unqkey - имя уникального ограничения. Если задано, строки сначала копируются
+    во временную таблицу, а затем переносятся INSERT ... ON CONFLICT ON CONSTRAINT unqkey DO NOTHING,
+    как это делает dict_to_sql_unqkey_async.
+    Возвращает количество добавленных строк.
+    """
+    if df is None or df.empty:
+        return 0
+
+    columns = [str(column) for column in df.columns]
+    records = _df_to_records(df)
+    schema_name, table = _split_table_name(table_name)
+
+    async with acquire_connection() as conn:
+        with track_query(f"COPY {table_name}") as timer:
+            timer.nbytes = int(df.memory_usage(index=False).sum())
+            async with conn.transaction():
+                if create_table:
+                    await conn.execute(create_table_sql(df, table_name))
+
+                if unqkey:
+                    # временная таблица только с нужными колонками и точными типами целевой таблицы
+                    stage = f"tmp_stage_{table}"
+                    quoted = _quoted_columns(columns)
+                    await conn.execute(
+                        f"CREATE TEMP TABLE {stage} ON COMMIT DROP AS SELECT {quoted} FROM {table_name} WITH NO DATA"
+                    )
+                    await conn.copy_records_to_table(stage, records=records, columns=columns, timeout=timeout)
+                    status = await conn.execute(
+                        f"INSERT INTO {table_name} ({quoted}) SELECT {quoted} FROM {stage} "
+                        f"ON CONFLICT ON CONSTRAINT {unqkey} DO NOTHING"
+                    )
+                    inserted = rows_from_status(status)  # "INSERT 0 <кол-во>"
+                else:
+                    await conn.copy_records_to_table(
+                        table, records=records, columns=columns, schema_name=schema_name, timeout=timeout
+                    )
+                    inserted = len(records)
+            timer.rows = inserted
+
+    query_cache.invalidate_table(table_name)
+    return inserted
+
+
+def copy_df_to_table_sync(df, table_name, unqkey=None, create_table=False):
+    """
+    Синхронная версия copy_df_to_table через psycopg2 copy_expert.
+    psycopg2 не умеет формировать бинарный поток COPY, поэтому данные передаются в формате CSV.
+    """
+    if df is None or df.empty:
+        return 0
 
-    return None
+    conn = con_postgres_psycopg2()
+    if not conn:
+        return 0
+
+    columns = [str(column) for column in df.columns]
+    quoted = _quoted_columns(columns)
+    buffer = io.StringIO()
+    df.to_csv(buffer, index=False, header=False, na_rep="\\N")
+    buffer.seek(0)
+
+    try:
+        with conn.cursor() as cursor:
+            if create_table:
+                cursor.execute(create_table_sql(df, table_name))
+
+            target = table_name
+            if unqkey:
+                target = f"tmp_stage_{_split_table_name(table_name)[1]}"
+                cursor.execute(
+                    f"CREATE TEMP TABLE {target} ON COMMIT DROP AS SELECT {quoted} FROM {table_name} WITH NO DATA"
+                )
+
+            cursor.copy_expert(f"COPY {target} ({quoted}) FROM STDIN WITH (FORMAT csv, NULL '\\N')", buffer)
+            rows = cursor.rowcount
+            if unqkey:
+                cursor.execute(
+                    f"INSERT INTO {table_name} ({quoted}) SELECT {quoted} FROM {target} "
+                    f"ON CONFLICT ON CONSTRAINT {unqkey} DO NOTHING"
+                )
+                rows = cursor.rowcount
+        conn.commit()
+        query_cache.invalidate_table(table_name)
+        return rows
+    except Exception as e:
+        conn.rollback()
+        sms = "ERROR:ConnectToBase:copy_df_to_table_sync: %s" % e
+        print(sms)
+        return 0
+    finally:
+        conn.close()
 
 
 async def df_to_sql(df, table_name):
-    loop = asyncio.get_event_loop()
-    func = partial(df.to_sql, table_name, engine, if_exists='append', index=False, method='multi')
-    await loop.run_in_executor(executor, func)
+    await copy_df_to_table(df, table_name, create_table=True)
 
 
 async def df_to_sql2(df, table_name, executor=None):
-    # for python >= 3.9
-    if executor:
-        loop = asyncio.get_event_loop()
-        func = partial(df.to_sql, table_name, engine, if_exists='append', index=False, method='multi')
-        await loop.run_in_executor(executor, func)
-    else:
-        await asyncio.to_thread(df.to_sql, table_name, engine, if_exists='append', index=False, method='multi')
+    # executor оставлен для совместимости: COPY выполняется асинхронно и поток не нужен
+    await copy_df_to_table(df, table_name, create_table=True)
 
 
 async def df_to_sql3(df, table_name, executor=None):
-    from functools import partial
-    loop = asyncio.get_event_loop()
-    func = partial(df.to_sql, table_name, engine, if_exists='append', index=False, method='multi')
-    await loop.run_in_executor(executor, func)
+    # executor оставлен для совместимости: COPY выполняется асинхронно и поток не нужен
+    await copy_df_to_table(df, table_name, create_table=True)
 
 
 async def sql_to_df(table_name):
-    df = pd.read_sql(f"SELECT * FROM {table_name}", engine)
+    df = pd.read_sql(f"SELECT * FROM {table_name}", get_engine())
     return df
 
 
-async def get_df(sql)->pd.DataFrame:
-    conn = await asyncpg.connect(**CONN_PARAMS)
-    try:
-        records = await conn.fetch(sql)
-        df = pd.DataFrame([dict(record) for record in records])
-        return df
-    finally:
-        await conn.close()
+async def get_df(sql, category_columns=None, cache_ttl=None)->"pd.DataFrame":
+    if cache_ttl:
+        return await cached_query("df", sql, (category_columns,), cache_ttl,
+                                  lambda: fetch_df(sql, category_columns=category_columns))
+    return await fetch_df(sql, category_columns=category_columns)
 
 
 async def clear_table(table_name):
@@ -147,33 +610,23 @@ async def create_model_async(fields_count):
     return tuple(model)
 
 
-async def sql_to_df_async(sql):
-    conn = await asyncpg.connect(user=USERNAME, password=PSW, database=BASENAME, host=HOSTNAME_PUBLIC, PORT=PORT)
-    try:
-        records = await conn.fetch(sql)
-        df = pd.DataFrame([dict(record) for record in records])
-        return df
-    finally:
-        await conn.close()
+async def sql_to_df_async(sql, category_columns=None):
+    return await fetch_df(sql, category_columns=category_columns)
 
 
 async def async_save_pg(sql, *args):
-    conn = None
     result = False
     try:
-        if not conn or conn.is_closed():
-            conn = await asyncpg.connect(**CONN_PARAMS, timeout=300)
-
-        tr = conn.transaction()
-        await tr.start()
-
-        if args:
-            await conn.executemany(sql, *args)
-        else:
-            await conn.execute(sql)
+        async with acquire_connection(timeout=300) as conn:
+            with track_query(sql) as timer:
+                async with conn.transaction():
+                    if args:
+                        await conn.executemany(sql, *args)
+                        timer.rows = len(args[0]) if hasattr(args[0], "__len__") else 0
+                    else:
+                        timer.rows = rows_from_status(await conn.execute(sql))
 
     except Exception as e:
-        # await tr.rollback()
         # sms = traceback.print_exc()
         print(sql)
         print(*args)
@@ -181,17 +634,10 @@ async def async_save_pg(sql, *args):
         raise
 
     else:
-        await tr.commit()
+        query_cache.invalidate_sql(sql)
         result = True
 
     finally:
-        if conn and not conn.is_closed():
-            try:
-                await conn.close(
-                    timeout=60
-                )  # Увеличиваем таймаут для закрытия соединения
-            except Exception as e:
-                print(f"Ошибка при закрытии соединения: {e}")
         return result
 
 
@@ -200,7 +646,7 @@ def con_postgres_psycopg2():
     conn = ''
     try:
         import psycopg2
-        conn = psycopg2.connect(**CONN_PARAMS)
+        conn = psycopg2.connect(**CONN_PARAMS, cursor_factory=psycopg2_cursor_factory())
     except Exception as e:
         sms = "ERROR:ConnectToBase:dfConPostgresPsycopg2: %s" % e
         print(sms)
@@ -218,6 +664,7 @@ def save_to_pg(sql, *args):
         else:
             cur.execute(sql)
         conn.commit()
+        query_cache.invalidate_sql(sql)
         return True
     except Exception as e:
         sms = "ERROR:ConnectToBase:save_to_pg: %s" % e
@@ -238,24 +685,60 @@ def get_json_from_url(url_list):
         return result
 
 
+# --- 5. Массовое получение JSON по списку url ---
+HTTP_CONCURRENCY = int(os.getenv("HTTP_CONCURRENCY", 10))  # одновременных запросов
+HTTP_TIMEOUT = float(os.getenv("HTTP_TIMEOUT", 60))  # таймаут на один url, сек
+
+
+async def fetch_json_bulk(urls, concurrency=HTTP_CONCURRENCY, timeout=HTTP_TIMEOUT, session=None):
+    """
+    Получает JSON по каждому url из списка. Соединения переиспользуются (keep-alive),
+    одновременно выполняется не более concurrency запросов.
+    Результаты возвращаются в порядке urls; при ошибке на месте результата None.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    request_timeout = aiohttp.ClientTimeout(total=timeout)
+
+    async def fetch(client, url):
+        async with semaphore:
+            try:
+                async with client.get(url, timeout=request_timeout) as response:
+                    response.raise_for_status()
+                    return await response.json(content_type=None)
+            except Exception as e:
+                print(f"Возникла ошибка при получении данных из url: {url}: {e}")
+                return None
+
+    if session is not None:
+        return await asyncio.gather(*(fetch(session, url) for url in urls))
+
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    async with aiohttp.ClientSession(connector=connector) as client:
+        return await asyncio.gather(*(fetch(client, url) for url in urls))
+
+
 def run_map_get_list(lists):
-    with ProcessPoolExecutor(max_workers=6) as executor:
-        result_list = list(executor.map(get_json_from_url, lists))
-        return result_list
+    return asyncio.run(fetch_json_bulk(lists))
 
 
 async def main_thread(urls_list):
     list_parent = []
-    responses = run_map_get_list(urls_list)
+    responses = await fetch_json_bulk(urls_list)
     for item in responses:
         list_child = []
-        for item2 in item:
+        for item2 in item or []:
             list_child = tuple(item2.values())
         list_parent.append(list_child)
 
     return list_parent
 
 
+@lru_cache(maxsize=256)
+def _placeholders(fields_count):
+    # "($1, $2, ..., $n)"
+    return "(" + ", ".join(f"${i + 1}" for i in range(fields_count)) + ")"
+
+
 async def dict_to_sql_unqkey_async(table_name, mydict, unqkey):
     # данные json переводит в sql insert формат с учетом уникальности данных
     # данные в базу НЕ заносит!!!
@@ -263,8 +746,7 @@ async def dict_to_sql_unqkey_async(table_name, mydict, unqkey):
     strsql = ''
     odata = list()
     try:
-        placeholders = await create_model_async(len(mydict))
-        placeholders = re.sub(r"'", "", str(placeholders))  # remove all quotes
+        placeholders = _placeholders(len(mydict))
         columns = ', '.join(mydict.keys())
         odata = list(mydict.values())
         strsql = f'''INSERT INTO {table_name} ({columns}) VALUES {placeholders}
@@ -278,3 +760,108 @@ async def dict_to_sql_unqkey_async(table_name, mydict, unqkey):
 
     finally:
         return strsql.lower(), odata
+
+
+# --- 6. Пакетная вставка с учетом уникальности ---
+UPSERT_CHUNK_SIZE = 1000
+PG_MAX_QUERY_ARGS = 32767  # ограничение протокола на количество параметров запроса
+
+# (таблица, колонки, ограничение[, строк в порции]) -> текст запроса.
+# Подготовленные выражения кэширует само соединение asyncpg (statement_cache_size пула)
+_upsert_sql_cache = {}
+
+
+async def _table_column_types(conn, table_name, columns):
+    rows = await conn.fetch(
+        "SELECT attname, format_type(atttypid, atttypmod) AS type_name "
+        "FROM pg_attribute WHERE attrelid = $1::regclass AND attnum > 0 AND NOT attisdropped",
+        table_name,
+    )
+    types = {row["attname"]: row["type_name"] for row in rows}
+    missing = [column for column in columns if column not in types]
+    if missing:
+        raise ValueError(f"В таблице {table_name} нет колонок: {missing}")
+    return [types[column] for column in columns]
+
+
+async def _get_upsert_sql(conn, table_name, columns, unqkey, method, rows_count):
+    if method == "unnest":
+        key = (table_name, columns, unqkey)
+    else:
+        key = (table_name, columns, unqkey, rows_count)
+
+    sql = _upsert_sql_cache.get(key)
+    if sql is None:
+        if method == "unnest":
+            # один и тот же текст для любой длины порции: каждая колонка передается массивом
+            types = await _table_column_types(conn, table_name, columns)
+            arrays = ", ".join(f"${i}::{type_name}[]" for i, type_name in enumerate(types, 1))
+            source = f"SELECT * FROM unnest({arrays})"
+        else:
+            width = len(columns)
+            source = "VALUES " + ", ".join(
+                "(" + ", ".join(f"${row * width + i + 1}" for i in range(width)) + ")" for row in range(rows_count)
+            )
+        sql = (f"INSERT INTO {table_name} ({', '.join(columns)}) {source} "
+               f"ON CONFLICT ON CONSTRAINT {unqkey} DO NOTHING")
+        _upsert_sql_cache[key] = sql
+    return sql
+
+
+def _rows_to_records(rows):
+    # список словарей с одинаковым набором ключей или DataFrame -> (колонки, список кортежей)
+    if isinstance(rows, pd.DataFrame):
+        return tuple(str(column).lower() for column in rows.columns), _df_to_records(rows)
+
+    rows = list(rows)
+    if not rows:
+        return (), []
+    keys = list(rows[0].keys())
+    key_set = set(keys)
+    records = []
+    for row in rows:
+        if row.keys() != key_set:
+            raise ValueError(f"Разный набор колонок в строках: {sorted(key_set)} и {sorted(row.keys())}")
+        records.append(tuple(row[key] for key in keys))
+    return tuple(key.lower() for key in keys), records
+
+
+async def upsert_rows_async(table_name, rows, unqkey, chunk_size=UPSERT_CHUNK_SIZE, method="unnest"):
+    """
+    Пакетный аналог dict_to_sql_unqkey_async + async_save_pg.
+    rows - список словарей с одинаковым набором ключей или DataFrame.
+    Строки вставляются порциями по chunk_size (один запрос на порцию) в одной транзакции
+    INSERT ... ON CONFLICT ON CONSTRAINT unqkey DO NOTHING.
+    method: "unnest" - колонки передаются массивами; "values" - многострочный VALUES.
+    Возвращает словарь {"inserted": добавлено, "skipped": пропущено как дубликаты}.
+    """
+    if method not in ("unnest", "values"):
+        raise ValueError(f"Неизвестный method: {method}")
+
+    columns, records = _rows_to_records(rows)
+    result = {"inserted": 0, "skipped": 0}
+    if not records:
+        return result
+
+    table_name = table_name.lower()
+    unqkey = unqkey.lower()
+    if method == "values":
+        chunk_size = max(1, min(chunk_size, PG_MAX_QUERY_ARGS // len(columns)))
+
+    async with acquire_connection() as conn:
+        async with conn.transaction():
+            for start in range(0, len(records), chunk_size):
+                chunk = records[start:start + chunk_size]
+                sql = await _get_upsert_sql(conn, table_name, columns, unqkey, method, len(chunk))
+                if method == "unnest":
+                    args = [list(values) for values in zip(*chunk)]
+                else:
+                    args = [value for record in chunk for value in record]
+                with track_query(sql) as timer:
+                    status = await conn.execute(sql, *args)
+                    inserted = timer.rows = rows_from_status(status)  # "INSERT 0 <кол-во>"
+                result["inserted"] += inserted
+                result["skipped"] += len(chunk) - inserted
+
+    query_cache.invalidate_table(table_name)
+    return result
@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+"""
+Сохранение файлов из Chrome без окна "Сохранить как".
+
+Загрузки разрешаются через CDP (Browser.setDownloadBehavior) в отдельную временную папку
+на каждый файл: файл, появившийся в ней, однозначно относится к текущему документу,
+его окончание определяется по исчезновению .crdownload и стабильному размеру, после чего
+он переименовывается в заданное имя. Страницу можно сохранить в PDF без диалога печати
+через Page.printToPDF. Работает и в headless режиме на Linux, поэтому документы можно
+сохранять параллельно в нескольких браузерах (у каждого своя папка загрузки).
+"""
+
+import base64
+import os
+import shutil
+import tempfile
+import weakref
+
+from selenium.common.exceptions import WebDriverException
+from selenium.webdriver.chrome.options import Options
+
+from BrowserWaits import wait_download_finished
+
+DOWNLOAD_TIMEOUT = float(os.getenv("BROWSER_DOWNLOAD_TIMEOUT", 60))  # сек
+
+# папка загрузки, заданная через set_download_dir, для каждого браузера - чтобы вернуть ее после download_via_click
+_download_dirs = weakref.WeakKeyDictionary()
+
+CHROME_ARGUMENTS = (
+    # Отключаем Google APIs и связанные сервисы для устранения ошибок API
+    "--disable-background-networking",
+    "--disable-background-timer-throttling",
+    "--disable-backgrounding-occluded-windows",
+    "--disable-breakpad",
+    "--disable-client-side-phishing-detection",
+    "--disable-component-extensions-with-background-pages",
+    "--disable-default-apps",
+    "--disable-dev-shm-usage",
+    "--disable-extensions",
+    "--disable-features=TranslateUI",
+    "--disable-hang-monitor",
+    "--disable-ipc-flooding-protection",
+    "--disable-popup-blocking",
+    "--disable-prompt-on-repost",
+    "--disable-renderer-backgrounding",
+    "--disable-sync",
+    "--disable-web-security",
+    "--no-default-browser-check",
+    "--no-first-run",
+    "--no-sandbox",
+    "--disable-gpu",
+    # Отключаем логирование для уменьшения количества сообщений
+    "--log-level=3",
+    "--silent",
+)
+
+
+def build_chrome_options(headless=False, download_dir=None):
+    """
+    Настройки Chrome для работы с кабинетом. headless=True - без окна (Linux, параллельные браузеры).
+    download_dir - папка загрузок по умолчанию; загрузки идут без вопроса о месте сохранения.
+    """
+    options = Options()
+    for argument in CHROME_ARGUMENTS:
+        options.add_argument(argument)
+    if headless:
+        options.add_argument("--headless=new")
+        options.add_argument("--window-size=1920,1080")
+
+    # Отключаем Google Cloud Messaging (GCM) для устранения PHONE_REGISTRATION_ERROR
+    options.add_experimental_option("excludeSwitches", ["enable-automation"])
+    options.add_experimental_option('useAutomationExtension', False)
+    # журнал сети нужен ScrapeWithLogs для поиска токена
+    options.set_capability("goog:loggingPrefs", {"performance": "ALL"})
+
+    # Отключаем уведомления и другие сервисы, сохраняем файлы без диалога
+    prefs = {
+        "profile.default_content_setting_values.notifications": 2,
+        "profile.default_content_settings.popups": 0,
+        "profile.managed_default_content_settings.images": 2,
+        "credentials_enable_service": False,
+        "profile.password_manager_enabled": False,
+        "download.prompt_for_download": False,
+        "download.directory_upgrade": True,
+        "plugins.always_open_pdf_externally": True,
+    }
+    if download_dir:
+        prefs["download.default_directory"] = os.path.abspath(download_dir)
+    options.add_experimental_option("prefs", prefs)
+    return options
+
+
+def _set_download_behavior(driver, params):
+    try:
+        driver.execute_cdp_cmd("Browser.setDownloadBehavior", params)
+    except WebDriverException:
+        # старые версии Chrome поддерживают только команду домена Page
+        driver.execute_cdp_cmd("Page.setDownloadBehavior", params)
+
+
+def set_download_dir(driver, directory):
+    """
+    Направляет загрузки браузера в directory без диалога (CDP).
+    directory=None - вернуть папку загрузок по умолчанию (download.default_directory из настроек).
+    """
+    if directory is None:
+        _download_dirs.pop(driver, None)
+        _set_download_behavior(driver, {"behavior": "default"})
+        return
+    _download_dirs[driver] = os.path.abspath(directory)
+    _set_download_behavior(driver, {"behavior": "allow", "downloadPath": _download_dirs[driver]})
+
+
+def download_via_click(driver, click, file_path, timeout=DOWNLOAD_TIMEOUT):
+    """
+    Выполняет click() (действие, которое начинает загрузку) и сохраняет загруженный файл как file_path.
+    Возвращает file_path или None, если загрузка не завершилась за timeout сек.
+    Загрузки одного браузера выполняются по очереди: папка загрузки общая для всех его вкладок.
+    """
+    target_dir = os.path.dirname(os.path.abspath(file_path))
+    os.makedirs(target_dir, exist_ok=True)
+    download_dir = tempfile.mkdtemp(prefix=".download-", dir=target_dir)
+    previous_dir = _download_dirs.get(driver)
+    try:
+        set_download_dir(driver, download_dir)
+        click()
+        downloaded = wait_download_finished(download_dir, timeout, stable_time=0.2, raise_on_timeout=False, poll=0.1)
+        if not downloaded:
+            unfinished = [name for name in os.listdir(download_dir) if not name.startswith(".")]
+            print(f"Файл {os.path.basename(file_path)} не загружен за {timeout} сек"
+                  + (f", незавершенная загрузка удалена: {', '.join(unfinished)}" if unfinished else ""))
+            return None
+        os.replace(downloaded, file_path)
+        return file_path
+    finally:
+        # браузер не должен продолжать загрузки во временную папку, которая сейчас будет удалена
+        try:
+            set_download_dir(driver, previous_dir)
+        except WebDriverException as e:
+            print(f"Не удалось вернуть папку загрузок браузера: {e}")
+        shutil.rmtree(download_dir, ignore_errors=True)
+
+
+def save_page_as_pdf(driver, file_path, **print_options):
+    """Сохраняет текущую страницу в PDF через Page.printToPDF (без диалога печати)."""
+    params = {"printBackground": True, "preferCSSPageSize": True}
+    params.update(print_options)
+    result = driver.execute_cdp_cmd("Page.printToPDF", params)
+    directory = os.path.dirname(os.path.abspath(file_path))
+    os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{file_path}.part"
+    with open(tmp_path, "wb") as f:
+        f.write(base64.b64decode(result["data"]))
+    os.replace(tmp_path, file_path)
+    return file_path
@@ -0,0 +1,224 @@
+# -*- coding: utf-8 -*-
+"""
+Пул браузеров без окна для параллельной работы с кабинетом.
+
+Вход выполняется один раз в обычном браузере, его состояние (cookies, localStorage, sessionStorage)
+снимается capture_auth_state и переносится в каждый браузер пула, поэтому повторная авторизация
+ключом не нужна. Задачи (страницы таблицы, списки документов) раздаются воркерам через очередь,
+каждый воркер - поток со своим Chrome. Браузер перезапускается после падения (задача повторяется),
+после max_tasks задач или при росте памяти процессов Chrome выше max_rss_mb.
+Результаты возвращаются в порядке входных задач.
+
+Пример:
+    state = capture_auth_state(driver)
+    pool = BrowserPool(workers=4, auth_state=state)
+    results = pool.map(read_pages, page_ranges(max_page, 4))
+"""
+
+import os
+import queue
+import threading
+import time
+from urllib.parse import urlparse
+
+import psutil
+from selenium import webdriver
+from selenium.common.exceptions import WebDriverException
+
+from BrowserDownloads import build_chrome_options
+
+POOL_WORKERS = int(os.getenv("BROWSER_POOL_WORKERS", os.cpu_count() or 2))
+POOL_MAX_TASKS = int(os.getenv("BROWSER_POOL_MAX_TASKS", 200))  # задач на один запуск браузера
+POOL_MAX_RSS_MB = int(os.getenv("BROWSER_POOL_MAX_RSS_MB", 1024))  # память браузера, после которой он перезапускается
+POOL_MAX_RETRIES = 2  # повторов задачи после падения браузера
+
+JS_READ_STORAGE = """
+const dump = storage => Object.fromEntries(Array.from({length: storage.length}, (_, i) => storage.key(i))
+    .map(key => [key, storage.getItem(key)]));
+return {local: dump(window.localStorage), session: dump(window.sessionStorage)};
+"""
+
+JS_WRITE_STORAGE = """
+const [local, session] = arguments;
+for (const [key, value] of Object.entries(local)) window.localStorage.setItem(key, value);
+for (const [key, value] of Object.entries(session)) window.sessionStorage.setItem(key, value);
+"""
+
+
+def capture_auth_state(driver):
+    """
+    Состояние авторизации открытого сайта: адрес, cookies, localStorage и sessionStorage.
+    Отдельно bearer-токен не переносится: страницы кабинета берут его из перенесенного storage.
+    """
+    url = urlparse(driver.current_url)
+    storage = driver.execute_script(JS_READ_STORAGE)
+    return {
+        "origin": f"{url.scheme}://{url.netloc}",
+        "cookies": driver.get_cookies(),
+        "local_storage": storage["local"],
+        "session_storage": storage["session"],
+    }
+
+
+def apply_auth_state(driver, state, landing_path="/favicon.ico"):
+    """
+    Переносит состояние авторизации в браузер. cookies и storage можно записать только
+    на странице того же сайта, поэтому сначала открывается легкая страница landing_path.
+    """
+    driver.get(state["origin"] + landing_path)
+    for cookie in state["cookies"]:
+        try:
+            driver.add_cookie(cookie)
+        except WebDriverException as e:
+            print(f"Cookie {cookie.get('name')} не перенесена: {e.msg}")
+    driver.execute_script(JS_WRITE_STORAGE, state["local_storage"], state["session_storage"])
+
+
+def page_ranges(max_page, parts):
+    """Страницы 1..max_page -> не более parts непрерывных диапазонов близкого размера."""
+    parts = max(1, min(parts, max_page))
+    size, extra = divmod(max_page, parts)
+    ranges = []
+    start = 1
+    for n in range(parts):
+        stop = start + size + (n < extra)
+        ranges.append(range(start, stop))
+        start = stop
+    return ranges
+
+
+def browser_rss_mb(driver):
+    """Память (RSS, МБ) chromedriver и всех процессов Chrome, запущенных им."""
+    try:
+        process = psutil.Process(driver.service.process.pid)
+        processes = [process] + process.children(recursive=True)
+    except (AttributeError, psutil.Error):
+        return 0.0
+    total = 0
+    for proc in processes:
+        try:
+            total += proc.memory_info().rss
+        except psutil.Error:
+            pass
+    return total / 1024 / 1024
+
+
+def default_driver_factory():
+    return webdriver.Chrome(options=build_chrome_options(headless=True))
+
+
+class BrowserPool:
+    def __init__(self, workers=POOL_WORKERS, auth_state=None, driver_factory=default_driver_factory,
+                 max_tasks=POOL_MAX_TASKS, max_rss_mb=POOL_MAX_RSS_MB, max_retries=POOL_MAX_RETRIES,
+                 landing_path="/favicon.ico"):
+        """
+        driver_factory() создает браузер; auth_state (capture_auth_state) переносится в каждый новый браузер.
+        Задача - функция func(driver, item); браузер перезапускается после max_tasks задач или при памяти
+        выше max_rss_mb, после падения браузера задача повторяется до max_retries раз.
+        """
+        self.workers = workers
+        self.auth_state = auth_state
+        self.driver_factory = driver_factory
+        self.max_tasks = max_tasks
+        self.max_rss_mb = max_rss_mb
+        self.max_retries = max_retries
+        self.landing_path = landing_path
+        self.stats = {"tasks": 0, "failed": 0, "retries": 0, "recycled": 0, "started": 0}
+        self.errors = {}
+        self._lock = threading.Lock()
+
+    def _count(self, name):
+        with self._lock:
+            self.stats[name] += 1
+
+    def _start_driver(self):
+        driver = self.driver_factory()
+        try:
+            if self.auth_state:
+                apply_auth_state(driver, self.auth_state, self.landing_path)
+        except Exception:
+            driver.quit()
+            raise
+        self._count("started")
+        return driver
+
+    @staticmethod
+    def _quit(driver):
+        if driver is not None:
+            try:
+                driver.quit()
+            except Exception:
+                pass
+
+    def _needs_recycle(self, driver, tasks_done):
+        if tasks_done >= self.max_tasks:
+            return True
+        return self.max_rss_mb and browser_rss_mb(driver) > self.max_rss_mb
+
+    def _worker(self, func, tasks, results, errors):
+        driver = None
+        tasks_done = 0
+        try:
+            while True:
+                try:
+                    index, item = tasks.get_nowait()
+                except queue.Empty:
+                    return
+                for attempt in range(self.max_retries + 1):
+                    try:
+                        if driver is None:
+                            driver = self._start_driver()
+                            tasks_done = 0
+                        results[index] = func(driver, item)
+                        self._count("tasks")
+                        break
+                    except WebDriverException as e:
+                        # браузер упал или сессия потеряна: перезапускаем и повторяем задачу
+                        self._quit(driver)
+                        driver = None
+                        if attempt == self.max_retries:
+                            errors[index] = e
+                            self._count("failed")
+                        else:
+                            self._count("retries")
+                    except Exception as e:
+                        errors[index] = e
+                        self._count("failed")
+                        break
+                tasks_done += 1
+                if driver is not None and self._needs_recycle(driver, tasks_done):
+                    self._quit(driver)
+                    driver = None
+                    self._count("recycled")
+        finally:
+            self._quit(driver)
+
+    def map(self, func, items):
+        """
+        Выполняет func(driver, item) для всех items в браузерах пула.
+        Возвращает результаты в порядке items (None для задач с ошибкой, ошибки - в self.errors).
+        """
+        items = list(items)
+        tasks = queue.Queue()
+        for index, item in enumerate(items):
+            tasks.put((index, item))
+        results = [None] * len(items)
+        self.errors = {}
+
+        start = time.perf_counter()
+        threads = [
+            threading.Thread(target=self._worker, args=(func, tasks, results, self.errors),
+                             name=f"browser-worker-{n}", daemon=True)
+            for n in range(min(self.workers, len(items)))
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        for index, error in sorted(self.errors.items()):
+            print(f"❌ Задача {items[index]!r}: {error!r}")
+        print(f"🧭 Браузеров: {len(threads)}, задач: {self.stats['tasks']}, ошибок: {self.stats['failed']}, "
+              f"повторов: {self.stats['retries']}, перезапусков: {self.stats['recycled']}, "
+              f"время: {time.perf_counter() - start:.2f} сек")
+        return results
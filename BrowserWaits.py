@@ -0,0 +1,235 @@
+# -*- coding: utf-8 -*-
+"""
+Ожидания по условию вместо фиксированных time.sleep для сценариев Selenium.
+
+Каждое ожидание ограничено таймаутом и записывает, сколько времени оно фактически
+ждало (get_wait_report), поэтому видно, где сценарий упирается в сайт.
+
+Сетевой простой определяется счетчиком незавершенных fetch/XHR, который ставится
+в страницу через CDP (Page.addScriptToEvaluateOnNewDocument) до скриптов сайта.
+Журнал performance (события Network.*) для этого не читается: его вычитывает
+ScrapeWithLogs при поиске токена, а чтение журнала опустошает буфер.
+"""
+
+import os
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+from selenium.common.exceptions import TimeoutException, WebDriverException
+from selenium.webdriver.support import expected_conditions as EC
+from selenium.webdriver.support.ui import WebDriverWait
+
+WAIT_TIMEOUT = float(os.getenv("BROWSER_WAIT_TIMEOUT", 10))  # сек
+POLL_INTERVAL = 0.05  # сек
+NETWORK_IDLE_TIME = 0.5  # сек без запросов, после которых сеть считается свободной
+
+_timings = defaultdict(lambda: {"count": 0, "timeouts": 0, "total": 0.0, "max": 0.0})
+
+# счетчик незавершенных запросов страницы
+JS_NETWORK_TRACKER = """
+(() => {
+    if (window.__pendingRequests !== undefined) return;
+    window.__pendingRequests = 0;
+    window.__lastRequestActivity = performance.now();
+    const started = () => { window.__pendingRequests++; window.__lastRequestActivity = performance.now(); };
+    const finished = () => {
+        window.__pendingRequests = Math.max(0, window.__pendingRequests - 1);
+        window.__lastRequestActivity = performance.now();
+    };
+    const originalFetch = window.fetch;
+    if (originalFetch) {
+        window.fetch = function () {
+            started();
+            return originalFetch.apply(this, arguments).finally(finished);
+        };
+    }
+    const originalSend = XMLHttpRequest.prototype.send;
+    XMLHttpRequest.prototype.send = function () {
+        started();
+        this.addEventListener('loadend', finished, {once: true});
+        return originalSend.apply(this, arguments);
+    };
+})();
+"""
+
+# мс с последней сетевой активности или null, если есть незавершенные запросы
+JS_NETWORK_QUIET_FOR = """
+if (document.readyState !== 'complete') return null;
+if (window.__pendingRequests === undefined) {
+    const resources = performance.getEntriesByType('resource');
+    const last = resources.length ? resources[resources.length - 1].responseEnd : 0;
+    return performance.now() - last;
+}
+if (window.__pendingRequests > 0) return null;
+return performance.now() - window.__lastRequestActivity;
+"""
+
+
+def _record(name, elapsed, timed_out):
+    timing = _timings[name]
+    timing["count"] += 1
+    timing["timeouts"] += timed_out
+    timing["total"] += elapsed
+    timing["max"] = max(timing["max"], elapsed)
+
+
+@contextmanager
+def timed_wait(name):
+    """Записывает длительность блока в отчет ожиданий под именем name."""
+    start = time.perf_counter()
+    timed_out = False
+    try:
+        yield
+    except TimeoutException:
+        timed_out = True
+        raise
+    finally:
+        _record(name, time.perf_counter() - start, timed_out)
+
+
+def wait_until(condition, timeout=WAIT_TIMEOUT, name="condition", poll=POLL_INTERVAL, raise_on_timeout=True,
+               ignored_exceptions=(WebDriverException,)):
+    """
+    Опрашивает condition() до истинного результата и возвращает его.
+    По таймауту - TimeoutException или None (raise_on_timeout=False).
+    """
+    start = time.perf_counter()
+    deadline = start + timeout
+    while True:
+        try:
+            value = condition()
+        except ignored_exceptions:
+            value = None
+        if value:
+            _record(name, time.perf_counter() - start, False)
+            return value
+        if time.perf_counter() >= deadline:
+            _record(name, time.perf_counter() - start, True)
+            if raise_on_timeout:
+                raise TimeoutException(f"{name}: условие не выполнено за {timeout} сек")
+            return None
+        time.sleep(poll)
+
+
+def _wait_condition(driver, condition, timeout, name, raise_on_timeout):
+    try:
+        with timed_wait(name):
+            return WebDriverWait(driver, timeout, poll_frequency=POLL_INTERVAL).until(condition)
+    except TimeoutException:
+        if raise_on_timeout:
+            raise
+        return None
+
+
+def wait_clickable(driver, locator, timeout=WAIT_TIMEOUT, raise_on_timeout=True):
+    return _wait_condition(driver, EC.element_to_be_clickable(locator), timeout, "clickable", raise_on_timeout)
+
+
+def wait_present(driver, locator, timeout=WAIT_TIMEOUT, raise_on_timeout=True):
+    return _wait_condition(driver, EC.presence_of_element_located(locator), timeout, "present", raise_on_timeout)
+
+
+def wait_invisible(driver, locator, timeout=WAIT_TIMEOUT, raise_on_timeout=True):
+    return _wait_condition(driver, EC.invisibility_of_element_located(locator), timeout, "invisible",
+                           raise_on_timeout)
+
+
+def wait_text_changed(driver, locator, old_text, timeout=WAIT_TIMEOUT, raise_on_timeout=True):
+    """Ждет, пока текст элемента станет отличным от old_text (например, номер страницы пагинатора)."""
+    def changed(drv):
+        text = drv.find_element(*locator).text
+        return text if text != old_text else False
+
+    return _wait_condition(driver, changed, timeout, "text_changed", raise_on_timeout)
+
+
+def wait_url_changed(driver, old_url, timeout=WAIT_TIMEOUT, raise_on_timeout=True):
+    return _wait_condition(driver, EC.url_changes(old_url), timeout, "url_changed", raise_on_timeout)
+
+
+def wait_url_is(driver, url, timeout=WAIT_TIMEOUT, raise_on_timeout=True):
+    return _wait_condition(driver, EC.url_to_be(url), timeout, "url_is", raise_on_timeout)
+
+
+def install_network_tracker(driver):
+    """
+    Ставит счетчик запросов во все следующие документы (CDP) и в текущий.
+    Для браузеров без CDP wait_network_idle использует Resource Timing API.
+    """
+    try:
+        driver.execute_cdp_cmd("Page.addScriptToEvaluateOnNewDocument", {"source": JS_NETWORK_TRACKER})
+    except (AttributeError, WebDriverException):
+        pass
+    try:
+        driver.execute_script(JS_NETWORK_TRACKER)
+    except WebDriverException:
+        pass
+
+
+def wait_network_idle(driver, idle_time=NETWORK_IDLE_TIME, timeout=WAIT_TIMEOUT, raise_on_timeout=False):
+    """Ждет, пока страница загружена и idle_time сек нет незавершенных и новых запросов."""
+    def idle():
+        quiet_for = driver.execute_script(JS_NETWORK_QUIET_FOR)
+        return quiet_for is not None and quiet_for >= idle_time * 1000
+
+    return wait_until(idle, timeout, "network_idle", raise_on_timeout=raise_on_timeout)
+
+
+def _download_candidate(path):
+    # path - ожидаемый файл или папка загрузки, в которой должен оказаться единственный файл
+    if os.path.isdir(path):
+        names = [name for name in os.listdir(path) if not name.startswith(".")]
+        if len(names) != 1 or names[0].endswith((".crdownload", ".tmp")):
+            return None
+        return os.path.join(path, names[0])
+    if os.path.exists(f"{path}.crdownload") or not os.path.exists(path):
+        return None
+    return path
+
+
+def wait_download_finished(path, timeout=30, stable_time=0.3, raise_on_timeout=True, poll=POLL_INTERVAL):
+    """
+    Ждет, пока файл появится, рядом не будет временного файла Chrome (.crdownload)
+    и размер перестанет меняться в течение stable_time сек. Возвращает путь к файлу.
+    path - имя файла или папка загрузки (тогда ждет единственный файл в ней, имя которого неизвестно).
+    """
+    state = {"path": None, "size": None, "since": None}
+
+    def finished():
+        file_path = _download_candidate(path)
+        if file_path is None:
+            return False
+        size = os.path.getsize(file_path)
+        now = time.perf_counter()
+        if (file_path, size) != (state["path"], state["size"]):
+            state["path"], state["size"], state["since"] = file_path, size, now
+            return False
+        return file_path if size > 0 and now - state["since"] >= stable_time else False
+
+    return wait_until(finished, timeout, "download_finished", poll=poll, raise_on_timeout=raise_on_timeout,
+                      ignored_exceptions=(OSError,))
+
+
+def get_wait_report():
+    """Статистика ожиданий: количество, таймауты, суммарное, среднее и максимальное время."""
+    return {
+        name: {
+            "count": timing["count"],
+            "timeouts": timing["timeouts"],
+            "total": round(timing["total"], 3),
+            "avg": round(timing["total"] / timing["count"], 3) if timing["count"] else 0.0,
+            "max": round(timing["max"], 3),
+        }
+        for name, timing in sorted(_timings.items(), key=lambda item: -item[1]["total"])
+    }
+
+
+def print_wait_report():
+    for name, timing in get_wait_report().items():
+        print(f"{name:<20} {timing['count']:6} раз  таймаутов {timing['timeouts']:4}  "
+              f"всего {timing['total']:8.2f} сек  среднее {timing['avg']:6.3f}  макс {timing['max']:6.3f}")
+
+
+def reset_wait_report():
+    _timings.clear()
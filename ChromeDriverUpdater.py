@@ -1,16 +1,69 @@
 # -*- coding: utf-8 -*-
 """
 Скрипт для автоматического обновления ChromeDriver до версии, соответствующей установленной версии Chrome.
+
+Результат проверки сохраняется в CHECK_CACHE_PATH (версии, пути, размеры и время изменения
+chrome и chromedriver). Пока файлы не менялись и запись не старше CHECK_TTL, проверка не запускает
+процессов и не ходит в сеть. Список версий Chrome for Testing кэшируется в MANIFEST_CACHE_PATH
+и обновляется условным запросом (ETag) не чаще MANIFEST_TTL.
 """
 
+import json
 import os
 import re
 import sys
+import time
 import zipfile
 import subprocess
 import requests
 from pathlib import Path
 
+CUR_DIR = os.path.dirname(os.path.abspath(__file__))
+CHECK_CACHE_PATH = os.getenv("CHROMEDRIVER_CHECK_CACHE", os.path.join(CUR_DIR, ".chromedriver_check.json"))
+CHECK_TTL = int(os.getenv("CHROMEDRIVER_CHECK_TTL", 7 * 24 * 3600))  # сек
+MANIFEST_URL = "https://googlechromelabs.github.io/chrome-for-testing/latest-versions-per-milestone-with-downloads.json"
+MANIFEST_CACHE_PATH = os.getenv("CHROMEDRIVER_MANIFEST_CACHE", os.path.join(CUR_DIR, ".chrome_for_testing.json"))
+MANIFEST_TTL = int(os.getenv("CHROMEDRIVER_MANIFEST_TTL", 24 * 3600))  # сек
+VERSION_PATTERN = re.compile(r"^\d+\.\d+\.\d+\.\d+$")
+
+def read_json(path):
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def write_json(path, data):
+    # через временный файл, чтобы прерванная запись не оставила испорченный кэш
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+def get_chrome_path():
+    """Путь к исполняемому файлу Chrome или None."""
+    if sys.platform == 'win32':
+        for chrome_path in (r'C:\Program Files\Google\Chrome\Application\chrome.exe',
+                            r'C:\Program Files (x86)\Google\Chrome\Application\chrome.exe'):
+            if os.path.exists(chrome_path):
+                return chrome_path
+        return None
+    if sys.platform == 'darwin':
+        return '/Applications/Google Chrome.app/Contents/MacOS/Google Chrome'
+    import shutil
+    return shutil.which('google-chrome')
+
+def file_fingerprint(path):
+    """(размер, время изменения) файла или None - по ним видно, что файл обновлялся."""
+    try:
+        stat = os.stat(path)
+    except (OSError, TypeError):
+        return None
+    return [stat.st_size, stat.st_mtime_ns]
+
+def get_platform():
+    return 'win64' if sys.platform == 'win32' else 'linux64' if sys.platform.startswith('linux') else 'mac-arm64' if sys.platform == 'darwin' and os.uname().machine == 'arm64' else 'mac-x64'
+
 def get_chrome_version():
     """
     Получает версию Chrome, установленную на компьютере.
@@ -19,12 +72,14 @@ def get_chrome_version():
     try:
         # Для Windows
         if sys.platform == 'win32':
-            # Путь к Chrome по умолчанию
-            chrome_path = r'C:\Program Files\Google\Chrome\Application\chrome.exe'
-            if not os.path.exists(chrome_path):
-                # Альтернативный путь
-                chrome_path = r'C:\Program Files (x86)\Google\Chrome\Application\chrome.exe'
-            
+            chrome_path = get_chrome_path() or r'C:\Program Files\Google\Chrome\Application\chrome.exe'
+
+            # Рядом с chrome.exe лежит папка с именем версии - это быстрее, чем запуск wmic
+            versions = [name for name in os.listdir(os.path.dirname(chrome_path)) if VERSION_PATTERN.match(name)] \
+                if os.path.exists(chrome_path) else []
+            if versions:
+                return max(versions, key=lambda version: [int(part) for part in version.split('.')])
+
             # Получаем версию Chrome с помощью команды wmic
             chrome_path_escaped = chrome_path.replace("\\", "\\\\")
             command = 'wmic datafile where name="' + chrome_path_escaped + '" get Version /value'
@@ -54,6 +109,83 @@ def get_chrome_version():
     
     return None
 
+def load_manifest():
+    """
+    Список последних версий Chrome for Testing по основным версиям.
+    Берется из кэша, если он моложе MANIFEST_TTL, иначе запрашивается с If-None-Match (ответ 304 - кэш актуален).
+    """
+    cached = read_json(MANIFEST_CACHE_PATH)
+    if cached and time.time() - cached.get("fetched_at", 0) < MANIFEST_TTL:
+        return cached["data"]
+
+    headers = {"If-None-Match": cached["etag"]} if cached and cached.get("etag") else {}
+    try:
+        response = requests.get(MANIFEST_URL, headers=headers, timeout=30)
+        if response.status_code == 304 and cached:
+            data = cached["data"]
+        else:
+            response.raise_for_status()
+            data = response.json()
+    except (requests.RequestException, ValueError) as e:
+        if cached:
+            print(f"Список версий ChromeDriver не обновлен, используется кэш: {e}")
+            return cached["data"]
+        raise
+
+    write_json(MANIFEST_CACHE_PATH, {"etag": response.headers.get("ETag"), "fetched_at": time.time(), "data": data})
+    return data
+
+def find_chromedriver_download(manifest, major_version, platform):
+    """{'version', 'url'} ChromeDriver для основной версии Chrome и платформы или None."""
+    milestone = manifest.get("milestones", {}).get(str(major_version))
+    if not milestone:
+        return None
+    for download in milestone.get("downloads", {}).get("chromedriver", []):
+        if download["platform"] == platform:
+            return {"version": milestone["version"], "url": download["url"]}
+    return None
+
+def get_chromedriver_version(chromedriver_path):
+    output = subprocess.check_output([chromedriver_path, "--version"]).decode('utf-8')
+    match = re.search(r'ChromeDriver\s+(\d+\.\d+\.\d+\.\d+)', output)
+    return match.group(1) if match else None
+
+def check_record_is_fresh(record, chrome_path, chromedriver_path):
+    """Запись прошлой проверки действительна: файлы chrome и chromedriver не менялись и срок не истек."""
+    return bool(
+        record
+        and record.get("compatible")
+        and time.time() - record.get("checked_at", 0) < CHECK_TTL
+        and record.get("chrome_path") == chrome_path
+        and record.get("chromedriver_path") == chromedriver_path
+        and record.get("chrome_fingerprint") == file_fingerprint(chrome_path)
+        and record.get("chromedriver_fingerprint") is not None
+        and record.get("chromedriver_fingerprint") == file_fingerprint(chromedriver_path)
+    )
+
+def save_check_record(chrome_path, chrome_version, chromedriver_path, chromedriver_version):
+    try:
+        write_json(CHECK_CACHE_PATH, {
+            "compatible": True,
+            "checked_at": time.time(),
+            "chrome_path": chrome_path,
+            "chrome_version": chrome_version,
+            "chrome_fingerprint": file_fingerprint(chrome_path),
+            "chromedriver_path": chromedriver_path,
+            "chromedriver_version": chromedriver_version,
+            "chromedriver_fingerprint": file_fingerprint(chromedriver_path),
+        })
+    except OSError as e:
+        print(f"Не удалось сохранить результат проверки ChromeDriver: {e}")
+
+def install_chromedriver(chrome_version, chrome_path, chromedriver_dir, chromedriver_path):
+    """Скачивает и распаковывает ChromeDriver, при успехе запоминает результат проверки."""
+    zip_path = download_chromedriver(chrome_version)
+    if not zip_path or not extract_chromedriver(zip_path, chromedriver_dir):
+        return False
+    save_check_record(chrome_path, chrome_version, chromedriver_path, get_chromedriver_version(chromedriver_path))
+    return True
+
 def get_major_version(version):
     """
     Извлекает основную версию из полной версии.
@@ -79,37 +211,14 @@ def download_chromedriver(chrome_version):
         
         # Для Chrome 115+ используем Chrome for Testing
         if int(major_version) >= 115:
-            # Получаем список доступных версий ChromeDriver
-            response = requests.get('https://googlechromelabs.github.io/chrome-for-testing/known-good-versions-with-downloads.json')
-            versions_data = response.json()
-            
-            # Находим подходящую версию для нашей основной версии Chrome
-            matching_versions = []
-            for version_info in versions_data['versions']:
-                if version_info['version'].startswith(f"{major_version}."):
-                    matching_versions.append(version_info)
-            
-            if not matching_versions:
-                print(f"Не найдены подходящие версии ChromeDriver для Chrome {major_version}")
+            # Находим в списке версий (кэш на диске) только запись для нашей версии Chrome и платформы
+            platform = get_platform()
+            latest_version = find_chromedriver_download(load_manifest(), major_version, platform)
+            if not latest_version:
+                print(f"Не найден ChromeDriver для Chrome {major_version} и платформы {platform}")
                 return None
-            
-            # Берем последнюю подходящую версию
-            latest_version = matching_versions[-1]
-            
-            # Определяем платформу
-            platform = 'win64' if sys.platform == 'win32' else 'linux64' if sys.platform.startswith('linux') else 'mac-arm64' if sys.platform == 'darwin' and os.uname().machine == 'arm64' else 'mac-x64'
-            
-            # Находим URL для скачивания ChromeDriver
-            download_url = None
-            for download in latest_version['downloads'].get('chromedriver', []):
-                if download['platform'] == platform:
-                    download_url = download['url']
-                    break
-            
-            if not download_url:
-                print(f"Не найден URL для скачивания ChromeDriver для платформы {platform}")
-                return None
-            
+            download_url = latest_version['url']
+
             # Скачиваем ChromeDriver
             print(f"Скачиваем ChromeDriver версии {latest_version['version']} для Chrome {major_version}...")
             zip_path = os.path.join(os.getcwd(), "chromedriver-temp.zip")
@@ -181,23 +290,27 @@ def extract_chromedriver(zip_path, target_dir):
         print(f"Ошибка при распаковке ChromeDriver: {e}")
         return False
 
-def update_chromedriver_if_needed():
+def update_chromedriver_if_needed(force=False):
     """
     Проверяет соответствие версий Chrome и ChromeDriver.
     Если версии не соответствуют, скачивает и устанавливает подходящий ChromeDriver.
+    Если с прошлой успешной проверки chrome и chromedriver не менялись, сразу возвращает True
+    (force=True - проверить заново).
     
     Returns:
         True, если ChromeDriver соответствует версии Chrome или был успешно обновлен.
         False в случае ошибки.
     """
     try:
-        # Получаем текущую директорию скрипта
-        cur_dir = os.path.dirname(os.path.abspath(__file__))
-        
         # Путь к ChromeDriver
-        chromedriver_dir = os.path.join(Path(cur_dir).parent.__str__(), "chromedriver-win64")
+        chromedriver_dir = os.path.join(Path(CUR_DIR).parent.__str__(), "chromedriver-win64")
         chromedriver_path = os.path.join(chromedriver_dir, "chromedriver.exe")
-        
+
+        # Без запуска процессов и запросов, если ничего не менялось
+        chrome_path = get_chrome_path()
+        if not force and check_record_is_fresh(read_json(CHECK_CACHE_PATH), chrome_path, chromedriver_path):
+            return True
+
         # Получаем версию Chrome
         chrome_version = get_chrome_version()
         if not chrome_version:
@@ -210,17 +323,12 @@ def update_chromedriver_if_needed():
         if not os.path.exists(chromedriver_path):
             print(f"ChromeDriver не найден по пути {chromedriver_path}")
             # Скачиваем и устанавливаем ChromeDriver
-            zip_path = download_chromedriver(chrome_version)
-            if zip_path:
-                return extract_chromedriver(zip_path, chromedriver_dir)
-            return False
+            return install_chromedriver(chrome_version, chrome_path, chromedriver_dir, chromedriver_path)
         
         # Проверяем версию ChromeDriver
         try:
-            output = subprocess.check_output([chromedriver_path, "--version"]).decode('utf-8')
-            match = re.search(r'ChromeDriver\s+(\d+\.\d+\.\d+\.\d+)', output)
-            if match:
-                chromedriver_version = match.group(1)
+            chromedriver_version = get_chromedriver_version(chromedriver_path)
+            if chromedriver_version:
                 print(f"Обнаружена версия ChromeDriver: {chromedriver_version}")
                 
                 # Проверяем соответствие основных версий
@@ -229,19 +337,16 @@ def update_chromedriver_if_needed():
                 
                 if chrome_major == chromedriver_major:
                     print("Версии Chrome и ChromeDriver совпадают")
+                    save_check_record(chrome_path, chrome_version, chromedriver_path, chromedriver_version)
                     return True
                 else:
                     print(f"Версии не совпадают: Chrome {chrome_major}, ChromeDriver {chromedriver_major}")
                     # Скачиваем и устанавливаем подходящий ChromeDriver
-                    zip_path = download_chromedriver(chrome_version)
-                    if zip_path:
-                        return extract_chromedriver(zip_path, chromedriver_dir)
+                    return install_chromedriver(chrome_version, chrome_path, chromedriver_dir, chromedriver_path)
         except Exception as e:
             print(f"Ошибка при проверке версии ChromeDriver: {e}")
             # Скачиваем и устанавливаем ChromeDriver
-            zip_path = download_chromedriver(chrome_version)
-            if zip_path:
-                return extract_chromedriver(zip_path, chromedriver_dir)
+            return install_chromedriver(chrome_version, chrome_path, chromedriver_dir, chromedriver_path)
         
         return False
     
@@ -250,4 +355,4 @@ def update_chromedriver_if_needed():
         return False
 
 if __name__ == "__main__":
-    update_chromedriver_if_needed()
+    update_chromedriver_if_needed(force="--force" in sys.argv)
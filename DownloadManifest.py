@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+"""
+Манифест загруженных файлов (SQLite).
+
+Для каждого ключа загрузки (например, code, impdate, kvt_number) хранится путь к файлу,
+размер, sha256 и время загрузки. Повторный запуск пропускает файлы, запись о которых
+совпадает с файлом на диске: по умолчанию сверяются путь и размер, в режиме verify -
+еще и хэш содержимого.
+"""
+
+import hashlib
+import os
+import sqlite3
+import threading
+from datetime import datetime
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def file_sha256(file_path):
+    hasher = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+class DownloadManifest:
+    def __init__(self, db_path, commit_every=100):
+        """
+        db_path - файл SQLite. commit_every - сколько записей накапливать до фиксации.
+        Все записи читаются в память при открытии; запись идет через одно соединение.
+        """
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.commit_every = commit_every
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS manifest (
+                key TEXT PRIMARY KEY,
+                file_path TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                sha256 TEXT NOT NULL,
+                downloaded_at TEXT NOT NULL
+            )
+            """
+        )
+        self._entries = {
+            key: (file_path, size, sha256)
+            for key, file_path, size, sha256 in self._conn.execute(
+                "SELECT key, file_path, size, sha256 FROM manifest"
+            )
+        }
+        self._pending = 0
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    @staticmethod
+    def make_key(*parts):
+        return "|".join(str(part) for part in parts)
+
+    def is_fresh(self, key, file_path, verify=False):
+        """True, если файл уже загружен и не изменился (можно не скачивать)."""
+        entry = self._entries.get(key)
+        if entry is None or entry[0] != file_path:
+            return False
+        try:
+            if os.path.getsize(file_path) != entry[1]:
+                return False
+        except OSError:
+            return False
+        return not verify or file_sha256(file_path) == entry[2]
+
+    def check_fresh(self, targets, verify=False):
+        """is_fresh для списка (key, file_path) - чтобы проверить порцию целей одним вызовом в потоке."""
+        return [self.is_fresh(key, file_path, verify) for key, file_path in targets]
+
+    def record(self, key, file_path, size, sha256):
+        with self._lock:
+            self._entries[key] = (file_path, size, sha256)
+            self._conn.execute(
+                "INSERT OR REPLACE INTO manifest (key, file_path, size, sha256, downloaded_at) VALUES (?, ?, ?, ?, ?)",
+                (key, file_path, size, sha256, datetime.now().isoformat(timespec="seconds")),
+            )
+            self._pending += 1
+            if self._pending >= self.commit_every:
+                self._conn.commit()
+                self._pending = 0
+
+    def close(self):
+        with self._lock:
+            self._conn.commit()
+            self._conn.close()
+
+    def __len__(self):
+        return len(self._entries)
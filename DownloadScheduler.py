@@ -0,0 +1,267 @@
+# -*- coding: utf-8 -*-
+"""
+Планировщик асинхронных загрузок.
+
+Задания ставятся в ограниченную очередь (submit ждет, если она заполнена) и выполняются
+фиксированным набором исполнителей. Одновременно выполняется не больше текущего лимита
+заданий: лимит растет на единицу за "окно" успешных ответов и уменьшается вдвое
+при 429/5xx/таймаутах (AIMD). Дополнительно запросы к одному хосту ограничены по частоте
+(token bucket), а Retry-After из ответа приостанавливает все запросы к хосту.
+
+Пример:
+    async with DownloadScheduler() as scheduler:
+        for url in urls:
+            await scheduler.submit(partial(download, session, url), host="cabinet.tax.gov.ua")
+"""
+
+import asyncio
+import os
+import random
+import time
+from email.utils import parsedate_to_datetime
+
+DOWNLOAD_MAX_CONCURRENCY = int(os.getenv("DOWNLOAD_MAX_CONCURRENCY", 20))
+DOWNLOAD_INITIAL_CONCURRENCY = int(os.getenv("DOWNLOAD_INITIAL_CONCURRENCY", 4))
+DOWNLOAD_RATE_PER_HOST = float(os.getenv("DOWNLOAD_RATE_PER_HOST", 10))  # запросов в сек, 0 - без ограничения
+DOWNLOAD_MAX_RETRIES = int(os.getenv("DOWNLOAD_MAX_RETRIES", 5))
+DOWNLOAD_QUEUE_SIZE = int(os.getenv("DOWNLOAD_QUEUE_SIZE", 1000))
+DOWNLOAD_REPORT_INTERVAL = float(os.getenv("DOWNLOAD_REPORT_INTERVAL", 10))  # сек
+MAX_RETRY_AFTER = 300  # сек, больше не ждем даже если сервер просит
+
+_STOP = object()
+
+
+class TransientError(Exception):
+    """Временная ошибка (429, 5xx, таймаут, обрыв соединения): задание стоит повторить."""
+
+    def __init__(self, message, status=None, retry_after=None):
+        super().__init__(message)
+        self.status = status
+        self.retry_after = retry_after
+
+
+def parse_retry_after(value):
+    """Значение заголовка Retry-After (секунды или HTTP дата) -> секунды ожидания или None."""
+    if not value:
+        return None
+    try:
+        seconds = float(value)
+    except ValueError:
+        try:
+            seconds = parsedate_to_datetime(value).timestamp() - time.time()
+        except (TypeError, ValueError):
+            return None
+    return min(max(seconds, 0.0), MAX_RETRY_AFTER)
+
+
+def is_transient_status(status):
+    return status == 429 or status >= 500
+
+
+class AdaptiveConcurrency:
+    """Лимит одновременных заданий, который подстраивается под ответы сервера (AIMD)."""
+
+    def __init__(self, initial, minimum=1, maximum=DOWNLOAD_MAX_CONCURRENCY, decrease_factor=0.5, cooldown=1.0):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.limit = float(min(max(initial, minimum), maximum))
+        self.decrease_factor = decrease_factor
+        self.cooldown = cooldown  # сек: одна волна ошибок уменьшает лимит один раз
+        self.in_flight = 0
+        self._last_decrease = 0.0
+        self._condition = asyncio.Condition()
+
+    async def acquire(self):
+        async with self._condition:
+            await self._condition.wait_for(lambda: self.in_flight < int(self.limit))
+            self.in_flight += 1
+
+    async def release(self, overloaded=False, succeeded=False):
+        async with self._condition:
+            self.in_flight -= 1
+            if overloaded:
+                now = time.monotonic()
+                if now - self._last_decrease >= self.cooldown:
+                    self.limit = max(self.minimum, self.limit * self.decrease_factor)
+                    self._last_decrease = now
+            elif succeeded:
+                # +1 за каждые limit успешных заданий
+                self.limit = min(self.maximum, self.limit + 1 / self.limit)
+            self._condition.notify_all()
+
+
+class HostRateLimiter:
+    """Token bucket на каждый хост: не больше rate запросов в секунду, всплеск до burst."""
+
+    def __init__(self, rate=DOWNLOAD_RATE_PER_HOST, burst=None):
+        self.rate = rate
+        self.burst = burst or max(1.0, rate)
+        self._buckets = {}  # хост -> [токены, время обновления, пауза до]
+
+    async def acquire(self, host):
+        if self.rate <= 0:
+            return
+        while True:
+            now = time.monotonic()
+            bucket = self._buckets.setdefault(host, [self.burst, now, 0.0])
+            bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+            wait = bucket[2] - now
+            if wait <= 0:
+                if bucket[0] >= 1:
+                    bucket[0] -= 1
+                    return
+                wait = (1 - bucket[0]) / self.rate
+            await asyncio.sleep(wait)
+
+    def pause(self, host, seconds):
+        """Приостанавливает запросы к хосту (Retry-After)."""
+        now = time.monotonic()
+        bucket = self._buckets.setdefault(host, [self.burst, now, 0.0])
+        bucket[2] = max(bucket[2], now + seconds)
+
+
+class DownloadScheduler:
+    def __init__(self, max_concurrency=DOWNLOAD_MAX_CONCURRENCY, initial_concurrency=DOWNLOAD_INITIAL_CONCURRENCY,
+                 min_concurrency=1, rate_per_host=DOWNLOAD_RATE_PER_HOST, max_retries=DOWNLOAD_MAX_RETRIES,
+                 retry_delay=1.0, queue_size=DOWNLOAD_QUEUE_SIZE, report_interval=DOWNLOAD_REPORT_INTERVAL,
+                 on_done=None, on_error=None):
+        """
+        max_concurrency - жесткий предел одновременных заданий (и количество исполнителей).
+        initial_concurrency, min_concurrency - начальный и минимальный адаптивный лимит.
+        rate_per_host - запросов в секунду к одному хосту.
+        on_done(key, result), on_error(key, error) - вызываются по завершении задания.
+        """
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self.report_interval = report_interval
+        self.on_done = on_done
+        self.on_error = on_error
+        self.concurrency = AdaptiveConcurrency(initial_concurrency, min_concurrency, max_concurrency)
+        self.rate_limiter = HostRateLimiter(rate_per_host)
+        self._queue = asyncio.Queue(maxsize=queue_size)
+        self._workers = []
+        self._reporter = None
+        self._closed = False
+        self._started_at = None
+        self.stats = {"submitted": 0, "completed": 0, "failed": 0, "retries": 0}
+
+    async def __aenter__(self):
+        self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            await self.close()
+        else:
+            await self.cancel()
+
+    def start(self):
+        if not self._workers:
+            self._started_at = time.monotonic()
+            self._workers = [asyncio.create_task(self._worker()) for _ in range(self.max_concurrency)]
+            if self.report_interval:
+                self._reporter = asyncio.create_task(self._report_periodically())
+        return self
+
+    async def submit(self, factory, host="default", key=None):
+        """
+        Ставит задание в очередь. factory() должна возвращать новую корутину при каждом вызове
+        (задание может повторяться). Ждет, если очередь заполнена.
+        """
+        if self._closed:
+            raise RuntimeError("DownloadScheduler уже закрыт")
+        self.start()
+        await self._queue.put((factory, host, key))
+        self.stats["submitted"] += 1
+
+    async def close(self):
+        """Дожидается выполнения всех заданий и останавливает исполнителей."""
+        if self._closed:
+            return
+        self._closed = True
+        for _ in self._workers:
+            await self._queue.put(_STOP)
+        await asyncio.gather(*self._workers)
+        await self._stop_reporter()
+        self.report()
+
+    async def cancel(self):
+        self._closed = True
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        await self._stop_reporter()
+
+    async def _stop_reporter(self):
+        if self._reporter is not None:
+            self._reporter.cancel()
+            await asyncio.gather(self._reporter, return_exceptions=True)
+            self._reporter = None
+
+    async def _worker(self):
+        while True:
+            item = await self._queue.get()
+            try:
+                if item is _STOP:
+                    return
+                await self._execute(*item)
+            finally:
+                self._queue.task_done()
+
+    async def _execute(self, factory, host, key):
+        for attempt in range(self.max_retries + 1):
+            await self.concurrency.acquire()
+            overloaded = succeeded = False
+            try:
+                await self.rate_limiter.acquire(host)
+                result = await factory()
+                succeeded = True
+            except (TransientError, asyncio.TimeoutError) as e:
+                overloaded = True
+                error = e
+            except Exception as e:
+                self._failed(key, e)
+                return
+            finally:
+                await self.concurrency.release(overloaded, succeeded)
+
+            if succeeded:
+                self.stats["completed"] += 1
+                if self.on_done is not None:
+                    self.on_done(key, result)
+                return
+
+            if attempt == self.max_retries:
+                self._failed(key, error)
+                return
+            self.stats["retries"] += 1
+            retry_after = getattr(error, "retry_after", None)
+            if retry_after is not None:
+                self.rate_limiter.pause(host, retry_after)
+                delay = retry_after
+            else:
+                delay = self.retry_delay * 2 ** attempt * (1 + random.random() / 10)
+            await asyncio.sleep(delay)
+
+    def _failed(self, key, error):
+        self.stats["failed"] += 1
+        if self.on_error is not None:
+            self.on_error(key, error)
+        else:
+            print(f"🔥 Ошибка задания {key if key is not None else ''}: {error}")
+
+    async def _report_periodically(self):
+        while True:
+            await asyncio.sleep(self.report_interval)
+            self.report()
+
+    def report(self):
+        elapsed = time.monotonic() - self._started_at if self._started_at else 0.0
+        done = self.stats["completed"] + self.stats["failed"]
+        remaining = self.stats["submitted"] - done
+        throughput = done / elapsed if elapsed else 0.0
+        print(f"📊 Выполнено: {self.stats['completed']}, ошибок: {self.stats['failed']}, "
+              f"осталось: {remaining}, повторов: {self.stats['retries']}, "
+              f"{throughput:.1f} заданий/сек, лимит: {int(self.concurrency.limit)}")
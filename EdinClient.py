@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+"""
+Асинхронный клиент API EDIN (aiohttp) для pdf_downloader_edin.
+
+Все запросы клиента проходят через общий семафор (не больше concurrency одновременно).
+Ответы 429/5xx, таймауты и обрывы соединения повторяются до max_retries раз с паузой
+из Retry-After или экспоненциальной паузой.
+
+Пример:
+    async with EdinClient() as client:
+        if await client.get_sid(login, password):
+            documents = await client.get_documents(direction, "2025-01-01", "2025-01-31")
+"""
+
+import asyncio
+import datetime
+import logging
+import os
+import random
+
+from DownloadScheduler import TransientError, is_transient_status, parse_retry_after
+from LazyImport import lazy_import
+
+aiohttp = lazy_import("aiohttp")
+
+AUTH_URL = "https://edo-v2.edin.ua/api/authorization/hash"
+SEARCH_URL = "https://edo-v2.edin.ua/api/eds/docs/search"
+DOWNLOAD_URL_TEMPLATE = "https://edo-v2.edin.ua/api/eds/doc/download"
+RETAILERS_URL = "https://edo-v2.edin.ua/api/oas/allretailers"
+IDENTIFIERS_URL = "https://edo-v2.edin.ua/api/oas/identifiers"
+
+EDIN_CONCURRENCY = int(os.getenv("EDIN_CONCURRENCY", 16))  # одновременных запросов к EDIN
+EDIN_MAX_RETRIES = int(os.getenv("EDIN_MAX_RETRIES", 4))
+EDIN_TIMEOUT = float(os.getenv("EDIN_TIMEOUT", 120))  # сек на запрос
+
+
+class EdinClient:
+    def __init__(self, sender_gln=None, concurrency=EDIN_CONCURRENCY, max_retries=EDIN_MAX_RETRIES,
+                 timeout=EDIN_TIMEOUT, retry_delay=1.0):
+        self.sender_gln = sender_gln or os.getenv("EDI_GLN")
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        self.headers = {}
+        self._limit = asyncio.Semaphore(concurrency)
+        self._session = None
+
+    async def __aenter__(self):
+        self._session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=0))
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self._session.close()
+
+    async def _request_once(self, method, url, read, **kwargs):
+        async with self._limit:
+            try:
+                async with self._session.request(method, url, headers=self.headers, timeout=self.timeout,
+                                                 **kwargs) as response:
+                    if is_transient_status(response.status):
+                        raise TransientError(f"Ошибка {response.status}: {url}", response.status,
+                                             parse_retry_after(response.headers.get("Retry-After")))
+                    response.raise_for_status()
+                    if read == "json":
+                        return await response.json(content_type=None)
+                    return await response.read()
+            except (aiohttp.ClientConnectionError, aiohttp.ClientPayloadError, asyncio.TimeoutError) as e:
+                raise TransientError(f"Ошибка сети: {url}: {e!r}") from e
+
+    async def _request(self, method, url, read="json", **kwargs):
+        """Ответ запроса (JSON или байты) с повторами временных ошибок."""
+        for attempt in range(self.max_retries + 1):
+            try:
+                return await self._request_once(method, url, read, **kwargs)
+            except TransientError as e:
+                if attempt == self.max_retries:
+                    raise
+                delay = e.retry_after if e.retry_after is not None else \
+                    self.retry_delay * 2 ** attempt * random.uniform(0.5, 1.5)
+                logging.warning(f"{e}. Повтор через {delay:.1f} сек")
+                await asyncio.sleep(delay)
+
+    async def get_sid(self, login, password):
+        logging.info("Шаг 1: Получение SID...")
+        try:
+            data = await self._request("POST", AUTH_URL, data={'email': login, 'password': password})
+            sid = data.get('SID')
+            if not sid:
+                raise ValueError("SID не найден в ответе сервера. Проверьте учетные данные.")
+            logging.info("SID успешно получен.")
+            self.headers['Authorization'] = sid
+            return sid
+        except Exception as e:
+            logging.error(f"Критическая ошибка при авторизации: {e}")
+            return None
+
+    async def get_documents(self, direction_payload, start_date, end_date):
+        try:
+            start_ts = int(datetime.datetime.strptime(start_date, '%Y-%m-%d').timestamp())
+            end_ts = int(datetime.datetime.strptime(end_date, '%Y-%m-%d').replace(hour=23, minute=59, second=59).timestamp())
+        except ValueError:
+            logging.error("Формат даты неверный. Используйте 'YYYY-MM-DD'.")
+            return None
+        search_payload = {
+            "statuses": [], "type": [], "limit": {"offset": "0", "count": "1000000"},
+            "exchangeStatus": [], "extraParams": [], "tags": [], "loadTags": True,
+            "multiExtraParams": [], "archive": False, "direction": direction_payload,
+            "docDate": {"startTimestamp": start_ts, "finishTimestamp": end_ts},
+            "loadChain": True, "families": [1, 7, 8]
+        }
+        try:
+            data = await self._request("POST", SEARCH_URL, params={'gln': self.sender_gln, 'family': 'edi'},
+                                       json=search_payload)
+            return data.get("items", [])
+        except Exception as e:
+            logging.error(f"Ошибка при поиске документов: {e}")
+            return None
+
+    async def download_pdf(self, doc_uuid):
+        """Содержимое PDF документа (ошибки передаются вызывающему)."""
+        return await self._request("GET", DOWNLOAD_URL_TEMPLATE, read="bytes",
+                                   params={'gln': self.sender_gln, 'doc_uuid': doc_uuid, 'format': 'pdf'})
+
+    async def get_retailers(self):
+        logging.info("Шаг 2.1: Получение базового списка GLN всех партнеров...")
+        try:
+            base_partners = await self._request("GET", RETAILERS_URL)
+            logging.info(f"Найдено базовых партнеров: {len(base_partners)}")
+            return base_partners
+        except Exception as e:
+            logging.error(f"Не удалось получить базовый список партнеров: {e}")
+            return []
+
+    async def get_partner_details(self, partner_gln, sender_gln=None):
+        params = {'gln': sender_gln or self.sender_gln, 'query': partner_gln}
+        try:
+            results = await self._request("GET", IDENTIFIERS_URL, params=params)
+            if results and isinstance(results, list):
+                return results[0]
+            elif results and isinstance(results, dict):
+                return results
+        except Exception as e:
+            logging.warning(f"Не удалось получить детали для GLN {partner_gln}: {e}")
+        return None
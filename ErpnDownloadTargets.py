@@ -0,0 +1,258 @@
+# -*- coding: utf-8 -*-
+"""
+Таблица целей загрузки PDF заблокированных НН/РК и квитанций (t_tax_cabinet_erpn_download_target).
+
+Раньше pdf_tax_gov_ua_erpn_block при каждом запуске строил список файлов одним тяжелым
+запросом по t_tax_cabinet_erpn_api (имена через concat/to_char, коррелированный подзапрос
+для каждой РК, UNION ALL из пяти частей с DISTINCT). Теперь список хранится готовым:
+одна строка на (code, impdate, kvt_number) с именем файла и датой блокирующего документа.
+
+Таблица поддерживается триггерами уровня выражения на t_tax_cabinet_erpn_api: по
+изменившимся строкам (transition tables) пересчитываются только затронутые коды:
+сам документ, корректируемая им НН (crcode) и РК, которые ссылаются на него.
+Окно в 365 дней применяется при чтении по block_crtdate, поэтому ежедневно
+пересчитывать таблицу не нужно.
+"""
+
+from AsyncPostgresql import acquire_connection
+from PgInstrumentation import track_query
+
+TARGET_TABLE = "t_tax_cabinet_erpn_download_target"
+BLOCKED_STATUSES = (1, 2, 13, 14, 15, 18)  # статусы заблокированных документов
+
+_STATUSES_SQL = ", ".join(str(status) for status in BLOCKED_STATUSES)
+
+DDL = rf"""
+CREATE TABLE IF NOT EXISTS {TARGET_TABLE} (
+    code bigint NOT NULL,
+    impdate timestamp NOT NULL,
+    kvt_number smallint NOT NULL,
+    file_name text,
+    block_crtdate date,
+    updated_at timestamptz NOT NULL DEFAULT now(),
+    CONSTRAINT {TARGET_TABLE}_pkey PRIMARY KEY (code, impdate, kvt_number)
+);
+
+CREATE INDEX IF NOT EXISTS {TARGET_TABLE}_block_crtdate_idx
+    ON {TARGET_TABLE} (block_crtdate);
+
+-- пересчитывает цели загрузки для указанных кодов документов
+CREATE OR REPLACE FUNCTION fn_erpn_download_target_refresh(p_codes bigint[])
+RETURNS integer
+LANGUAGE plpgsql AS $$
+DECLARE
+    v_count integer;
+BEGIN
+    DELETE FROM {TARGET_TABLE} WHERE code = ANY (p_codes);
+
+    INSERT INTO {TARGET_TABLE} (code, impdate, kvt_number, file_name, block_crtdate)
+    WITH
+    blocked AS (
+        -- заблокированный документ: сам документ и корректируемая им НН
+        SELECT code AS target_code, crtdate
+        FROM t_tax_cabinet_erpn_api
+        WHERE code = ANY (p_codes) AND hsmcstt IN ({_STATUSES_SQL})
+        UNION ALL
+        SELECT crcode, crtdate
+        FROM t_tax_cabinet_erpn_api
+        WHERE crcode = ANY (p_codes) AND hsmcstt IN ({_STATUSES_SQL}) AND coalesce(crcode, 0) <> 0
+    ),
+    block AS (
+        SELECT target_code, max(crtdate) AS block_crtdate
+        FROM blocked
+        GROUP BY target_code
+    ),
+    doc AS (
+        SELECT DISTINCT ON (api.code, api.impdate)
+            api.code,
+            api.impdate,
+            api.kvt2,
+            api.kvt3,
+            api.kvt4,
+            block.block_crtdate,
+            CASE
+                WHEN api.ftype = 0 THEN
+                    concat(api.cptin, '\', to_char(api.crtdate, 'yyyymm'), '\ПН\ПН ', api.nmr, ' від ',
+                           to_char(api.crtdate, 'dd mm yyyy'), '.pdf')
+                WHEN api.ftype = 1 THEN
+                    concat(api.cptin, '\', to_char(api.crtdate, 'yyyymm'), '\ПН\ПН ', api.corrnmr, ' від ',
+                           to_char(src.crtdate, 'dd mm yyyy'), ' РК ', api.nmr, ' ',
+                           to_char(api.crtdate, 'dd mm yyyy'), '.pdf')
+            END AS file_name
+        FROM t_tax_cabinet_erpn_api AS api
+            INNER JOIN block ON api.code = block.target_code
+            LEFT JOIN LATERAL (
+                SELECT crtdate FROM t_tax_cabinet_erpn_api WHERE code = api.crcode LIMIT 1
+            ) AS src ON true
+        ORDER BY api.code, api.impdate
+    )
+    SELECT
+        doc.code,
+        doc.impdate,
+        kvt.kvt_number,
+        CASE WHEN kvt.kvt_number = 0 THEN doc.file_name
+            ELSE replace(doc.file_name, '.pdf', concat(' KVT', kvt.kvt_number, '.pdf'))
+        END,
+        doc.block_crtdate
+    FROM doc
+        CROSS JOIN LATERAL (
+            VALUES (0, true), (1, true), (2, doc.kvt2 <> 0), (3, doc.kvt3 <> 0), (4, doc.kvt4 <> 0)
+        ) AS kvt (kvt_number, present)
+    WHERE kvt.present
+    ON CONFLICT (code, impdate, kvt_number)
+    DO UPDATE SET file_name = EXCLUDED.file_name, block_crtdate = EXCLUDED.block_crtdate, updated_at = now();
+
+    GET DIAGNOSTICS v_count = ROW_COUNT;
+    RETURN v_count;
+END
+$$;
+
+-- коды, на которые влияют изменившиеся строки: сам документ, его crcode и РК, ссылающиеся на него
+CREATE OR REPLACE FUNCTION fn_erpn_download_target_trigger()
+RETURNS trigger
+LANGUAGE plpgsql AS $$
+DECLARE
+    v_codes bigint[];
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        SELECT array_agg(DISTINCT changed.code) INTO v_codes
+        FROM (
+            SELECT code FROM new_rows
+            UNION ALL
+            SELECT crcode FROM new_rows WHERE coalesce(crcode, 0) <> 0
+        ) AS changed;
+    ELSIF TG_OP = 'DELETE' THEN
+        SELECT array_agg(DISTINCT changed.code) INTO v_codes
+        FROM (
+            SELECT code FROM old_rows
+            UNION ALL
+            SELECT crcode FROM old_rows WHERE coalesce(crcode, 0) <> 0
+        ) AS changed;
+    ELSE
+        -- UPDATE: только строки, у которых изменились поля, влияющие на список файлов
+        SELECT array_agg(DISTINCT changed.code) INTO v_codes
+        FROM (
+            SELECT row_data.code, row_data.crcode
+            FROM (
+                SELECT code, impdate, hsmcstt, crcode, crtdate, ftype, cptin, nmr, corrnmr, kvt2, kvt3, kvt4
+                FROM new_rows
+                EXCEPT
+                SELECT code, impdate, hsmcstt, crcode, crtdate, ftype, cptin, nmr, corrnmr, kvt2, kvt3, kvt4
+                FROM old_rows
+                UNION ALL
+                (SELECT code, impdate, hsmcstt, crcode, crtdate, ftype, cptin, nmr, corrnmr, kvt2, kvt3, kvt4
+                FROM old_rows
+                EXCEPT
+                SELECT code, impdate, hsmcstt, crcode, crtdate, ftype, cptin, nmr, corrnmr, kvt2, kvt3, kvt4
+                FROM new_rows)
+            ) AS row_data
+        ) AS diff
+            CROSS JOIN LATERAL (VALUES (diff.code), (nullif(diff.crcode, 0))) AS changed (code)
+        WHERE changed.code IS NOT NULL;
+    END IF;
+
+    IF v_codes IS NULL THEN
+        RETURN NULL;
+    END IF;
+
+    -- имя файла РК содержит дату корректируемой НН
+    v_codes := v_codes || ARRAY(
+        SELECT DISTINCT code FROM t_tax_cabinet_erpn_api WHERE crcode = ANY (v_codes) AND coalesce(crcode, 0) <> 0
+    );
+    PERFORM fn_erpn_download_target_refresh(v_codes);
+    RETURN NULL;
+END
+$$;
+
+DROP TRIGGER IF EXISTS trg_erpn_download_target_insert ON t_tax_cabinet_erpn_api;
+CREATE TRIGGER trg_erpn_download_target_insert
+    AFTER INSERT ON t_tax_cabinet_erpn_api
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION fn_erpn_download_target_trigger();
+
+DROP TRIGGER IF EXISTS trg_erpn_download_target_update ON t_tax_cabinet_erpn_api;
+CREATE TRIGGER trg_erpn_download_target_update
+    AFTER UPDATE ON t_tax_cabinet_erpn_api
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION fn_erpn_download_target_trigger();
+
+DROP TRIGGER IF EXISTS trg_erpn_download_target_delete ON t_tax_cabinet_erpn_api;
+CREATE TRIGGER trg_erpn_download_target_delete
+    AFTER DELETE ON t_tax_cabinet_erpn_api
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION fn_erpn_download_target_trigger();
+"""
+
+# полный пересчет: все заблокированные за период документы и корректируемые ими НН
+PRUNE_SQL = f"DELETE FROM {TARGET_TABLE} WHERE block_crtdate IS NULL OR block_crtdate <= current_date - $1::integer"
+REBUILD_SQL = f"""
+    SELECT fn_erpn_download_target_refresh(ARRAY(
+        SELECT code
+        FROM t_tax_cabinet_erpn_api
+        WHERE crtdate > current_date - $1::integer AND hsmcstt IN ({_STATUSES_SQL})
+        UNION
+        SELECT crcode
+        FROM t_tax_cabinet_erpn_api
+        WHERE crtdate > current_date - $1::integer AND hsmcstt IN ({_STATUSES_SQL}) AND coalesce(crcode, 0) <> 0
+    ))
+"""
+
+# поиск строк по коду, корректируемой НН и заблокированных документов за период.
+# t_tax_cabinet_erpn_api - рабочая таблица, поэтому индексы строятся CONCURRENTLY (без блокировки записи),
+# по одному и вне транзакции
+SOURCE_INDEXES = {
+    "t_tax_cabinet_erpn_api_code_idx": "ON t_tax_cabinet_erpn_api (code)",
+    "t_tax_cabinet_erpn_api_crcode_idx": "ON t_tax_cabinet_erpn_api (crcode) WHERE coalesce(crcode, 0) <> 0",
+    "t_tax_cabinet_erpn_api_blocked_crtdate_idx":
+        f"ON t_tax_cabinet_erpn_api (crtdate) WHERE hsmcstt IN ({_STATUSES_SQL})",
+}
+
+
+async def create_source_indexes(conn):
+    """Создает индексы SOURCE_INDEXES через CREATE INDEX CONCURRENTLY (conn не должен быть в транзакции)."""
+    for name, definition in SOURCE_INDEXES.items():
+        # прерванный CONCURRENTLY оставляет невалидный индекс, IF NOT EXISTS его бы пропустил
+        invalid = await conn.fetchval(
+            "SELECT NOT indisvalid FROM pg_index WHERE indexrelid = to_regclass($1)", name)
+        if invalid:
+            await conn.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
+        sql = f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} {definition}"
+        with track_query(sql):
+            await conn.execute(sql)
+
+
+# то, что читает загрузчик: дешевый запрос по индексу block_crtdate
+DOWNLOAD_TARGETS_SQL = f"""
+    SELECT file_name, code, impdate, kvt_number
+    FROM {TARGET_TABLE}
+    WHERE block_crtdate > current_date - 365
+    ORDER BY file_name
+"""
+
+
+async def rebuild_download_targets(days=365):
+    """Полностью пересчитывает таблицу целей загрузки. Возвращает количество записанных строк."""
+    async with acquire_connection() as conn:
+        async with conn.transaction():
+            await conn.execute(PRUNE_SQL, days)
+            with track_query(REBUILD_SQL) as timer:
+                timer.rows = await conn.fetchval(REBUILD_SQL, days)
+    return timer.rows
+
+
+async def ensure_download_targets(rebuild=False):
+    """
+    Создает таблицу, индексы, функции и триггеры, если таблицы еще нет, и заполняет ее.
+    rebuild=True - пересоздать функции и триггеры и пересчитать таблицу в любом случае.
+    """
+    async with acquire_connection() as conn:
+        exists = await conn.fetchval("SELECT to_regclass($1) IS NOT NULL", TARGET_TABLE)
+        if exists and not rebuild:
+            return False
+        await create_source_indexes(conn)
+        async with conn.transaction():
+            with track_query(DDL):
+                await conn.execute(DDL)
+    rows = await rebuild_download_targets()
+    print(f"{TARGET_TABLE}: записано строк {rows}")
+    return True
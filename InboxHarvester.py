@@ -0,0 +1,238 @@
+# -*- coding: utf-8 -*-
+"""
+Сбор входящих документов кабинета налогоплательщика через JSON API вместо перелистывания
+таблицы documents/in в браузере (get_table_data_all, go_to_page, go_to_next_page).
+
+Браузер нужен только для входа: токен берется из TokenManager (кэш на диске).
+Страницы списка запрашиваются параллельно через DownloadScheduler (ограничение
+одновременных запросов и частоты), метаданные пакетно записываются в PostgreSQL
+(upsert_rows_async), вложения "РIШЕННЯ"/"ДОДАТОК" скачиваются по HTTP.
+
+Адреса API задаются переменными окружения (формат ответа списка: массив документов
+или страница вида {"content": [...], "totalPages": N}).
+
+Запуск: python InboxHarvester.py [--no-attachments]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import re
+from datetime import datetime
+from functools import partial
+
+import aiohttp
+from dateutil.parser import parse
+from dotenv import load_dotenv
+
+from AsyncDiskWriter import DownloadStats, save_response
+from AsyncPostgresql import acquire_connection, upsert_rows_async
+from DownloadScheduler import DownloadScheduler, TransientError, is_transient_status, parse_retry_after
+from TokenManager import TokenManager
+
+load_dotenv()
+
+URL_API_BASE = os.getenv("TAX_CABINET_API_BASE", "https://cabinet.tax.gov.ua/ws/api")
+INBOX_LIST_URL = os.getenv("TAX_INBOX_LIST_URL", f"{URL_API_BASE}/post/incoming")
+INBOX_ATTACHMENT_URL = os.getenv("TAX_INBOX_ATTACHMENT_URL", f"{URL_API_BASE}/post/incoming/{{id}}/pdf")
+INBOX_PAGE_SIZE = int(os.getenv("TAX_INBOX_PAGE_SIZE", 100))
+INBOX_CONCURRENCY = int(os.getenv("TAX_INBOX_CONCURRENCY", 8))
+INBOX_TABLE = "t_tax_cabinet_inbox"
+INBOX_UNQKEY = "t_tax_cabinet_inbox_pkey"
+INBOX_DOWNLOADS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "downloads", "inbox")
+ATTACHMENT_MARKERS = ("РIШЕННЯ", "ДОДАТОК")  # как в TaxGovUaConfig.find_and_save_receipts
+
+INBOX_DDL = f"""
+    CREATE TABLE IF NOT EXISTS {INBOX_TABLE} (
+        id text NOT NULL,
+        doc_name text,
+        doc_date timestamp,
+        payload jsonb NOT NULL,
+        harvested_at timestamptz NOT NULL DEFAULT now(),
+        CONSTRAINT {INBOX_UNQKEY} PRIMARY KEY (id)
+    )
+"""
+
+
+def _first(item, *keys):
+    for key in keys:
+        value = item.get(key)
+        if value not in (None, ""):
+            return value
+    return None
+
+
+def _parse_date(value):
+    if not value:
+        return None
+    try:
+        return parse(str(value), dayfirst=True).replace(tzinfo=None)
+    except (ValueError, OverflowError):
+        return None
+
+
+def inbox_row(item):
+    """Документ из ответа API -> строка t_tax_cabinet_inbox (весь документ сохраняется в payload)."""
+    return {
+        "id": str(_first(item, "id", "docId", "code")),
+        "doc_name": _first(item, "name", "docName", "title", "subject"),
+        "doc_date": _parse_date(_first(item, "date", "dateIn", "docDate", "crtdate")),
+        "payload": json.dumps(item, ensure_ascii=False),
+    }
+
+
+def needs_attachment(row):
+    name = (row["doc_name"] or "").upper()
+    return any(marker in name for marker in ATTACHMENT_MARKERS)
+
+
+def attachment_path(row):
+    name = re.sub(r'[\\/*?:"<>|]', "", row["doc_name"] or "").strip()[:150]
+    return os.path.join(INBOX_DOWNLOADS_DIR, f"{name} {row['id']}.pdf")
+
+
+async def _get(session, token_manager, url, params=None):
+    # запрос с токеном из TokenManager; на 401 - одно обновление токена и повтор
+    token = await token_manager.get_token()
+    for attempt in range(2):
+        headers = {"Authorization": token, "Content-Type": "application/json"}
+        response = await session.get(url, headers=headers, params=params, timeout=aiohttp.ClientTimeout(total=60))
+        if response.status == 401 and attempt == 0:
+            response.release()
+            token = await token_manager.refresh(token)
+            continue
+        if is_transient_status(response.status):
+            response.release()
+            raise TransientError(f"Ошибка {response.status}: {url}", response.status,
+                                 parse_retry_after(response.headers.get("Retry-After")))
+        return response
+
+
+async def fetch_page(session, token_manager, page):
+    """Страница списка входящих: (документы, всего страниц или None)."""
+    try:
+        response = await _get(session, token_manager, INBOX_LIST_URL, {"page": page, "size": INBOX_PAGE_SIZE})
+        async with response:
+            if response.status != 200:
+                raise RuntimeError(f"Ошибка {response.status} при получении страницы {page}")
+            data = await response.json(content_type=None)
+    except (aiohttp.ClientConnectionError, aiohttp.ClientPayloadError, asyncio.TimeoutError) as e:
+        raise TransientError(f"Ошибка сети при получении страницы {page}: {e!r}") from e
+    if isinstance(data, dict):
+        return data.get("content", []), data.get("totalPages")
+    return data, None
+
+
+async def download_attachment(session, token_manager, row, stats):
+    file_path = attachment_path(row)
+    try:
+        response = await _get(session, token_manager, INBOX_ATTACHMENT_URL.format(id=row["id"]))
+        async with response:
+            if response.status != 200:
+                print(f"❌ Ошибка {response.status} при скачивании {os.path.basename(file_path)}")
+                return None
+            await save_response(response, file_path, stats)
+    except (aiohttp.ClientConnectionError, aiohttp.ClientPayloadError, asyncio.TimeoutError) as e:
+        raise TransientError(f"Ошибка сети при скачивании {os.path.basename(file_path)}: {e!r}") from e
+    return file_path
+
+
+async def fetch_all_pages(session, token_manager):
+    """
+    Все страницы списка входящих через DownloadScheduler (повторы, ограничение частоты).
+    Возвращает (документы в порядке страниц, {номер страницы: ошибка} для страниц, которые не удалось получить).
+    Если всего страниц неизвестно, страницы запрашиваются окнами по INBOX_CONCURRENCY до первой неполной.
+    """
+    loop = asyncio.get_running_loop()
+    futures = {}
+    pages = {}
+    failed = {}
+
+    async def submit_pages(scheduler, page_numbers):
+        for page in page_numbers:
+            futures[page] = loop.create_future()
+            await scheduler.submit(partial(fetch_page, session, token_manager, page), key=page)
+
+    async def wait_pages(page_numbers):
+        results = await asyncio.gather(*(futures[page] for page in page_numbers), return_exceptions=True)
+        for page, result in zip(page_numbers, results):
+            if isinstance(result, Exception):
+                failed[page] = result
+                print(f"❌ Не удалось получить страницу {page}: {result}")
+            else:
+                pages[page] = result[0]
+        return results
+
+    async with DownloadScheduler(max_concurrency=INBOX_CONCURRENCY,
+                                 on_done=lambda page, result: futures[page].set_result(result),
+                                 on_error=lambda page, error: futures[page].set_exception(error)) as scheduler:
+        await submit_pages(scheduler, [0])
+        first_page = (await wait_pages([0]))[0]
+        if 0 in pages:
+            total_pages = first_page[1]
+            if total_pages is not None:
+                await submit_pages(scheduler, range(1, total_pages))
+                await wait_pages(range(1, total_pages))
+            else:
+                # размер списка неизвестен: окна страниц, пока не придет неполная страница
+                start = 1
+                while len(pages[start - 1]) >= INBOX_PAGE_SIZE:
+                    window = range(start, start + INBOX_CONCURRENCY)
+                    await submit_pages(scheduler, window)
+                    await wait_pages(window)
+                    if any(page in failed for page in window):
+                        break  # без пропущенной страницы неизвестно, есть ли следующие
+                    if any(len(pages[page]) < INBOX_PAGE_SIZE for page in window):
+                        break
+                    start = window.stop
+
+    return [item for page in sorted(pages) for item in pages[page]], failed
+
+
+async def harvest_inbox(download_attachments=True):
+    """
+    Собирает все страницы входящих, записывает их в t_tax_cabinet_inbox и скачивает вложения.
+    Возвращает {"documents", "inserted", "attachments", "failed_pages"}; непустой failed_pages
+    означает, что список входящих собран не полностью.
+    """
+    token_manager = TokenManager()
+    stats = DownloadStats()
+    downloaded = []
+
+    async with acquire_connection() as conn:
+        await conn.execute(INBOX_DDL)
+
+    async with aiohttp.ClientSession() as session:
+        items, failed_pages = await fetch_all_pages(session, token_manager)
+
+        rows = list({row["id"]: row for row in map(inbox_row, items)}.values())
+        result = await upsert_rows_async(INBOX_TABLE, rows, INBOX_UNQKEY) if rows else {"inserted": 0}
+        print(f"📄 Документов: {len(rows)}, новых в {INBOX_TABLE}: {result['inserted']}")
+        if failed_pages:
+            print(f"⚠️ Список входящих неполный, не получены страницы: {sorted(failed_pages)}")
+
+        if download_attachments:
+            async with DownloadScheduler(max_concurrency=INBOX_CONCURRENCY,
+                                         on_done=lambda key, path: path and downloaded.append(path)) as scheduler:
+                for row in rows:
+                    if needs_attachment(row) and not os.path.exists(attachment_path(row)):
+                        await scheduler.submit(partial(download_attachment, session, token_manager, row, stats),
+                                               key=row["id"])
+            print(f"💽 {stats.report()}")
+
+    return {"documents": len(rows), "inserted": result["inserted"], "attachments": len(downloaded),
+            "failed_pages": sorted(failed_pages)}
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Сбор входящих документов кабинета через API")
+    arg_parser.add_argument("--no-attachments", action="store_true", help="не скачивать вложения")
+    args = arg_parser.parse_args()
+
+    start_time = datetime.now()
+    harvest_result = asyncio.run(harvest_inbox(download_attachments=not args.no_attachments))
+    print(harvest_result)
+    print(f"⏱️ Общее время выполнения: {datetime.now() - start_time}")
+    if harvest_result["failed_pages"]:
+        raise SystemExit(1)
@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+"""
+Отложенный импорт тяжелых и необязательных зависимостей.
+
+lazy_import("pandas") возвращает объект-модуль, который импортирует настоящий модуль при первом
+обращении к атрибуту, поэтому скрипт, которому pandas не понадобился, не платит за его загрузку.
+on_load вызывается один раз сразу после импорта (например, чтобы настроить модуль).
+optional=True - отсутствие модуля не ошибка при импорте скрипта: ModuleNotFoundError возникнет
+только при первом использовании.
+
+Пример:
+    pd = lazy_import("pandas")
+    pyautogui = lazy_import("pyautogui", on_load=lambda module: setattr(module, "FAILSAFE", False))
+"""
+
+import importlib
+import importlib.util
+import sys
+import threading
+import types
+
+
+class LazyModule(types.ModuleType):
+    def __init__(self, name, on_load=None):
+        super().__init__(name)
+        self.__dict__["_lazy_on_load"] = on_load
+        self.__dict__["_lazy_module"] = None
+        self.__dict__["_lazy_lock"] = threading.Lock()
+
+    def _load(self):
+        module = self.__dict__["_lazy_module"]
+        if module is not None:
+            return module
+        with self.__dict__["_lazy_lock"]:
+            module = self.__dict__["_lazy_module"]
+            if module is None:
+                module = importlib.import_module(self.__name__)
+                on_load = self.__dict__["_lazy_on_load"]
+                if on_load is not None:
+                    on_load(module)
+                self.__dict__["_lazy_module"] = module
+        return module
+
+    @property
+    def is_loaded(self):
+        return self.__dict__["_lazy_module"] is not None
+
+    def __getattr__(self, name):
+        return getattr(self._load(), name)
+
+    def __setattr__(self, name, value):
+        setattr(self._load(), name, value)
+
+    def __dir__(self):
+        return dir(self._load())
+
+    def __repr__(self):
+        state = "loaded" if self.is_loaded else "not loaded"
+        return f"<lazy module {self.__name__!r} ({state})>"
+
+
+def lazy_import(name, on_load=None, optional=False):
+    """
+    Модуль name, который будет импортирован при первом обращении к атрибуту.
+    Уже импортированный модуль возвращается как есть (on_load для него вызывается сразу).
+    """
+    module = sys.modules.get(name)
+    if module is not None and not isinstance(module, LazyModule):
+        if on_load is not None:
+            on_load(module)
+        return module
+    # отсутствующий обязательный модуль - ошибка сразу, как при обычном импорте
+    if not optional and importlib.util.find_spec(name.partition(".")[0]) is None:
+        raise ModuleNotFoundError(f"No module named {name!r}", name=name)
+    return LazyModule(name, on_load)
@@ -0,0 +1,223 @@
+# -*- coding: utf-8 -*-
+"""
+Локальная имитация страниц кабинета налогоплательщика для замеров и проверки сценариев Selenium
+без обращения к cabinet.tax.gov.ua.
+
+    /login          - оверлей p-blockui-document, кнопки "Зчитати" и "Увійти" (доступна после чтения ключа)
+    /documents/in   - таблица PrimeNG (p-datatable-tbody) с пагинатором, строки загружаются через fetch;
+                      кнопки с номерами открывают свою страницу, ?page=N - начальная страница
+    /api/documents  - JSON строки страницы (?page=N), отвечает с задержкой
+    /documents/view - просмотр документа (?id=N) с кнопками "XML" и "PDF", которые скачивают файл
+    /file/<имя>     - файл для скачивания (Content-Disposition: attachment)
+
+Задержки задаются при создании, чтобы имитировать медленный сайт. С require_login=True вход
+ставит cookie SESSION и токен в localStorage, а страницы документов без cookie перенаправляют на /login.
+
+Пример:
+    with LocalCabinetStub(pages=5) as stub:
+        driver.get(stub.url("/login"))
+"""
+
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+LOGIN_PAGE = """<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>login</title>
+<style>.p-blockui-document {{position: fixed; inset: 0; background: rgba(0,0,0,.3);}}</style></head>
+<body>
+<div class="p-blockui-document"></div>
+<button id="read"><span>Зчитати</span></button>
+<button id="login" disabled><span>Увійти</span></button>
+<script>
+setTimeout(() => document.querySelector('.p-blockui-document').remove(), {overlay_ms});
+document.getElementById('read').onclick = () =>
+    setTimeout(() => document.getElementById('login').disabled = false, {read_ms});
+document.getElementById('login').onclick = () =>
+    fetch('/api/login').then(r => r.json()).then(data => {{
+        localStorage.setItem('token', data.token || '');
+        location.href = '/documents/in';
+    }});
+</script>
+</body></html>
+"""
+
+DOCUMENTS_PAGE = """<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>documents</title></head>
+<body>
+<div id="table-wrapper">
+<table>
+<thead><tr><th></th><th>Документ</th><th>Дата</th><th>Сума</th><th>Код</th></tr></thead>
+<tbody class="p-datatable-tbody"></tbody>
+</table>
+</div>
+<div class="p-paginator">
+<span class="p-paginator-pages"></span>
+<button class="p-paginator-next p-paginator-element p-link p-ripple">&gt;</button>
+</div>
+<script>
+const pages = {pages};
+let page = 1;
+const startPage = Math.min(Math.max(parseInt(new URLSearchParams(location.search).get('page')) || 1, 1), pages);
+function render(rows) {{
+    document.querySelector('.p-datatable-tbody').innerHTML = rows.map(row =>
+        '<tr><td><input type="checkbox"></td>' + row.map(cell => '<td>' + cell + '</td>').join('') + '</tr>'
+    ).join('');
+    document.querySelector('.p-paginator-pages').innerHTML = Array.from({{length: pages}}, (_, i) =>
+        '<button class="p-paginator-page' + (i + 1 === page ? ' p-highlight' : '') + '">' + (i + 1) + '</button>'
+    ).join('');
+    const next = document.querySelector('.p-paginator-next');
+    next.disabled = page >= pages;
+    next.classList.toggle('p-disabled', page >= pages);
+}}
+function load(n) {{
+    const overlay = document.createElement('div');
+    overlay.className = 'p-datatable-loading-overlay';
+    document.getElementById('table-wrapper').appendChild(overlay);
+    fetch('/api/documents?page=' + n).then(r => r.json()).then(rows => {{
+        page = n;
+        render(rows);
+        overlay.remove();
+    }});
+}}
+document.querySelector('.p-paginator-next').onclick = () => {{ if (page < pages) load(page + 1); }};
+document.querySelector('.p-paginator-pages').onclick = event => {{
+    const button = event.target.closest('.p-paginator-page');
+    if (button && +button.textContent !== page) load(+button.textContent);
+}};
+load(startPage);
+</script>
+</body></html>
+"""
+
+VIEW_PAGE = """<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>view</title></head>
+<body>
+<p>{doc_name}</p>
+<button class="p-button"><span class="p-button-label">XML</span></button>
+<button class="p-button"><span class="p-button-label">PDF</span></button>
+<script>
+document.querySelectorAll('.p-button-label').forEach(label => label.parentElement.onclick = () =>
+    setTimeout(() => location.href = '/file/{doc_id}.' + label.textContent.toLowerCase(), {read_ms}));
+</script>
+</body></html>
+"""
+
+
+class LocalCabinetStub:
+    def __init__(self, pages=5, rows_per_page=10, api_delay=0.2, overlay_delay=0.3, read_delay=0.5,
+                 file_size=200 * 1024, require_login=False, host="127.0.0.1"):
+        """Задержки в секундах: ответа API, исчезновения оверлея, чтения ключа."""
+        self.pages = pages
+        self.rows_per_page = rows_per_page
+        self.api_delay = api_delay
+        self.overlay_delay = overlay_delay
+        self.read_delay = read_delay
+        self.file_size = file_size
+        self.require_login = require_login
+        self.session = "stub-session"
+        self.host = host
+        self._server = None
+        self._thread = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+
+    def start(self):
+        self._server = ThreadingHTTPServer((self.host, 0), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, name="cabinet-stub", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    @property
+    def base_url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def url(self, path):
+        return f"{self.base_url}{path}"
+
+    def page_rows(self, page):
+        first = (page - 1) * self.rows_per_page
+        return [
+            [self.doc_name(n), f"0{n % 9 + 1}.01.2024",
+             f"{n * 1000:,}".replace(",", " ") + ",50", f"{n:08}"]
+            for n in range(first + 1, first + self.rows_per_page + 1)
+        ]
+
+    @staticmethod
+    def doc_name(n):
+        return f"Документ № {n} від 01.0{n % 9 + 1}.2024"
+
+    def file_body(self, name):
+        if name.endswith(".xml"):
+            padding = "0" * self.file_size
+            return f'<?xml version="1.0" encoding="utf-8"?><doc name="{name}">{padding}</doc>'.encode("utf-8")
+        return b"%PDF-1.4\n" + b"0" * self.file_size
+
+    def _handler_class(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def _send(self, status, body, content_type, headers=None):
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _logged_in(self):
+                return f"SESSION={stub.session}" in (self.headers.get("Cookie") or "")
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                if stub.require_login and url.path.startswith("/documents") and not self._logged_in():
+                    self._send(302, b"", "text/plain", {"Location": "/login"})
+                elif url.path == "/login":
+                    page = LOGIN_PAGE.format(overlay_ms=int(stub.overlay_delay * 1000),
+                                             read_ms=int(stub.read_delay * 1000))
+                    self._send(200, page.encode("utf-8"), "text/html; charset=utf-8")
+                elif url.path == "/documents/in":
+                    self._send(200, DOCUMENTS_PAGE.format(pages=stub.pages).encode("utf-8"),
+                               "text/html; charset=utf-8")
+                elif url.path == "/documents/view":
+                    doc_id = int(parse_qs(url.query).get("id", ["1"])[0])
+                    page = VIEW_PAGE.format(doc_name=stub.doc_name(doc_id), doc_id=doc_id,
+                                            read_ms=int(stub.api_delay * 1000))
+                    self._send(200, page.encode("utf-8"), "text/html; charset=utf-8")
+                elif url.path == "/api/login":
+                    time.sleep(stub.api_delay)
+                    body = json.dumps({"token": f"Bearer {stub.session}"}).encode("utf-8")
+                    self._send(200, body, "application/json", {"Set-Cookie": f"SESSION={stub.session}; Path=/"})
+                elif url.path == "/api/documents":
+                    time.sleep(stub.api_delay)
+                    page = int(parse_qs(url.query).get("page", ["1"])[0])
+                    body = json.dumps(stub.page_rows(page), ensure_ascii=False).encode("utf-8")
+                    self._send(200, body, "application/json; charset=utf-8")
+                elif url.path.startswith("/file/"):
+                    name = url.path.rsplit("/", 1)[-1]
+                    time.sleep(stub.api_delay)
+                    content_type = "application/xml" if name.endswith(".xml") else "application/pdf"
+                    self._send(200, stub.file_body(name), content_type,
+                               {"Content-Disposition": f'attachment; filename="{name}"'})
+                else:
+                    self._send(404, b"not found", "text/plain")
+
+        return Handler
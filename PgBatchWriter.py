@@ -0,0 +1,192 @@
+# -*- coding: utf-8 -*-
+"""
+Фоновая пакетная запись в PostgreSQL.
+
+Производители (загрузчики и т.п.) кладут строки или SQL выражения в ограниченную очередь
+и не ждут записи в базу. Фоновая задача забирает их пакетами (по размеру или по времени)
+и фиксирует каждый пакет одной транзакцией на соединении из пула AsyncPostgresql.
+Если очередь заполнена, put() ждет (backpressure). Временные ошибки соединения
+и сериализации повторяются с экспоненциальной задержкой.
+
+Пример:
+    async with BatchWriter("INSERT INTO t_log (code, status) VALUES ($1, $2)") as writer:
+        await writer.put((code, status))
+"""
+
+import asyncio
+import os
+import random
+
+import asyncpg
+
+from AsyncPostgresql import acquire_connection
+from PgInstrumentation import track_query
+from PgQueryCache import query_cache
+
+BATCH_WRITER_BATCH_SIZE = int(os.getenv("PG_BATCH_WRITER_BATCH_SIZE", 500))
+BATCH_WRITER_FLUSH_INTERVAL = float(os.getenv("PG_BATCH_WRITER_FLUSH_INTERVAL", 1.0))  # сек
+BATCH_WRITER_QUEUE_SIZE = int(os.getenv("PG_BATCH_WRITER_QUEUE_SIZE", 10000))
+
+# ошибки, после которых пакет имеет смысл повторить
+TRANSIENT_ERRORS = (
+    OSError,
+    asyncio.TimeoutError,
+    asyncpg.exceptions.PostgresConnectionError,
+    asyncpg.exceptions.ConnectionDoesNotExistError,
+    asyncpg.exceptions.CannotConnectNowError,
+    asyncpg.exceptions.TooManyConnectionsError,
+    asyncpg.exceptions.SerializationError,
+    asyncpg.exceptions.DeadlockDetectedError,
+)
+
+_STOP = object()
+
+
+class BatchWriter:
+    def __init__(self, sql=None, batch_size=BATCH_WRITER_BATCH_SIZE, flush_interval=BATCH_WRITER_FLUSH_INTERVAL,
+                 max_queue_size=BATCH_WRITER_QUEUE_SIZE, max_retries=5, retry_delay=0.5):
+        """
+        sql - выражение по умолчанию для put(args) (выполняется через executemany).
+        batch_size - максимальное количество элементов в одной транзакции.
+        flush_interval - максимальное время ожидания неполного пакета, сек.
+        max_queue_size - размер очереди; при заполнении put() ждет.
+        """
+        self.sql = sql
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self._queue = asyncio.Queue(maxsize=max_queue_size)
+        self._task = None
+        self._closed = False
+        self.failed_batches = []  # (ошибка, пакет) - пакеты, которые не удалось записать
+        self.stats = {"queued": 0, "committed": 0, "batches": 0, "retries": 0, "failed": 0}
+
+    async def __aenter__(self):
+        self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close(raise_errors=exc_type is None)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+        return self
+
+    async def put(self, args=None, sql=None):
+        """
+        Ставит в очередь одну строку (args) для выражения sql (по умолчанию self.sql)
+        или выражение без параметров (args=None). Ждет, если очередь заполнена.
+        """
+        if self._closed:
+            raise RuntimeError("BatchWriter уже закрыт")
+        sql = sql or self.sql
+        if not sql:
+            raise ValueError("Не задан SQL для записи")
+        self.start()
+        await self._queue.put((sql, args))
+        self.stats["queued"] += 1
+
+    async def put_many(self, rows, sql=None):
+        for args in rows:
+            await self.put(args, sql)
+
+    async def flush(self):
+        """Ждет, пока все поставленные в очередь элементы будут обработаны."""
+        await self._queue.join()
+
+    async def close(self, raise_errors=True):
+        """Записывает остаток очереди и останавливает фоновую задачу."""
+        if self._closed:
+            return
+        self._closed = True
+        if self._task is not None:
+            await self._queue.put(_STOP)
+            await self._task
+        if raise_errors and self.failed_batches:
+            error, batch = self.failed_batches[-1]
+            raise RuntimeError(
+                f"BatchWriter: не записано пакетов: {len(self.failed_batches)}, строк: {self.stats['failed']}"
+            ) from error
+
+    async def _next_batch(self):
+        # первый элемент ждем без ограничения, остальные - не дольше flush_interval
+        loop = asyncio.get_running_loop()
+        batch = [await self._queue.get()]
+        if batch[0] is _STOP:
+            return batch
+        deadline = loop.time() + self.flush_interval
+        while len(batch) < self.batch_size:
+            try:
+                item = self._queue.get_nowait()
+            except asyncio.QueueEmpty:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+            batch.append(item)
+            if item is _STOP:
+                break
+        return batch
+
+    async def _run(self):
+        while True:
+            batch = await self._next_batch()
+            stop = batch[-1] is _STOP
+            items = batch[:-1] if stop else batch
+            if items:
+                await self._commit_with_retry(items)
+            for _ in batch:
+                self._queue.task_done()
+            if stop:
+                return
+
+    async def _commit_with_retry(self, items):
+        for attempt in range(self.max_retries + 1):
+            try:
+                await self._commit(items)
+                self.stats["committed"] += len(items)
+                self.stats["batches"] += 1
+                return
+            except TRANSIENT_ERRORS as e:
+                if attempt == self.max_retries:
+                    self._fail(e, items)
+                    return
+                self.stats["retries"] += 1
+                delay = self.retry_delay * 2 ** attempt * (1 + random.random() / 10)
+                print(f"BatchWriter: временная ошибка ({e}), повтор через {delay:.1f} сек")
+                await asyncio.sleep(delay)
+            except Exception as e:
+                self._fail(e, items)
+                return
+
+    def _fail(self, error, items):
+        print(f"ERROR:BatchWriter: не удалось записать пакет из {len(items)} строк: {error}")
+        self.failed_batches.append((error, items))
+        self.stats["failed"] += len(items)
+
+    async def _commit(self, items):
+        # подряд идущие строки одного выражения выполняем одним executemany
+        groups = []
+        for sql, args in items:
+            if groups and groups[-1][0] == sql and args is not None and groups[-1][1][0] is not None:
+                groups[-1][1].append(args)
+            else:
+                groups.append((sql, [args]))
+
+        async with acquire_connection() as conn:
+            async with conn.transaction():
+                for sql, rows in groups:
+                    with track_query(sql) as timer:
+                        if rows[0] is None:
+                            await conn.execute(sql)
+                        else:
+                            await conn.executemany(sql, rows)
+                            timer.rows = len(rows)
+
+        for sql, _ in groups:
+            query_cache.invalidate_sql(sql)
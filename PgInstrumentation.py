@@ -0,0 +1,287 @@
+# -*- coding: utf-8 -*-
+"""
+Инструментирование запросов к PostgreSQL.
+
+Для каждого выражения (нормализованного: литералы заменены на '?') накапливается
+количество вызовов, ошибки, время выполнения (с гистограммой), строки, байты
+и время ожидания соединения из пула. Медленные запросы попадают в журнал slow-query.
+
+Статистику можно получить вызовом get_query_stats() или периодически сбрасывать
+в JSON файл (start_periodic_dump или переменная окружения PG_QUERY_STATS_FILE).
+"""
+
+import atexit
+import contextvars
+import json
+import logging
+import os
+import re
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime
+
+from PgQueryCache import normalize_sql
+
+SLOW_QUERY_THRESHOLD = float(os.getenv("PG_SLOW_QUERY_THRESHOLD", 1.0))  # сек
+SLOW_QUERY_LOG_SIZE = int(os.getenv("PG_SLOW_QUERY_LOG_SIZE", 200))
+QUERY_STATS_FILE = os.getenv("PG_QUERY_STATS_FILE")
+QUERY_STATS_DUMP_INTERVAL = float(os.getenv("PG_QUERY_STATS_DUMP_INTERVAL", 60))  # сек
+
+# верхние границы интервалов гистограммы времени выполнения, сек
+HISTOGRAM_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 30.0, float("inf"))
+
+logger = logging.getLogger("pg.slow_query")
+
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r"(?<![\w$])\d+(?:\.\d+)?")
+
+# время ожидания соединения из пула для текущей задачи (заполняет AsyncPostgresql.acquire_connection)
+pool_wait_var = contextvars.ContextVar("pg_pool_wait", default=0.0)
+
+_stats = {}
+_slow_queries = deque(maxlen=SLOW_QUERY_LOG_SIZE)
+_lock = threading.Lock()
+_dump_stop = None
+
+
+def normalize_statement(sql):
+    """Текст запроса без литералов: запросы, отличающиеся только значениями, считаются одним."""
+    sql = _STRING_LITERAL.sub("?", normalize_sql(sql))
+    return _NUMBER_LITERAL.sub("?", sql)
+
+
+class StatementStats:
+    __slots__ = ("count", "errors", "total_time", "max_time", "rows", "bytes", "pool_wait", "buckets")
+
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+        self.rows = 0
+        self.bytes = 0
+        self.pool_wait = 0.0
+        self.buckets = [0] * len(HISTOGRAM_BUCKETS)
+
+    def add(self, elapsed, rows, nbytes, pool_wait, failed):
+        self.count += 1
+        self.errors += failed
+        self.total_time += elapsed
+        self.max_time = max(self.max_time, elapsed)
+        self.rows += rows
+        self.bytes += nbytes
+        self.pool_wait += pool_wait
+        for i, bound in enumerate(HISTOGRAM_BUCKETS):
+            if elapsed <= bound:
+                self.buckets[i] += 1
+                break
+
+    def as_dict(self, statement):
+        return {
+            "statement": statement,
+            "count": self.count,
+            "errors": self.errors,
+            "total_time": round(self.total_time, 6),
+            "avg_time": round(self.total_time / self.count, 6) if self.count else 0.0,
+            "max_time": round(self.max_time, 6),
+            "rows": self.rows,
+            "bytes": self.bytes,
+            "pool_wait": round(self.pool_wait, 6),
+            "histogram": {
+                ("inf" if bound == float("inf") else str(bound)): hits
+                for bound, hits in zip(HISTOGRAM_BUCKETS, self.buckets)
+            },
+        }
+
+
+def set_slow_query_threshold(seconds):
+    global SLOW_QUERY_THRESHOLD
+    SLOW_QUERY_THRESHOLD = seconds
+
+
+def record_query(sql, elapsed, rows=0, nbytes=0, pool_wait=0.0, error=None, source="asyncpg"):
+    """Добавляет одно выполнение запроса в статистику."""
+    statement = normalize_statement(sql)
+    with _lock:
+        stats = _stats.get(statement)
+        if stats is None:
+            stats = _stats[statement] = StatementStats()
+        stats.add(elapsed, rows, nbytes, pool_wait, error is not None)
+
+        if elapsed >= SLOW_QUERY_THRESHOLD:
+            _slow_queries.append({
+                "time": datetime.now().isoformat(timespec="seconds"),
+                "source": source,
+                "elapsed": round(elapsed, 6),
+                "rows": rows,
+                "pool_wait": round(pool_wait, 6),
+                "error": str(error) if error else None,
+                "sql": normalize_sql(sql)[:2000],
+            })
+    if elapsed >= SLOW_QUERY_THRESHOLD:
+        logger.warning("Медленный запрос (%.3f сек, строк: %s): %s", elapsed, rows, normalize_sql(sql)[:500])
+
+
+class QueryTimer:
+    """Объект, который track_query отдает в блок with: в него записывают строки и байты результата."""
+    __slots__ = ("rows", "nbytes")
+
+    def __init__(self):
+        self.rows = 0
+        self.nbytes = 0
+
+
+@contextmanager
+def track_query(sql, source="asyncpg"):
+    """
+    Замеряет время выполнения блока и записывает его в статистику запроса sql.
+        with track_query(sql) as timer:
+            records = await conn.fetch(sql)
+            timer.rows = len(records)
+    """
+    timer = QueryTimer()
+    error = None
+    start = time.perf_counter()
+    try:
+        yield timer
+    except BaseException as e:
+        error = e
+        raise
+    finally:
+        record_query(sql, time.perf_counter() - start, timer.rows, timer.nbytes,
+                     pool_wait_var.get(), error, source)
+
+
+def rows_from_status(status):
+    """Количество строк из статуса команды asyncpg ("INSERT 0 5", "DELETE 3", ...)."""
+    if status:
+        tail = status.rsplit(" ", 1)[-1]
+        if tail.isdigit():
+            return int(tail)
+    return 0
+
+
+def get_query_stats(sort_by="total_time", limit=None):
+    """Агрегированная статистика по выражениям, отсортированная по убыванию sort_by."""
+    with _lock:
+        items = [stats.as_dict(statement) for statement, stats in _stats.items()]
+    items.sort(key=lambda item: item[sort_by], reverse=True)
+    return items[:limit] if limit else items
+
+
+def get_slow_queries():
+    with _lock:
+        return list(_slow_queries)
+
+
+def reset_query_stats():
+    with _lock:
+        _stats.clear()
+        _slow_queries.clear()
+
+
+def dump_query_stats(path):
+    """Записывает статистику и журнал медленных запросов в JSON файл."""
+    data = {
+        "generated_at": datetime.now().isoformat(timespec="seconds"),
+        "slow_query_threshold": SLOW_QUERY_THRESHOLD,
+        "statements": get_query_stats(),
+        "slow_queries": get_slow_queries(),
+    }
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+
+def start_periodic_dump(path, interval=QUERY_STATS_DUMP_INTERVAL):
+    """Каждые interval секунд сбрасывает статистику в path (фоновый поток). Повторный вызов перезапускает."""
+    global _dump_stop
+    stop_periodic_dump()
+    stop = threading.Event()
+
+    def run():
+        while not stop.wait(interval):
+            try:
+                dump_query_stats(path)
+            except Exception as e:
+                logger.error("Не удалось сохранить статистику запросов в %s: %s", path, e)
+
+    threading.Thread(target=run, name="pg-stats-dump", daemon=True).start()
+    _dump_stop = (stop, path)
+    return stop
+
+
+@atexit.register
+def stop_periodic_dump():
+    """Останавливает периодический сброс и записывает статистику в последний раз."""
+    global _dump_stop
+    if _dump_stop is not None:
+        stop, path = _dump_stop
+        _dump_stop = None
+        stop.set()
+        try:
+            dump_query_stats(path)
+        except Exception as e:
+            logger.error("Не удалось сохранить статистику запросов в %s: %s", path, e)
+
+
+# --- psycopg2 ---
+_cursor_class = None
+
+
+def psycopg2_cursor_factory():
+    """Класс курсора psycopg2, который записывает статистику execute/executemany/copy_expert."""
+    global _cursor_class
+    if _cursor_class is None:
+        import psycopg2.extensions
+
+        class InstrumentedCursor(psycopg2.extensions.cursor):
+            def execute(self, query, vars=None):
+                with track_query(str(query), source="psycopg2") as timer:
+                    result = super().execute(query, vars)
+                    timer.rows = max(self.rowcount, 0)
+                return result
+
+            def executemany(self, query, vars_list):
+                with track_query(str(query), source="psycopg2") as timer:
+                    result = super().executemany(query, vars_list)
+                    timer.rows = max(self.rowcount, 0)
+                return result
+
+            def copy_expert(self, sql, file, size=8192):
+                with track_query(str(sql), source="psycopg2") as timer:
+                    result = super().copy_expert(sql, file, size)
+                    timer.rows = max(self.rowcount, 0)
+                return result
+
+        _cursor_class = InstrumentedCursor
+    return _cursor_class
+
+
+# --- SQLAlchemy ---
+def instrument_sqlalchemy_engine(engine):
+    """Подключает запись статистики к событиям выполнения запросов движка SQLAlchemy."""
+    from sqlalchemy import event
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start_time", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        start = conn.info["query_start_time"].pop()
+        record_query(statement, time.perf_counter() - start, max(cursor.rowcount, 0), source="sqlalchemy")
+
+    @event.listens_for(engine, "handle_error")
+    def handle_error(context):
+        starts = context.connection.info.get("query_start_time") if context.connection else None
+        if starts:
+            record_query(context.statement or "", time.perf_counter() - starts.pop(),
+                         error=context.original_exception, source="sqlalchemy")
+
+
+if QUERY_STATS_FILE:
+    start_periodic_dump(QUERY_STATS_FILE)
@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+"""
+Кэш результатов запросов на чтение для AsyncPostgresql.
+
+Ключ - нормализованный текст SQL + аргументы. У каждой записи свой срок жизни (TTL),
+общий объем кэша ограничен в байтах, при переполнении вытесняются давно не использованные
+записи (LRU). Записи привязаны к таблицам из запроса и сбрасываются при записи в эти таблицы.
+"""
+
+import os
+import pickle
+import re
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+QUERY_CACHE_MAX_BYTES = int(os.getenv("PG_QUERY_CACHE_MAX_BYTES", 64 * 2 ** 20))
+QUERY_CACHE_TTL = float(os.getenv("PG_QUERY_CACHE_TTL", 300))
+
+# таблицы, из которых читает запрос
+_READ_TABLES = re.compile(r"\b(?:from|join)\s+([a-z_][\w.]*)", re.IGNORECASE)
+# таблицы, в которые пишет запрос
+_WRITE_TABLES = re.compile(
+    r"\b(?:insert\s+into|update|delete\s+from|truncate(?:\s+table)?|copy)\s+(?:only\s+)?([a-z_][\w.]*)",
+    re.IGNORECASE,
+)
+
+
+def normalize_sql(sql):
+    """Убирает лишние пробелы, переводы строк и завершающую ';'."""
+    return " ".join(sql.split()).rstrip(";").strip()
+
+
+def _table_key(name):
+    # public.t_table и t_table - одна и та же таблица для целей инвалидации
+    return name.lower().rsplit(".", 1)[-1]
+
+
+def tables_in_sql(sql):
+    return {_table_key(name) for name in _READ_TABLES.findall(sql)}
+
+
+def written_tables_in_sql(sql):
+    return {_table_key(name) for name in _WRITE_TABLES.findall(sql)}
+
+
+def estimate_size(value):
+    """Примерный размер значения в байтах."""
+    if hasattr(value, "memory_usage"):  # DataFrame
+        return int(value.memory_usage(deep=True).sum())
+    try:
+        return len(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+    except Exception:
+        return sys.getsizeof(value)
+
+
+def _copy_value(value):
+    # DataFrame изменяемый: отдаем копию, чтобы вызывающий код не испортил закэшированное значение
+    if hasattr(value, "memory_usage"):
+        return value.copy()
+    return value
+
+
+class QueryCache:
+    """LRU кэш с TTL записей и ограничением по суммарному размеру в байтах."""
+
+    def __init__(self, max_bytes=QUERY_CACHE_MAX_BYTES, default_ttl=QUERY_CACHE_TTL):
+        self.max_bytes = max_bytes
+        self.default_ttl = default_ttl
+        self._entries = OrderedDict()  # ключ -> (значение, размер, истекает, таблицы)
+        self._keys_by_table = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def make_key(kind, sql, args):
+        return kind, normalize_sql(sql), repr(args)
+
+    def get(self, key):
+        """Возвращает (True, значение) при попадании и (False, None) при промахе."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return False, None
+            if entry[2] < time.monotonic():
+                self._remove(key)
+                self.expirations += 1
+                self.misses += 1
+                return False, None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return True, _copy_value(entry[0])
+
+    def put(self, key, value, tables=(), ttl=None):
+        size = estimate_size(value)
+        if size > self.max_bytes:
+            return
+        expires_at = time.monotonic() + (ttl if ttl is not None else self.default_ttl)
+        tables = frozenset(tables)
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (_copy_value(value), size, expires_at, tables)
+            self._bytes += size
+            for table in tables:
+                self._keys_by_table.setdefault(table, set()).add(key)
+            while self._bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def invalidate_table(self, table_name):
+        """Удаляет все записи, прочитанные из таблицы. Возвращает количество удаленных."""
+        with self._lock:
+            keys = self._keys_by_table.pop(_table_key(table_name), set())
+            removed = 0
+            for key in keys:
+                if key in self._entries:
+                    self._remove(key)
+                    removed += 1
+            self.invalidations += removed
+            return removed
+
+    def invalidate_sql(self, sql):
+        """Сбрасывает записи по всем таблицам, в которые пишет запрос."""
+        return sum(self.invalidate_table(table) for table in written_tables_in_sql(sql))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._keys_by_table.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+            }
+
+    def _remove(self, key):
+        _, size, _, tables = self._entries.pop(key)
+        self._bytes -= size
+        for table in tables:
+            keys = self._keys_by_table.get(table)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._keys_by_table[table]
+
+
+# общий кэш процесса, используется функциями AsyncPostgresql
+query_cache = QueryCache()
@@ -2,7 +2,10 @@
 # https://www.rkengler.com/how-to-capture-network-traffic-when-scraping-with-selenium-and-python/
 
 import json
+import os
 import re
+from collections import deque
+from weakref import WeakKeyDictionary
 
 from selenium.webdriver.common.desired_capabilities import DesiredCapabilities
 
@@ -10,6 +13,8 @@ capabilities = DesiredCapabilities.CHROME
 # capabilities["loggingPrefs"] = {"performance": "ALL"}  # chromedriver < ~75
 capabilities["goog:loggingPrefs"] = {"performance": "ALL"}  # chromedriver 75+
 
+TOKEN_HOST = os.getenv("TAX_CABINET_HOST", "cabinet.tax.gov.ua")
+
 
 def process_browser_logs_for_network_events(logs):
     """
@@ -35,24 +40,83 @@ def get_token(logs):
     return None
 
 
+class BearerTokenCapture:
+    """
+    Streaming search of the Bearer token in the "performance" log of one browser.
+
+    driver.get_log("performance") returns only the entries added since the previous call,
+    so every entry is seen once: entries are checked by raw substrings first and only
+    Network.requestWillBeSent(ExtraInfo) entries for TOKEN_HOST with a Bearer header are parsed.
+    The search stops at the first valid token; entries after it stay queued for the next poll.
+    """
+
+    def __init__(self, host=TOKEN_HOST):
+        self.host = host
+        self.pending = deque()
+        self.stats = {"entries": 0, "parsed": 0}
+
+    def is_token_request(self, message):
+        # cheap substring checks on the raw JSON before json.loads
+        # (the prefix also matches Network.requestWillBeSentExtraInfo with the headers actually sent)
+        return ('"Network.requestWillBeSent' in message
+                and self.host in message
+                and message.count("Bearer ") > message.count("Bearer undefined"))
+
+    def token_from_message(self, message):
+        log = json.loads(message)["message"]
+        params = log.get("params", {})
+        if log.get("method") == "Network.requestWillBeSent":
+            request = params.get("request", {})
+            url, headers = request.get("url", ""), request.get("headers", {})
+        elif log.get("method") == "Network.requestWillBeSentExtraInfo":
+            headers = params.get("headers", {})
+            url = headers.get(":authority") or headers.get("Host") or headers.get("host") or ""
+        else:
+            return None
+        if self.host not in url:
+            return None
+        for name, value in headers.items():
+            if name.lower() == "authorization" and value.startswith("Bearer ") and value != "Bearer undefined":
+                return value
+        return None
+
+    def poll(self, driver):
+        """Reads the new log entries and returns the first token found or None."""
+        self.pending.extend(driver.get_log("performance"))
+        while self.pending:
+            message = self.pending.popleft()["message"]
+            self.stats["entries"] += 1
+            if not self.is_token_request(message):
+                continue
+            self.stats["parsed"] += 1
+            token = self.token_from_message(message)
+            if token:
+                return token
+        return None
+
+    def reset(self, driver=None):
+        """Forgets queued entries (and the entries accumulated in the browser log), e.g. before a new login."""
+        self.pending.clear()
+        if driver is not None:
+            driver.get_log("performance")
+
+
+_captures = WeakKeyDictionary()
+
+
+def get_token_capture(driver):
+    capture = _captures.get(driver)
+    if capture is None:
+        capture = _captures[driver] = BearerTokenCapture()
+    return capture
+
+
 def get_bearer_token(driver):
-    logs = driver.get_log("performance")
-    network_logs = process_browser_logs_for_network_events(logs)
-    token = get_token(logs)
-    if token:
-        return token
-
-    for log in network_logs:
-        try:
-            auth = log.get('params').get('headers').get('Authorization')
-            if auth is not None and auth != "Bearer undefined" and 'Bearer' in auth:
-                return auth
-        except:
-            continue
-    auth = find_authorization_dict(logs)
-    if auth:
-        return auth
-    return None
+    return get_token_capture(driver).poll(driver)
+
+
+def reset_bearer_token(driver):
+    get_token_capture(driver).reset(driver)
 
 
 def find_authorization_dict(data):
@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+"""
+Время импорта скриптов (как python -X importtime): для каждого модуля из ENTRY_POINTS запускается
+отдельный интерпретатор, из отчета importtime берется общее время импорта модуля и самые
+тяжелые вложенные импорты.
+
+С ключом --check время сравнивается с бюджетом (ENTRY_POINTS, мс) и при превышении
+скрипт завершается с кодом 1 - так проверяется, что в модулях не появились тяжелые импорты
+и побочные действия при импорте (подключения, запуск браузера, запросы в сеть).
+
+Запуск: python StartupProfiler.py [модуль ...] [--check] [--top N] [--repeat N]
+"""
+
+import argparse
+import os
+import re
+import subprocess
+import sys
+from functools import lru_cache
+
+CUR_DIR = os.path.dirname(os.path.abspath(__file__))
+STARTUP_BUDGET_SCALE = float(os.getenv("STARTUP_BUDGET_SCALE", 1.0))  # множитель бюджетов для медленных машин
+
+# модуль -> бюджет времени импорта, мс
+ENTRY_POINTS = {
+    "LazyImport": 20,
+    "ChangeKeyBoard": 30,
+    "ChromeDriverUpdater": 300,
+    "AsyncPostgresql": 300,
+    "TaxGovUaConfig": 1000,
+    "pdf_tax_gov_ua_erpn_block": 1000,
+    "InboxHarvester": 1000,
+    "pdf_downloader_medoc": 1000,
+    "pdf_downloader_edin": 500,
+}
+
+IMPORTTIME_LINE = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+
+def parse_importtime(stderr):
+    """Строки отчета -X importtime -> список (модуль, собственное время, общее время, вложенность), мкс."""
+    entries = []
+    for line in stderr.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            entries.append((name, int(self_us), int(cumulative_us), (len(indent) - 1) // 2))
+    return entries
+
+
+def _run_importtime(code):
+    return subprocess.run([sys.executable, "-X", "importtime", "-c", code],
+                          cwd=CUR_DIR, capture_output=True, text=True, encoding="utf-8", errors="replace")
+
+
+@lru_cache(maxsize=None)
+def interpreter_modules():
+    """Модули, которые интерпретатор импортирует при запуске, - их нет смысла показывать в отчете."""
+    return frozenset(entry[0] for entry in parse_importtime(_run_importtime("pass").stderr))
+
+
+def profile_import(module, top=5):
+    """
+    Импортирует module в отдельном интерпретаторе.
+    Возвращает {"module", "ms", "top", "error"}: время импорта module с вложенными импортами и
+    самые тяжелые по собственному времени импорты.
+    """
+    result = _run_importtime(f"import {module}")
+    entries = [entry for entry in parse_importtime(result.stderr) if entry[0] not in interpreter_modules()]
+    own = [entry for entry in entries if entry[0] == module and entry[3] == 0]
+    error = None
+    if result.returncode != 0:
+        lines = [line for line in result.stderr.splitlines() if line and not line.startswith("import time:")]
+        error = lines[-1] if lines else f"код завершения {result.returncode}"
+    heaviest = sorted(entries, key=lambda entry: -entry[1])[:top]
+    return {
+        "module": module,
+        "ms": own[-1][2] / 1000 if own else None,
+        "top": [(name, self_us / 1000) for name, self_us, _, _ in heaviest],
+        "error": error,
+    }
+
+
+def profile_entry_points(modules, repeat=1, top=5):
+    """Лучшее (минимальное) время из repeat запусков для каждого модуля."""
+    reports = []
+    for module in modules:
+        runs = [profile_import(module, top) for _ in range(repeat)]
+        timed = [run for run in runs if run["ms"] is not None]
+        reports.append(min(timed, key=lambda run: run["ms"]) if timed else runs[-1])
+    return reports
+
+
+def print_report(reports, check=False):
+    failed = []
+    for report in reports:
+        budget = ENTRY_POINTS.get(report["module"])
+        budget = budget * STARTUP_BUDGET_SCALE if budget else None
+        if report["error"]:
+            status = f"❌ ошибка: {report['error']}"
+            failed.append(report["module"])
+        elif report["ms"] is None:
+            # модуль уже был импортирован при запуске интерпретатора или имя не совпало с отчетом importtime
+            status = "❌ нет времени импорта модуля в отчете -X importtime"
+            failed.append(report["module"])
+        elif budget and report["ms"] > budget:
+            status = f"❌ больше бюджета {budget:.0f} мс"
+            failed.append(report["module"])
+        else:
+            status = f"✅ бюджет {budget:.0f} мс" if budget else ""
+        ms = f"{report['ms']:8.1f} мс" if report["ms"] is not None else "       - мс"
+        print(f"{report['module']:<28} {ms}  {status}")
+        for name, self_ms in report["top"]:
+            print(f"    {name:<40} {self_ms:8.1f} мс")
+    if check and failed:
+        print(f"Превышено время импорта или ошибка импорта: {', '.join(failed)}")
+        return False
+    return True
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Время импорта скриптов")
+    arg_parser.add_argument("modules", nargs="*", help="модули (по умолчанию все из ENTRY_POINTS)")
+    arg_parser.add_argument("--check", action="store_true", help="код 1 при превышении бюджета")
+    arg_parser.add_argument("--top", type=int, default=5, help="сколько самых тяжелых импортов показать")
+    arg_parser.add_argument("--repeat", type=int, default=3, help="запусков на модуль, берется лучший")
+    args = arg_parser.parse_args()
+
+    entry_reports = profile_entry_points(args.modules or list(ENTRY_POINTS), args.repeat, args.top)
+    sys.exit(0 if print_report(entry_reports, args.check) else 1)
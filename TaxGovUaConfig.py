@@ -1,15 +1,13 @@
 import os
+import re
 import time
+from datetime import datetime
+from decimal import Decimal
+from functools import lru_cache, partial
 from pathlib import Path
-import keyboard
 from dotenv import load_dotenv
 import psutil
-import pyautogui
-import pyperclip
 from dateutil import parser
-from ping3 import ping
-from pywinauto.application import Application
-from pywinauto.findwindows import find_windows
 from selenium import webdriver
 from selenium.common.exceptions import (
     NoSuchElementException,
@@ -17,84 +15,79 @@ from selenium.common.exceptions import (
     ElementClickInterceptedException,
     TimeoutException,
 )
-from selenium.webdriver.chrome.options import Options
 from selenium.webdriver.chrome.service import Service
 from selenium.webdriver.common.by import By
+from selenium.webdriver.common.keys import Keys
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.support.ui import WebDriverWait
 
 from AsyncPostgresql import con_postgres_psycopg2
+from BrowserDownloads import build_chrome_options, download_via_click
+from BrowserPool import BrowserPool, capture_auth_state, page_ranges
+from BrowserWaits import (
+    install_network_tracker,
+    wait_clickable,
+    wait_invisible,
+    wait_network_idle,
+    wait_present,
+    wait_text_changed,
+    wait_until,
+    wait_url_changed,
+    wait_url_is,
+)
 from ChangeKeyBoard import set_keyboard_layout
-from ScrapeWithLogs import get_bearer_token
-
-# Импортируем модуль для автоматического обновления ChromeDriver
-try:
-    from ChromeDriverUpdater import update_chromedriver_if_needed
-    # Проверяем и обновляем ChromeDriver при необходимости
-    update_chromedriver_if_needed()
-except Exception as e:
-    print(f"Ошибка при обновлении ChromeDriver: {e}")
+from LazyImport import lazy_import
+from ScrapeWithLogs import get_bearer_token, reset_bearer_token
+
+# Модули для работы с окнами Windows и клавиатурой нужны только при входе и закрытии диалогов,
+# поэтому загружаются при первом обращении
+keyboard = lazy_import("keyboard")
+# Отключаем защиту от выхода курсора за пределы экрана
+pyautogui = lazy_import("pyautogui", on_load=lambda module: setattr(module, "FAILSAFE", False))
+pyperclip = lazy_import("pyperclip")
+ping3 = lazy_import("ping3")
+pywinauto_application = lazy_import("pywinauto.application")
+pywinauto_findwindows = lazy_import("pywinauto.findwindows")
 
 cur_dir = os.path.dirname(os.path.abspath(__file__))
-pyautogui.FAILSAFE = False  # Отключаем защиту от выхода курсора за пределы экрана
 chrome_driver_path = os.path.join(Path(cur_dir).parent.__str__(), "chromedriver-win64", "chromedriver.exe")
-set_keyboard_layout()  # Меняем раскладку клавиатуры на английскую
-
-# Настройка ChromeOptions
-chrome_options = Options()
-
-# Отключаем Google APIs и связанные сервисы для устранения ошибок API
-chrome_options.add_argument("--disable-background-networking")
-chrome_options.add_argument("--disable-background-timer-throttling")
-chrome_options.add_argument("--disable-backgrounding-occluded-windows")
-chrome_options.add_argument("--disable-breakpad")
-chrome_options.add_argument("--disable-client-side-phishing-detection")
-chrome_options.add_argument("--disable-component-extensions-with-background-pages")
-chrome_options.add_argument("--disable-default-apps")
-chrome_options.add_argument("--disable-dev-shm-usage")
-chrome_options.add_argument("--disable-extensions")
-chrome_options.add_argument("--disable-features=TranslateUI")
-chrome_options.add_argument("--disable-hang-monitor")
-chrome_options.add_argument("--disable-ipc-flooding-protection")
-chrome_options.add_argument("--disable-popup-blocking")
-chrome_options.add_argument("--disable-prompt-on-repost")
-chrome_options.add_argument("--disable-renderer-backgrounding")
-chrome_options.add_argument("--disable-sync")
-chrome_options.add_argument("--disable-web-security")
-chrome_options.add_argument("--no-default-browser-check")
-chrome_options.add_argument("--no-first-run")
-chrome_options.add_argument("--no-sandbox")
-chrome_options.add_argument("--disable-gpu")
-
-
-# Отключаем логирование для уменьшения количества сообщений
-chrome_options.add_argument("--log-level=3")
-chrome_options.add_argument("--silent")
-
-# Отключаем Google Cloud Messaging (GCM) для устранения PHONE_REGISTRATION_ERROR
-chrome_options.add_experimental_option("excludeSwitches", ["enable-automation"])
-chrome_options.add_experimental_option('useAutomationExtension', False)
-
-# Отключаем уведомления и другие сервисы
-prefs = {
-    "profile.default_content_setting_values.notifications": 2,
-    "profile.default_content_settings.popups": 0,
-    "profile.managed_default_content_settings.images": 2,
-    "credentials_enable_service": False,
-    "profile.password_manager_enabled": False
-}
-chrome_options.add_experimental_option("prefs", prefs)
 
 load_dotenv()
 
-# Путь к драйверу Chrome
-service = Service(chrome_driver_path)
+
+@lru_cache(maxsize=None)
+def prepare_chromedriver():
+    # Проверяем и обновляем ChromeDriver при необходимости - один раз, перед первым запуском браузера
+    try:
+        from ChromeDriverUpdater import update_chromedriver_if_needed
+        update_chromedriver_if_needed()
+    except Exception as e:
+        print(f"Ошибка при обновлении ChromeDriver: {e}")
+
+
+def create_driver(headless=False):
+    """Запускает Chrome с настройками кабинета (загрузки без окна "Сохранить как", см. BrowserDownloads)."""
+    prepare_chromedriver()
+    return webdriver.Chrome(service=Service(chrome_driver_path), options=build_chrome_options(headless=headless))
+
+
+# chrome_options и service (путь к драйверу Chrome) создаются при первом обращении
+_LAZY_ATTRIBUTES = {
+    "chrome_options": build_chrome_options,
+    "service": lambda: Service(chrome_driver_path),
+}
+
+
+def __getattr__(name):
+    if name in _LAZY_ATTRIBUTES:
+        return _LAZY_ATTRIBUTES[name]()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 def close_dialog_if_open():
     try:
         # Подключение к приложению (замените 'chrome.exe' на имя вашего браузера или приложения)
-        app = Application().connect(path=chrome_driver_path)
+        app = pywinauto_application.Application().connect(path=chrome_driver_path)
 
         # Получение окна диалога (замените 'Открытие' на заголовок вашего окна диалога)
         dialog = app.window(title="Открытие")
@@ -139,7 +132,8 @@ def get_token(driver=None, token=None, count=1):
         driver.delete_all_cookies()
         driver.execute_script("window.localStorage.clear();")
         driver.execute_script("window.sessionStorage.clear();")
-
+        # токен прежней сессии из журнала браузера больше не нужен
+        reset_bearer_token(driver)
 
     # если открыто окно выбора файла, то закрываем его
     close_dialog_if_open()
@@ -152,12 +146,14 @@ def get_token(driver=None, token=None, count=1):
                 pass
 
             # Запускаем браузер
-            driver = webdriver.Chrome(service=service, options=chrome_options)
+            driver = create_driver()
             if site_is_available(driver):
                 authorize(driver)
 
         # refresh_screen(driver)
-        token = get_bearer_token(driver)
+        # ждем первый запрос сайта с токеном; прежняя пауза 5 * count стала верхней границей ожидания
+        token = wait_until(lambda: get_bearer_token(driver), timeout=5 * count, name="bearer_token",
+                           raise_on_timeout=False)
         if token:
             return driver, token
 
@@ -170,35 +166,181 @@ def get_token(driver=None, token=None, count=1):
                 driver = None
             except Exception as e:
                 pass
-        time.sleep(5 * count)
         count += 1
 
     return None, None
 
 
+TABLE_ROWS_XPATH = "//tbody[@class='p-datatable-tbody']/tr"
+PAGE_TIMEOUT = 15  # сек ожидания загрузки следующей страницы таблицы
+
+# Вся таблица за один вызов WebDriver: заголовки и текст ячеек строк, найденных по XPath
+JS_TABLE_DATA = """
+const snapshot = document.evaluate(arguments[0], document, null, XPathResult.ORDERED_NODE_SNAPSHOT_TYPE, null);
+const rows = [];
+for (let i = 0; i < snapshot.snapshotLength; i++) {
+    rows.push(Array.from(snapshot.snapshotItem(i).querySelectorAll('td'), td => td.innerText.trim()));
+}
+const table = snapshot.snapshotLength ? snapshot.snapshotItem(0).closest('table') : null;
+const headers = table ? Array.from(table.querySelectorAll('thead th'), th => th.innerText.trim()) : [];
+return {headers: headers, rows: rows};
+"""
+
+# Все страницы таблицы за один вызов: перелистывание пагинатором и ожидание новой страницы идут в браузере
+JS_TABLE_DATA_ALL_PAGES = """
+const [xpath, maxPages, pageTimeout, done] = arguments;
+const currentPage = () => {
+    const el = document.querySelector('.p-paginator-page.p-highlight');
+    return el ? parseInt(el.innerText, 10) : 1;
+};
+const isLoading = () => document.querySelector('.p-datatable-loading-overlay') !== null;
+const readRows = () => {
+    const snapshot = document.evaluate(xpath, document, null, XPathResult.ORDERED_NODE_SNAPSHOT_TYPE, null);
+    const rows = [];
+    for (let i = 0; i < snapshot.snapshotLength; i++) {
+        rows.push(Array.from(snapshot.snapshotItem(i).querySelectorAll('td'), td => td.innerText.trim()));
+    }
+    return rows;
+};
+const waitForPage = (previousPage) => new Promise((resolve, reject) => {
+    const started = Date.now();
+    const check = () => {
+        if (currentPage() !== previousPage && !isLoading()) return resolve();
+        if (Date.now() - started > pageTimeout) return reject(new Error('page ' + previousPage + ': timeout'));
+        setTimeout(check, 50);
+    };
+    check();
+});
+(async () => {
+    const rows = [];
+    try {
+        for (let n = 0; n < maxPages; n++) {
+            const page = currentPage();
+            for (const cells of readRows()) rows.push([page, cells]);
+            const next = document.querySelector('.p-paginator-next');
+            if (!next || next.disabled || next.classList.contains('p-disabled')) break;
+            next.click();
+            await waitForPage(page);
+        }
+        done({rows: rows, error: null});
+    } catch (e) {
+        done({rows: rows, error: String(e)});
+    }
+})();
+"""
+
+DATE_PATTERN = re.compile(r"^\d{2}\.\d{2}\.\d{4}$")
+DATETIME_PATTERN = re.compile(r"^\d{2}\.\d{2}\.\d{4} \d{2}:\d{2}(:\d{2})?$")
+AMOUNT_PATTERN = re.compile(r"^-?\d[\d\s]*[.,]\d{1,2}$")
+
+
+def extract_table(driver, table_xpath=TABLE_ROWS_XPATH):
+    """Заголовки и строки (списки текстов ячеек) текущей страницы таблицы одним execute_script."""
+    data = driver.execute_script(JS_TABLE_DATA, table_xpath)
+    return data["headers"], data["rows"]
+
+
 # Функция для получения данных с текущей страницы
 def get_table_data(driver, page_number, table_xpath):
-    rows = driver.find_elements(By.XPATH, table_xpath)
-    data_all = []
-    for row in rows:
-        data = []
-        cells = row.find_elements(By.TAG_NAME, "td")
-        for cell in cells[1:]:  # Проходимся по всем элементам, кроме последнего
-            try:
-                data.append(cell.text)
-                # print(f"cells'{cell.text}'")
-            except StaleElementReferenceException:
-                # Повторно находим элемент, если он устарел
-                cell = driver.find_element(By.XPATH, cell.get_attribute("xpath"))
-                data.append(cell.text)
-                # print(cell.text)
-        # print("-" * 20)  # Разделитель между строками
-        if data:
-            data.insert(0, page_number)
-            data_all.append(data)
-
-    time.sleep(1)  # Небольшая задержка для стабильности
-    return data_all
+    # [номер страницы, ячейки со второй...] для каждой непустой строки
+    _, rows = extract_table(driver, table_xpath)
+    return [[page_number] + cells[1:] for cells in rows if cells[1:]]
+
+
+def extract_table_all_pages(driver, table_xpath=TABLE_ROWS_XPATH, max_pages=1000, page_timeout=PAGE_TIMEOUT):
+    """
+    [номер страницы, ячейки] всех страниц, начиная с текущей. Таблица листается пагинатором
+    внутри страницы (execute_async_script), без вызовов WebDriver на каждую страницу.
+    """
+    driver.set_script_timeout(max_pages * page_timeout + 30)
+    data = driver.execute_async_script(JS_TABLE_DATA_ALL_PAGES, table_xpath, max_pages, page_timeout * 1000)
+    if data["error"]:
+        print(f"Таблица прочитана не полностью: {data['error']}")
+    return data["rows"]
+
+
+def get_table_data_all_pages(driver, table_xpath=TABLE_ROWS_XPATH, max_pages=1000, page_timeout=PAGE_TIMEOUT):
+    """Данные всех страниц, начиная с текущей, в формате get_table_data."""
+    rows = extract_table_all_pages(driver, table_xpath, max_pages, page_timeout)
+    return [[page] + cells[1:] for page, cells in rows if cells[1:]]
+
+
+def parse_cell(text):
+    """Текст ячейки -> date/datetime/Decimal по формату, иначе строка (коды с ведущими нулями не меняются)."""
+    if not text:
+        return None
+    if DATE_PATTERN.match(text):
+        return datetime.strptime(text, "%d.%m.%Y").date()
+    if DATETIME_PATTERN.match(text):
+        return datetime.strptime(text, "%d.%m.%Y %H:%M:%S" if text.count(":") == 2 else "%d.%m.%Y %H:%M")
+    if AMOUNT_PATTERN.match(text):
+        return Decimal(re.sub(r"\s", "", text).replace(",", "."))
+    return text
+
+
+def table_records(headers, rows, converters=None, page_numbers=None):
+    """
+    Строки таблицы -> список dict {заголовок: значение} для загрузки в БД (upsert_rows_async, copy_df_to_table).
+    converters - {заголовок: функция(текст)} для колонок, где не подходит parse_cell.
+    """
+    converters = converters or {}
+    keys = [header or f"column_{i}" for i, header in enumerate(headers)]
+    records = []
+    for n, cells in enumerate(rows):
+        record = {key: converters.get(key, parse_cell)(cell) for key, cell in zip(keys, cells)}
+        if page_numbers is not None:
+            record["page_number"] = page_numbers[n]
+        records.append(record)
+    return records
+
+
+def get_table_records(driver, table_xpath=TABLE_ROWS_XPATH, all_pages=False, converters=None):
+    """Типизированные записи таблицы: текущей страницы или (all_pages=True) всех страниц, начиная с текущей."""
+    headers, rows = extract_table(driver, table_xpath)
+    if not all_pages:
+        return table_records(headers, rows, converters)
+    rows = extract_table_all_pages(driver, table_xpath)
+    return table_records(headers, [cells for _, cells in rows], converters, [page for page, _ in rows])
+
+
+def read_page_range(driver, pages, table_xpath=TABLE_ROWS_XPATH, last_page=None):
+    """
+    Данные страниц pages (range) таблицы входящих в формате get_table_data.
+    Браузер сразу переходит на первую страницу диапазона (go_to_page) и читает только свои страницы.
+    """
+    driver.get("https://cabinet.tax.gov.ua/documents/in")
+    wait_present(driver, (By.XPATH, table_xpath), timeout=PAGE_TIMEOUT)
+    if not go_to_page(driver, pages.start, last_page):
+        raise ValueError(f"Не удалось перейти на страницу {pages.start}")
+    return get_table_data_all_pages(driver, table_xpath, max_pages=len(pages))
+
+
+def last_page_number(driver):
+    """Номер последней страницы таблицы входящих (браузер не закрывается, в отличие от get_max_page_number)."""
+    driver.get("https://cabinet.tax.gov.ua/documents/in")
+    wait_clickable(driver, (By.CSS_SELECTOR, ".p-paginator-icon.pi.pi-angle-double-right")).click()
+    wait_network_idle(driver)
+    return int(wait_present(driver, (By.CSS_SELECTOR, ".p-paginator-page.p-highlight")).text)
+
+
+def get_table_data_parallel(driver, workers=4, max_page_number=None, table_xpath=TABLE_ROWS_XPATH):
+    """
+    Данные всех страниц таблицы входящих, прочитанные параллельно workers браузерами без окна.
+    driver - авторизованный браузер, его cookies и storage переносятся в браузеры пула.
+    Страницы делятся на непрерывные диапазоны (по два на браузер), результат - в порядке страниц.
+    """
+    if max_page_number is None:
+        max_page_number = last_page_number(driver)
+    pool = BrowserPool(
+        workers=workers,
+        auth_state=capture_auth_state(driver),
+        driver_factory=lambda: create_driver(headless=True),
+    )
+    chunks = pool.map(partial(read_page_range, table_xpath=table_xpath, last_page=max_page_number),
+                      page_ranges(max_page_number, workers * 2))
+    if pool.errors:
+        print(f"Не прочитано диапазонов страниц: {len(pool.errors)}")
+    return [row for chunk in chunks if chunk for row in chunk]
 
 
 def get_table_data_all(driver, table_xpath="//tbody[@class='p-datatable-tbody']/tr"):
@@ -244,13 +386,13 @@ def get_table_data_all(driver, table_xpath="//tbody[@class='p-datatable-tbody']/
 
                 # Ожидание загрузки страницы после возврата
                 wait.until(EC.presence_of_all_elements_located((By.XPATH, table_xpath)))
-                time.sleep(1)  # Небольшая задержка для стабильности
+                wait_network_idle(driver)
 
             break  # Останавливаем цикл, когда все строки обработаны
 
         except Exception as e:
             # print(f"Ошибка при загрузке таблицы или обработке данных: {e}")
-            time.sleep(1)
+            wait_network_idle(driver, timeout=1)
             if driver.current_url != "https://cabinet.tax.gov.ua/documents/in":
                 driver.back()
 
@@ -270,21 +412,16 @@ def click_element_by_xpath(driver, xpath):
         element.click()
 
         # Ожидание нового состояния страницы
-        WebDriverWait(driver, 1).until(
-            EC.presence_of_element_located((By.XPATH, "//div[@class='new-content']"))
-        )
+        wait_network_idle(driver, timeout=1)
 
     except ElementClickInterceptedException:
         # print(
         #     f"ElementClickInterceptedException: Элемент с XPath {xpath} перекрыт другим элементом. повторяем клик."
         # )
-        time.sleep(1)  # Небольшая задержка для стабильности
-
-        # Повторно находим элемент и кликаем на него с помощью JavaScript
-        # element = driver.find_element(By.XPATH, xpath)
-        # Если элемент перекрыт другим элементом, выполняем повторную попытку клика
-        time.sleep(1)  # Небольшая задержка
-        element = WebDriverWait(driver, 10).until(EC.element_to_be_clickable((By.XPATH, xpath)))
+        # Если элемент перекрыт другим элементом (например, оверлеем загрузки),
+        # ждем, пока перекрытие исчезнет, и кликаем через JavaScript
+        wait_invisible(driver, (By.CLASS_NAME, "p-blockui-document"), raise_on_timeout=False)
+        element = wait_clickable(driver, (By.XPATH, xpath))
         driver.execute_script("arguments[0].click();", element)
 
     except TimeoutException:
@@ -305,31 +442,31 @@ def click_element_by_xpath(driver, xpath):
 
 def authorize(driver=None):
     try:
-        if ping("tax.gov.ua") is None:
+        if ping3.ping("tax.gov.ua") is None:
             print("Сайт tax.gov.ua недоступен.")
             return False
 
         if not driver:
             # Запускаем браузер
-            driver = webdriver.Chrome(service=service, options=chrome_options)
+            driver = create_driver()
+
+        set_keyboard_layout()  # Меняем раскладку клавиатуры на английскую (пароль к ключу вводится с клавиатуры)
 
         # Максимизируем окно браузера
         driver.maximize_window()
         url_login = "https://cabinet.tax.gov.ua/login"
 
         # Открываем сайт
+        install_network_tracker(driver)
         driver.get(url_login)
-        while not driver.current_url == url_login:
+        while not wait_url_is(driver, url_login, timeout=1, raise_on_timeout=False):
             refresh_screen(driver)
             driver.get(url_login)
             pyautogui.hotkey("esc")
-            time.sleep(1)
 
-        # Ожидаем, пока блокирующий элемент исчезнет
-        WebDriverWait(driver, 10).until(
-            EC.invisibility_of_element_located((By.CLASS_NAME, "p-blockui-document"))
-        )
-        time.sleep(2)
+        # Ожидаем, пока блокирующий элемент исчезнет и страница закончит загрузку
+        wait_invisible(driver, (By.CLASS_NAME, "p-blockui-document"))
+        wait_network_idle(driver)
 
         while True:
             pyautogui.hotkey("esc")
@@ -346,10 +483,10 @@ def authorize(driver=None):
                 driver, '//span[text()=\'КНЕДП ТОВ "Центр сертифікації ключів "Україна"\']'
             )
             pyautogui.hotkey("esc")
-            time.sleep(2)
 
             # вводим путь к файлу
             key_path = '//*[@id="keyStatusPanel"]/div/div[3]/div[2]/div/div/input'
+            wait_clickable(driver, (By.XPATH, key_path))
 
             while True:
                 pyautogui.hotkey("esc")
@@ -365,18 +502,17 @@ def authorize(driver=None):
 
                 # Копируем путь к файлу в буфер обмена
                 pyperclip.copy(file_path)
-                time.sleep(1)  # Небольшая задержка для стабильности
-
-                clipboard_content = pyperclip.paste()
-                if file_path == clipboard_content:
-                    time.sleep(1)
+                if wait_until(lambda: pyperclip.paste() == file_path, timeout=2, name="clipboard",
+                              raise_on_timeout=False):
                     break
 
-            time.sleep(1)  # Дополнительная задержка перед вставкой
+            # Вставляем путь, когда откроется окно выбора файла, и ждем его закрытия
+            wait_file_dialog(driver)
             # pyautogui.hotkey("ctrl", "v")
             keyboard.press_and_release('ctrl+v')
-            time.sleep(1)
             pyautogui.press("enter")
+            wait_until(lambda: not save_dialog_handles(driver), timeout=5, name="file_dialog_closed",
+                       raise_on_timeout=False)
 
             pyautogui.hotkey("esc")
             # Закрытие диалогового окна
@@ -396,19 +532,17 @@ def authorize(driver=None):
             pyautogui.hotkey("esc")
             pyautogui.hotkey("enter")
             refresh_screen(driver)
-            time.sleep(2)
+            wait_network_idle(driver)
 
         # Находим кнопку "Зчитати" и кликаем по ней
         read_button = driver.find_element(By.XPATH, "//span[text()='Зчитати']")
         read_button.click()
 
-        # Ожидаем пока прочитается файл
-        time.sleep(5)
-
-        # Находим кнопку "Увійти" и кликаем по ней
-        login_button = driver.find_element(By.XPATH, "//span[text()='Увійти']")
+        # Ожидаем пока прочитается файл: кнопка "Увійти" становится доступной
+        login_button = wait_clickable(driver, (By.XPATH, "//span[text()='Увійти']"), timeout=30)
+        wait_network_idle(driver)
         login_button.click()
-        time.sleep(1)
+        wait_url_changed(driver, url_login, timeout=30, raise_on_timeout=False)
         return True
     except NoSuchElementException as e:
         # print(f"страницы закончились: {e}")
@@ -509,21 +643,53 @@ def go_to_next_page(driver, page_xpath):
     return False, None
 
 
-def go_to_page(driver, page_number):
+PAGE_INPUT_CSS = ".p-paginator-page-input input"
+PAGE_BUTTONS_XPATH = "//span[contains(@class, 'p-paginator-pages')]/button"
+
+
+def _click_page_control(driver, element, current_page):
+    driver.execute_script("arguments[0].click();", element)
+    return wait_text_changed(driver, (By.CSS_SELECTOR, ".p-paginator-page.p-highlight"), current_page)
+
+
+def go_to_page(driver, page_number, last_page=None):
+    """
+    Переход сразу на страницу page_number без загрузки промежуточных страниц: через поле номера
+    страницы пагинатора, если оно есть, иначе кликом по кнопке с номером. Если кнопки с нужным
+    номером не видно (пагинатор показывает только соседние номера), кликается самая дальняя
+    видимая кнопка в сторону page_number, а если известен last_page и до конца ближе - поиск
+    начинается с последней страницы.
+    """
     try:
-        while True:
-            # Пример использования WebDriverWait для ожидания текущего номера страницы и получения его текста
-            current_page = WebDriverWait(driver, 10).until(
-                EC.presence_of_element_located((By.CSS_SELECTOR, ".p-paginator-page.p-highlight"))
-            ).text
-            if int(current_page) == page_number:
-                return True
-
-            # Кликаем на кнопку перехода на следующую страницу
-            button_path = "//button[@class='p-paginator-next p-paginator-element p-link p-ripple']"
-            next_button = WebDriverWait(driver, 10).until(EC.element_to_be_clickable((By.XPATH, button_path,)))
-            next_button.click()
-            time.sleep(0.5)  # Небольшая задержка для стабильности
+        current_page = WebDriverWait(driver, 10).until(
+            EC.presence_of_element_located((By.CSS_SELECTOR, ".p-paginator-page.p-highlight"))
+        ).text
+        if int(current_page) == page_number:
+            return True
+
+        page_inputs = driver.find_elements(By.CSS_SELECTOR, PAGE_INPUT_CSS)
+        if page_inputs:
+            page_inputs[0].clear()
+            page_inputs[0].send_keys(str(page_number), Keys.ENTER)
+            current_page = wait_text_changed(driver, (By.CSS_SELECTOR, ".p-paginator-page.p-highlight"), current_page)
+
+        if last_page and last_page - page_number < page_number - int(current_page):
+            last_buttons = driver.find_elements(By.CSS_SELECTOR, ".p-paginator-last")
+            if last_buttons and int(current_page) != last_page:
+                current_page = _click_page_control(driver, last_buttons[0], current_page)
+
+        while int(current_page) != page_number:
+            buttons = {int(button.text): button for button in driver.find_elements(By.XPATH, PAGE_BUTTONS_XPATH)
+                       if button.text.strip().isdigit()}
+            if page_number in buttons:
+                target = page_number
+            else:
+                target = max(buttons) if page_number > int(current_page) else min(buttons)
+            if target == int(current_page):
+                return False
+            current_page = _click_page_control(driver, buttons[target], current_page)
+        wait_network_idle(driver)
+        return True
 
     except Exception as e:
         # print(f"Error: {e}")
@@ -541,45 +707,21 @@ def extract_doc_info(doc_text):
 
 
 def save_receipts(driver, file_path, butthon_xpath=None):
+    # Файл скачивается браузером без окна "Сохранить как" (CDP) и сохраняется под именем file_path
     try:
-        # на всякий случай закрываем окно если не закрылось с предыдущего раза
-        pyautogui.press("escape")
-        close_window_save_as(driver)
-
         # Удаляем файл, если он уже существует
-        # file_path = os.path.join(cur_name, f"{doc_name}")
         if os.path.exists(file_path):
             os.remove(file_path)
 
-        time.sleep(1)
-
         # Находим кнопку "XML/PDF" и кликаем по ней
-        click_element_by_xpath(driver, butthon_xpath)
-
-        # Копируем путь к файлу в буфер обмена
-        pyperclip.copy(file_path)
-        print(f"file_path: {file_path}")
-        time.sleep(1)
-
-        # Вставляем путь из буфера обмена
-        pyautogui.hotkey("ctrl", "v")
-        time.sleep(1)
-        pyautogui.press("enter")
-        time.sleep(1)
-
-        # Переключаемся на новое окно, если оно открыто
-        original_window = driver.current_window_handle
-        for handle in driver.window_handles:
-            if handle != original_window:
-                driver.switch_to.window(handle)
-                break
-
-        # Возвращаемся в исходное окно
-        driver.switch_to.window(original_window)
+        saved = download_via_click(driver, lambda: click_element_by_xpath(driver, butthon_xpath), file_path)
+        if saved:
+            print(f"file_path: {file_path}")
+        return saved
 
     except Exception as e:
         # print(e)
-        pass
+        return None
 
 
 def is_saved_file_exists(file_path):
@@ -601,21 +743,20 @@ def find_and_save_receipts(driver, cell):
             # Находим кнопку "Перегляд" и кликаем по ней
             click_element_by_xpath(driver, "//span[@class='p-button-label' and text()='Перегляд']")
 
-            time.sleep(1)
-
             # Получаем информацию о документе. Будем использовать ее для наименования файла
             button_parh = "/html/body/app-root/div/div[2]/div[2]/app-in-view/div[2]/p"
-            element = driver.find_element(By.XPATH, button_parh)
+            element = wait_present(driver, (By.XPATH, button_parh))
 
             # Извлекаем информацию об имени документе
             doc_info = extract_doc_info(element.text)
-            # на всякий случай закрываем окно если не закрылось с предыдущего раза
-            pyautogui.press("escape")
 
-            # Находим кнопку "XML" и кликаем по ней
+            # Находим кнопку "XML" и сохраняем файл под именем документа
             button_path = "//span[@class='p-button-label' and text()='XML']"
-            click_element_by_xpath(driver, button_path)
-            time.sleep(1)
+            if doc_info:
+                save_receipts(driver, os.path.join(save_to_path, f"{doc_info}.xml"), button_path)
+            else:
+                click_element_by_xpath(driver, button_path)
+                wait_network_idle(driver)
 
             # Возвращаемся на предыдущую страницу, в случае если мы находимся на странице с документом
             driver.back()
@@ -624,10 +765,8 @@ def find_and_save_receipts(driver, cell):
         pass
 
 
-def close_window_save_as(driver):
-    # Задержка, чтобы дать время на появление окна "Сохранить как"
-    time.sleep(5)
-
+def save_dialog_handles(driver):
+    """Окна с классом "#32770" ("Сохранить как", "Открытие"), принадлежащие процессам браузера."""
     # Получаем PID процесса браузера (можно получить через driver.process_id, если это поддерживается)
     browser_pid = driver.service.process.pid
 
@@ -638,21 +777,31 @@ def close_window_save_as(driver):
     # Получаем PID всех процессов браузера
     all_pids = [proc.pid for proc in child_processes] + [browser_pid]
 
-    # Ищем все окна с классом "#32770" (например, окна "Сохранить как")
+    handles = []
+    for handle in pywinauto_findwindows.find_windows(class_name="#32770"):
+        window = pywinauto_application.Application(backend="uia").connect(handle=handle).window(handle=handle)
+        # Проверяем, соответствует ли процесс окна процессу браузера
+        if window.process_id() in all_pids:
+            handles.append(handle)
+    return handles
+
+
+def wait_file_dialog(driver, timeout=5):
+    """Ждет появления окна выбора/сохранения файла браузера. Возвращает список его handle."""
+    return wait_until(lambda: save_dialog_handles(driver), timeout=timeout, name="file_dialog",
+                      raise_on_timeout=False, ignored_exceptions=(Exception,))
+
+
+def close_window_save_as(driver, timeout=5):
+    # Ждем появления окна "Сохранить как" не дольше timeout сек (0 - только проверить, открыто ли оно)
     try:
-        save_as_windows = find_windows(class_name="#32770")
+        save_as_windows = wait_file_dialog(driver, timeout) or []
 
         # Проходим по каждому найденному окну
         for handle in save_as_windows:
-            # Подключаемся к окну
-            app = Application(backend="uia").connect(handle=handle)
-            window = app.window(handle=handle)
-
-            # Проверяем, соответствует ли процесс окна процессу браузера
-            if window.process_id() in all_pids:
-                # Если окно связано с текущим процессом браузера, закрываем его
-                window.close()
-                # print(f"Окно с handle {handle} закрыто.")
+            # Если окно связано с текущим процессом браузера, закрываем его
+            pywinauto_application.Application(backend="uia").connect(handle=handle).window(handle=handle).close()
+            # print(f"Окно с handle {handle} закрыто.")
 
     except Exception as e:
         # print(f"Ошибка: {e}")
@@ -686,7 +835,7 @@ def get_input_value(driver, xpath):
 def check_ping(host):
     # pip install ping3
 
-    response = ping(host)
+    response = ping3.ping(host)
     if response is None:
         print(f"Сайт {host} недоступен.")
         return False
@@ -710,6 +859,185 @@ def remove_duplicates(table_name):
     return result
 
 
+DEDUPE_WATERMARK_TABLE = "t_dedupe_watermark"
+# насколько ниже сохраненной отметки повторно проверяются строки (для колонок даты/времени)
+DEDUPE_WATERMARK_OVERLAP = os.getenv("DEDUPE_WATERMARK_OVERLAP", "7 days")
+
+
+def get_constraint_columns(cursor, table_name, unqkey):
+    """Колонки уникального ограничения (или первичного ключа) unqkey таблицы. Пустой список, если его нет."""
+    cursor.execute(
+        """
+        SELECT a.attname
+        FROM pg_constraint c
+            JOIN pg_attribute a ON a.attrelid = c.conrelid AND a.attnum = ANY (c.conkey)
+        WHERE c.conrelid = %s::regclass AND c.conname = %s AND c.contype IN ('u', 'p')
+        ORDER BY array_position(c.conkey, a.attnum)
+        """,
+        (table_name, unqkey.lower()),
+    )
+    return [row[0] for row in cursor.fetchall()]
+
+
+def remove_duplicates_incremental(table_name, key_columns=None, unqkey=None, watermark_column=None,
+                                  date_from=None, date_to=None, batch_column=None, batch_id=None,
+                                  watermark_overlap=None):
+    """
+    Удаляет дубликаты только среди строк, загруженных с последнего запуска, вместо
+    fn_remove_duplicates по всей таблице.
+
+    key_columns - колонки, по которым строки считаются дубликатами.
+    unqkey - уникальное ограничение (как в dict_to_sql_unqkey_async). Если оно есть в таблице,
+        дубликаты невозможны (вставка идет через ON CONFLICT ... DO NOTHING), удалять нечего.
+    Область проверки (одно из):
+        batch_column + batch_id - строки одной загрузки;
+        watermark_column + date_from/date_to - строки за период;
+        watermark_column - строки после сохраненной в t_dedupe_watermark отметки минус watermark_overlap.
+    watermark_column лучше брать время загрузки или serial id строки. Если это дата документа,
+    строки, пришедшие с опозданием, попадают в проверку только в пределах watermark_overlap
+    (для колонок даты/времени по умолчанию DEDUPE_WATERMARK_OVERLAP, для чисел - 0).
+    Удаляется все, кроме первой физической строки каждой группы (по ctid), причем
+    сравниваются строки области со всей таблицей: новые дубликаты старых строк тоже удаляются.
+    NULL в колонках ключа считаются равными, как в fn_remove_duplicates (отдельной веткой запроса,
+    основная ветка соединяет по = и может использовать индекс по ключу).
+
+    Возвращает {"removed": удалено строк, "elapsed": сек, "watermark": новая отметка}.
+    """
+    start = time.perf_counter()
+    conn = con_postgres_psycopg2()
+    if not conn:
+        raise ConnectionError("Нет подключения к PostgreSQL (con_postgres_psycopg2)")
+    result = {"removed": 0, "elapsed": 0.0, "watermark": None}
+    try:
+        with conn.cursor() as cursor:
+            if unqkey and get_constraint_columns(cursor, table_name, unqkey):
+                result["elapsed"] = time.perf_counter() - start
+                return result
+
+            if not key_columns:
+                raise ValueError("Не заданы key_columns и в таблице нет ограничения unqkey")
+
+            params = []
+            use_watermark = False
+            if batch_column is not None:
+                scope_filter = f"{batch_column} = %s"
+                params.append(batch_id)
+            elif watermark_column and (date_from is not None or date_to is not None):
+                conditions = []
+                if date_from is not None:
+                    conditions.append(f"{watermark_column} >= %s")
+                    params.append(date_from)
+                if date_to is not None:
+                    conditions.append(f"{watermark_column} < %s")
+                    params.append(date_to)
+                scope_filter = " AND ".join(conditions)
+            elif watermark_column:
+                use_watermark = True
+                cursor.execute(
+                    f"""
+                    CREATE TABLE IF NOT EXISTS {DEDUPE_WATERMARK_TABLE} (
+                        table_name text NOT NULL,
+                        watermark_column text NOT NULL,
+                        watermark text,
+                        updated_at timestamptz NOT NULL DEFAULT now(),
+                        PRIMARY KEY (table_name, watermark_column)
+                    )
+                    """
+                )
+                cursor.execute(
+                    f"SELECT watermark FROM {DEDUPE_WATERMARK_TABLE} WHERE table_name = %s AND watermark_column = %s",
+                    (table_name, watermark_column),
+                )
+                row = cursor.fetchone()
+                if row and row[0] is not None:
+                    # отметка хранится текстом и приводится к типу колонки на сервере;
+                    # строки чуть ниже отметки проверяются повторно - на случай опоздавших загрузок
+                    column_type = _column_type(cursor, table_name, watermark_column)
+                    is_temporal = column_type.startswith(("date", "timestamp"))
+                    overlap = watermark_overlap if watermark_overlap is not None else (
+                        DEDUPE_WATERMARK_OVERLAP if is_temporal else 0)
+                    if is_temporal or overlap:
+                        overlap_type = "interval" if is_temporal else column_type
+                        scope_filter = f"{watermark_column} > %s::{column_type} - %s::{overlap_type}"
+                        params.extend([row[0], str(overlap)])
+                    else:
+                        scope_filter = f"{watermark_column} > %s::{column_type}"
+                        params.append(row[0])
+                else:
+                    scope_filter = "true"  # первый запуск - проверяем всю таблицу
+            else:
+                raise ValueError("Не задана область проверки: batch_column, watermark_column или date_from/date_to")
+
+            if watermark_column:
+                cursor.execute(f"SELECT max({watermark_column})::text FROM {table_name} WHERE {scope_filter}", params)
+                result["watermark"] = cursor.fetchone()[0]
+
+            keys = ", ".join(key_columns)
+            t_keys = ", ".join(f"t.{column}" for column in key_columns)
+            # равенство - чтобы планировщик мог использовать индекс по ключу и hash/merge join
+            join_on = " AND ".join(f"t.{column} = s.{column}" for column in key_columns)
+            null_safe_join_on = " AND ".join(
+                f"(t.{column} = s.{column} OR (t.{column} IS NULL AND s.{column} IS NULL))" for column in key_columns)
+            t_has_null = " OR ".join(f"t.{column} IS NULL" for column in key_columns)
+            has_null = " OR ".join(f"{column} IS NULL" for column in key_columns)
+            cursor.execute(
+                f"""
+                WITH scope AS (
+                    SELECT DISTINCT {keys} FROM {table_name} WHERE {scope_filter}
+                ),
+                matched AS (
+                    SELECT t.ctid AS row_ctid, {t_keys}
+                    FROM {table_name} AS t
+                        INNER JOIN scope AS s ON {join_on}
+                    UNION ALL
+                    -- строки с NULL в ключе (NULL = NULL): узкая ветка только по таким строкам
+                    SELECT t.ctid, {t_keys}
+                    FROM {table_name} AS t
+                        INNER JOIN (SELECT * FROM scope WHERE {has_null}) AS s ON {null_safe_join_on}
+                    WHERE {t_has_null}
+                ),
+                ranked AS (
+                    SELECT row_ctid,
+                        row_number() OVER (PARTITION BY {keys} ORDER BY row_ctid) AS rn
+                    FROM matched
+                )
+                DELETE FROM {table_name}
+                WHERE ctid IN (SELECT row_ctid FROM ranked WHERE rn > 1)
+                """,
+                params,
+            )
+            result["removed"] = cursor.rowcount
+
+            if use_watermark and result["watermark"] is not None:
+                cursor.execute(
+                    f"""
+                    INSERT INTO {DEDUPE_WATERMARK_TABLE} (table_name, watermark_column, watermark)
+                    VALUES (%s, %s, %s)
+                    ON CONFLICT (table_name, watermark_column)
+                    DO UPDATE SET watermark = EXCLUDED.watermark, updated_at = now()
+                    """,
+                    (table_name, watermark_column, result["watermark"]),
+                )
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+    result["elapsed"] = time.perf_counter() - start
+    print(f"{table_name}: удалено дубликатов {result['removed']} за {result['elapsed']:.2f} сек")
+    return result
+
+
+def _column_type(cursor, table_name, column_name):
+    cursor.execute(
+        "SELECT format_type(atttypid, atttypmod) FROM pg_attribute WHERE attrelid = %s::regclass AND attname = %s",
+        (table_name, column_name),
+    )
+    return cursor.fetchone()[0]
+
+
 if __name__ == "__main__":
     # authorize()
     if check_ping("tax.gov.ua"):
@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+"""
+Кэш bearer токена кабинета налогоплательщика (cabinet.tax.gov.ua).
+
+Токен хранится на диске вместе со сроком действия и используется всеми процессами:
+доступ к файлу защищен файловой блокировкой, поэтому при одновременном старте
+нескольких скриптов браузер для входа по ключу запускается только один раз.
+Срок действия берется из поля exp токена (если это JWT), иначе из TAX_TOKEN_TTL
+или из наблюдаемого времени жизни прошлого токена (сколько он прожил до 401).
+
+Пример:
+    token_manager = TokenManager()
+    token = await token_manager.get_token()
+    ...  # получили 401
+    token = await token_manager.refresh(token)
+"""
+
+import asyncio
+import base64
+import json
+import os
+import time
+
+from filelock import FileLock
+
+# токен - действующий секрет, поэтому кэш лежит в папке пользователя, а не в репозитории
+TOKEN_CACHE_DIR = os.path.join(os.getenv("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache"),
+                               "taxgovua")
+TOKEN_CACHE_PATH = os.getenv("TAX_TOKEN_CACHE_PATH", os.path.join(TOKEN_CACHE_DIR, ".tax_token.json"))
+TOKEN_TTL = float(os.getenv("TAX_TOKEN_TTL", 3600))  # сек, если срок неизвестен
+TOKEN_EXPIRY_MARGIN = float(os.getenv("TAX_TOKEN_EXPIRY_MARGIN", 60))  # сек до истечения, когда токен уже не выдаем
+TOKEN_LOCK_TIMEOUT = float(os.getenv("TAX_TOKEN_LOCK_TIMEOUT", 600))  # сек ожидания входа в другом процессе
+
+
+def jwt_expires_at(token):
+    """Время истечения (unix time) из поля exp JWT токена или None."""
+    try:
+        payload = token.split()[-1].split(".")[1]
+        payload += "=" * (-len(payload) % 4)
+        exp = json.loads(base64.urlsafe_b64decode(payload)).get("exp")
+        return float(exp) if exp else None
+    except (IndexError, ValueError, AttributeError):
+        return None
+
+
+def login_with_browser():
+    """Вход в кабинет по ключу через браузер (TaxGovUaConfig.get_token). Возвращает токен или None."""
+    # импорт здесь: selenium и настройка браузера нужны только когда токена в кэше нет
+    from TaxGovUaConfig import get_token
+
+    driver, token = get_token()
+    if driver:
+        driver.quit()
+    return token
+
+
+class TokenManager:
+    def __init__(self, cache_path=TOKEN_CACHE_PATH, refresher=login_with_browser, ttl=TOKEN_TTL,
+                 margin=TOKEN_EXPIRY_MARGIN):
+        """refresher() - функция (синхронная) получения нового токена."""
+        self.cache_path = cache_path
+        directory = os.path.dirname(os.path.abspath(cache_path))
+        os.makedirs(directory, mode=0o700, exist_ok=True)
+        self.refresher = refresher
+        self.ttl = ttl
+        self.margin = margin
+        self._file_lock = FileLock(f"{cache_path}.lock", timeout=TOKEN_LOCK_TIMEOUT)
+        self._entry = None  # последний прочитанный/полученный токен
+        self._lock = None
+
+    # --- синхронный интерфейс (блокирует поток на время входа в браузере) ---
+
+    def get_token_sync(self):
+        entry = self._entry
+        if self._is_valid(entry):
+            return entry["token"]
+        with self._file_lock:
+            entry = self._read()
+            if not self._is_valid(entry):
+                entry = self._login(entry)
+        return entry["token"]
+
+    def refresh_sync(self, stale_token):
+        """
+        Токен stale_token отклонен сервером (401). Если другой процесс или задача уже получили
+        новый токен, возвращает его, иначе выполняет вход заново.
+        """
+        with self._file_lock:
+            entry = self._read()
+            if self._is_valid(entry) and entry["token"] != stale_token:
+                return entry["token"]
+            if entry and entry["token"] == stale_token:
+                # сколько на самом деле прожил токен - срок для следующих токенов без exp
+                entry["observed_ttl"] = max(time.time() - entry["obtained_at"], self.margin * 2)
+            return self._login(entry)["token"]
+
+    # --- асинхронный интерфейс ---
+
+    async def get_token(self):
+        entry = self._entry
+        if self._is_valid(entry):
+            return entry["token"]
+        async with self._async_lock():
+            return await asyncio.to_thread(self.get_token_sync)
+
+    async def refresh(self, stale_token):
+        """
+        Обновление после 401. Задачи, получившие 401 одновременно, ждут одного входа (single-flight)
+        и получают один и тот же новый токен.
+        """
+        async with self._async_lock():
+            entry = self._entry
+            if self._is_valid(entry) and entry["token"] != stale_token:
+                return entry["token"]
+            return await asyncio.to_thread(self.refresh_sync, stale_token)
+
+    def _async_lock(self):
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        return self._lock
+
+    def _is_valid(self, entry):
+        return bool(entry and entry.get("token")) and entry["expires_at"] - self.margin > time.time()
+
+    def _read(self):
+        try:
+            with open(self.cache_path, encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if self._is_valid(entry):
+            self._entry = entry
+        return entry
+
+    def _login(self, previous=None):
+        token = self.refresher()
+        if not token:
+            raise RuntimeError("Не удалось получить токен кабинета")
+        now = time.time()
+        observed_ttl = previous.get("observed_ttl") if previous else None
+        expires_at = jwt_expires_at(token) or now + min(self.ttl, observed_ttl or self.ttl)
+        entry = {"token": token, "obtained_at": now, "expires_at": expires_at, "observed_ttl": observed_ttl}
+        self._write(entry)
+        self._entry = entry
+        return entry
+
+    def _write(self, entry):
+        tmp_path = f"{self.cache_path}.tmp"
+        # токен - секрет: файл доступен только владельцу
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(entry, f)
+        os.replace(tmp_path, self.cache_path)
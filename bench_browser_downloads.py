@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+"""
+bench_browser_downloads.py
+Проверяет сохранение файлов без окна "Сохранить как" на локальной имитации кабинета (LocalCabinetStub):
+несколько браузеров без окна в отдельных потоках открывают /documents/view, нажимают "XML"
+и сохраняют файл под именем из extract_doc_info (как find_and_save_receipts).
+Печатает время, количество сохраненных файлов и проверяет их размер.
+Нужен Chrome и chromedriver.
+
+Запуск: python bench_browser_downloads.py [кол-во документов] [кол-во браузеров]
+"""
+
+import os
+import re
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from dateutil import parser
+from selenium import webdriver
+from selenium.webdriver.common.by import By
+
+from BrowserDownloads import build_chrome_options, download_via_click
+from BrowserWaits import wait_clickable, wait_present
+from LocalCabinetStub import LocalCabinetStub
+
+XML_BUTTON = (By.XPATH, "//span[@class='p-button-label' and text()='XML']")
+
+
+def doc_file_name(doc_text):
+    # то же имя, что дает TaxGovUaConfig.extract_doc_info
+    match = re.search(r"№ (\d+) від (\d{2}\.\d{2}\.\d{4})", doc_text)
+    date = parser.parse(match.group(2)).strftime("%Y.%m.%d")
+    return f"{match.group(1)} {date}.xml"
+
+
+def download_documents(stub, doc_ids, target_dir):
+    driver = webdriver.Chrome(options=build_chrome_options(headless=True))
+    saved = []
+    try:
+        for doc_id in doc_ids:
+            driver.get(stub.url(f"/documents/view?id={doc_id}"))
+            file_name = doc_file_name(wait_present(driver, (By.TAG_NAME, "p")).text)
+            file_path = os.path.join(target_dir, file_name)
+            if download_via_click(driver, lambda: wait_clickable(driver, XML_BUTTON).click(), file_path):
+                saved.append(file_path)
+    finally:
+        driver.quit()
+    return saved
+
+
+def measure(stub, documents, browsers, target_dir):
+    doc_ids = list(range(1, documents + 1))
+    chunks = [doc_ids[i::browsers] for i in range(browsers)]
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=browsers) as executor:
+        saved = [path for paths in executor.map(lambda ids: download_documents(stub, ids, target_dir), chunks)
+                 for path in paths]
+    elapsed = time.perf_counter() - start
+    expected_size = len(stub.file_body(os.path.basename(saved[0]))) if saved else 0
+    broken = [path for path in saved if os.path.getsize(path) != expected_size]
+    print(f"браузеров: {browsers:2}  сохранено {len(saved)}/{documents}  с ошибкой размера: {len(broken)}  "
+          f"{elapsed:8.2f} сек")
+
+
+if __name__ == "__main__":
+    documents_count = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    browsers_count = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+    downloads_dir = tempfile.mkdtemp(prefix="bench-downloads-")
+    try:
+        with LocalCabinetStub(api_delay=0.2) as cabinet:
+            for count in sorted({1, browsers_count}):
+                measure(cabinet, documents_count, count, downloads_dir)
+                for name in os.listdir(downloads_dir):
+                    os.remove(os.path.join(downloads_dir, name))
+    finally:
+        shutil.rmtree(downloads_dir, ignore_errors=True)
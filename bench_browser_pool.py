@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+"""
+bench_browser_pool.py
+Читает все страницы таблицы документов локальной имитации кабинета (LocalCabinetStub, вход обязателен)
+пулом браузеров без окна (BrowserPool) с разным числом воркеров. Вход выполняется один раз,
+cookies и localStorage переносятся в браузеры пула. Печатает время и проверяет, что строки
+собраны полностью и в порядке страниц.
+Нужен Chrome и chromedriver.
+
+Запуск: python bench_browser_pool.py [кол-во страниц] [макс. кол-во браузеров]
+"""
+
+import sys
+import time
+
+from selenium import webdriver
+from selenium.webdriver.common.by import By
+
+from BrowserDownloads import build_chrome_options
+from BrowserPool import BrowserPool, capture_auth_state, page_ranges
+from BrowserWaits import wait_clickable, wait_invisible, wait_present, wait_text_changed, wait_url_changed
+from LocalCabinetStub import LocalCabinetStub
+
+PAGE_LOCATOR = (By.CSS_SELECTOR, ".p-paginator-page.p-highlight")
+PAGE_BUTTON_XPATH = "//span[contains(@class, 'p-paginator-pages')]/button[normalize-space()='{}']"
+NEXT_LOCATOR = (By.CSS_SELECTOR, ".p-paginator-next")
+JS_ROWS = """
+return Array.from(document.querySelectorAll('.p-datatable-tbody tr'),
+    tr => Array.from(tr.querySelectorAll('td'), td => td.innerText.trim()).slice(1));
+"""
+
+
+def login(stub):
+    driver = webdriver.Chrome(options=build_chrome_options(headless=True))
+    login_url = stub.url("/login")
+    driver.get(login_url)
+    wait_invisible(driver, (By.CLASS_NAME, "p-blockui-document"))
+    driver.find_element(By.ID, "read").click()
+    wait_clickable(driver, (By.ID, "login"), timeout=30).click()
+    wait_url_changed(driver, login_url, timeout=30)
+    wait_present(driver, PAGE_LOCATOR)
+    return driver
+
+
+def read_pages(stub, driver, pages):
+    driver.get(stub.url("/documents/in"))
+    if not driver.current_url.endswith("/documents/in"):
+        raise RuntimeError(f"нет авторизации: {driver.current_url}")
+    current_page = wait_present(driver, PAGE_LOCATOR).text
+    if int(current_page) != pages.start:
+        # сразу на первую страницу диапазона, как go_to_page в TaxGovUaConfig
+        wait_clickable(driver, (By.XPATH, PAGE_BUTTON_XPATH.format(pages.start))).click()
+        current_page = wait_text_changed(driver, PAGE_LOCATOR, current_page)
+    rows = []
+    while True:
+        rows.extend(driver.execute_script(JS_ROWS))
+        if int(current_page) + 1 >= pages.stop:
+            break
+        wait_clickable(driver, NEXT_LOCATOR).click()
+        current_page = wait_text_changed(driver, PAGE_LOCATOR, current_page)
+    return rows
+
+
+def measure(stub, auth_state, workers, expected):
+    pool = BrowserPool(workers=workers, auth_state=auth_state)
+    start = time.perf_counter()
+    chunks = pool.map(lambda driver, pages: read_pages(stub, driver, pages), page_ranges(stub.pages, workers))
+    elapsed = time.perf_counter() - start
+    rows = [row for chunk in chunks if chunk for row in chunk]
+    print(f"браузеров: {workers:2}  строк: {len(rows)}  совпадает: {rows == expected}  {elapsed:8.2f} сек")
+
+
+if __name__ == "__main__":
+    pages_count = int(sys.argv[1]) if len(sys.argv) > 1 else 40
+    max_workers = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+    with LocalCabinetStub(pages=pages_count, api_delay=0.2, require_login=True) as cabinet:
+        expected_rows = [row for page in range(1, pages_count + 1) for row in cabinet.page_rows(page)]
+        main_driver = login(cabinet)
+        try:
+            state = capture_auth_state(main_driver)
+        finally:
+            main_driver.quit()
+        workers_count = 1
+        while workers_count <= max_workers:
+            measure(cabinet, state, workers_count, expected_rows)
+            workers_count *= 2
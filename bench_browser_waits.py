@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+"""
+bench_browser_waits.py
+Сравнивает сценарий "вход + перелистывание таблицы документов" на локальной имитации кабинета
+(LocalCabinetStub):
+    - с фиксированными паузами, как было в TaxGovUaConfig (2 + 5 + 1 сек на вход, 0.5 сек на страницу)
+    - с ожиданиями по условию из BrowserWaits
+и печатает время сценариев и отчет о фактическом времени ожиданий.
+Нужен Chrome и chromedriver (браузер запускается без окна).
+
+Запуск: python bench_browser_waits.py [кол-во страниц] [задержка API, мс]
+"""
+
+import sys
+import time
+
+from selenium import webdriver
+from selenium.webdriver.chrome.options import Options
+from selenium.webdriver.common.by import By
+
+from BrowserWaits import (
+    install_network_tracker,
+    print_wait_report,
+    wait_clickable,
+    wait_invisible,
+    wait_network_idle,
+    wait_text_changed,
+    wait_url_changed,
+)
+from LocalCabinetStub import LocalCabinetStub
+
+PAGE_LOCATOR = (By.CSS_SELECTOR, ".p-paginator-page.p-highlight")
+NEXT_LOCATOR = (By.CSS_SELECTOR, ".p-paginator-next")
+
+
+def create_driver():
+    options = Options()
+    options.add_argument("--headless=new")
+    options.add_argument("--no-sandbox")
+    options.add_argument("--disable-gpu")
+    return webdriver.Chrome(options=options)
+
+
+def flow_with_sleeps(driver, stub, pages):
+    driver.get(stub.url("/login"))
+    wait_invisible(driver, (By.CLASS_NAME, "p-blockui-document"))
+    time.sleep(2)
+    driver.find_element(By.ID, "read").click()
+    time.sleep(5)  # "Ожидаем пока прочитается файл"
+    driver.find_element(By.ID, "login").click()
+    time.sleep(1)
+    for _ in range(pages - 1):
+        time.sleep(1)  # прежняя пауза в get_table_data
+        driver.find_element(*NEXT_LOCATOR).click()
+        time.sleep(0.5)
+    return driver.find_element(*PAGE_LOCATOR).text
+
+
+def flow_with_waits(driver, stub, pages):
+    install_network_tracker(driver)
+    login_url = stub.url("/login")
+    driver.get(login_url)
+    wait_invisible(driver, (By.CLASS_NAME, "p-blockui-document"))
+    wait_network_idle(driver)
+    driver.find_element(By.ID, "read").click()
+    wait_clickable(driver, (By.ID, "login"), timeout=30).click()
+    wait_url_changed(driver, login_url, timeout=30)
+    wait_clickable(driver, PAGE_LOCATOR)
+    for _ in range(pages - 1):
+        current_page = driver.find_element(*PAGE_LOCATOR).text
+        wait_clickable(driver, NEXT_LOCATOR).click()
+        wait_text_changed(driver, PAGE_LOCATOR, current_page)
+    return driver.find_element(*PAGE_LOCATOR).text
+
+
+def measure(title, flow, stub, pages):
+    driver = create_driver()
+    try:
+        start = time.perf_counter()
+        last_page = flow(driver, stub, pages)
+        elapsed = time.perf_counter() - start
+    finally:
+        driver.quit()
+    print(f"{title:<24} {elapsed:8.2f} сек  последняя страница: {last_page}")
+
+
+if __name__ == "__main__":
+    pages_count = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    api_delay_ms = float(sys.argv[2]) if len(sys.argv) > 2 else 200
+    with LocalCabinetStub(pages=pages_count, api_delay=api_delay_ms / 1000) as cabinet:
+        print(f"страниц: {pages_count}, задержка API: {api_delay_ms} мс")
+        measure("фиксированные паузы", flow_with_sleeps, cabinet, pages_count)
+        measure("ожидания по условию", flow_with_waits, cabinet, pages_count)
+    print("\nФактическое время ожиданий:")
+    print_wait_report()
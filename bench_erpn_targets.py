@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+"""
+bench_erpn_targets.py
+Сравнивает планы и время выполнения запроса списка файлов для pdf_tax_gov_ua_erpn_block:
+    - прежний запрос по t_tax_cabinet_erpn_api (имена через concat/to_char, коррелированный
+      подзапрос для РК, UNION ALL из пяти частей с DISTINCT)
+    - чтение готовой таблицы t_tax_cabinet_erpn_download_target (ErpnDownloadTargets)
+через EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) и проверяет, что списки файлов совпадают.
+
+Запуск: python bench_erpn_targets.py [кол-во повторов]
+"""
+
+import asyncio
+import json
+import sys
+
+from AsyncPostgresql import acquire_connection, close_pool
+from ErpnDownloadTargets import DOWNLOAD_TARGETS_SQL, ensure_download_targets
+
+# запрос, которым pdf_tax_gov_ua_erpn_block строил список файлов до ErpnDownloadTargets
+LEGACY_SQL = r"""
+    WITH 
+    doc_pn AS (
+        SELECT code 
+        FROM t_tax_cabinet_erpn_api
+        WHERE crtdate > current_date - 365 AND (hsmcstt in (1, 2, 13, 14, 15, 18))
+    ),
+    doc_rk AS (
+        SELECT crcode
+        FROM t_tax_cabinet_erpn_api
+        WHERE crtdate > current_date - 365 AND (hsmcstt in (1, 2, 13, 14, 15, 18))
+            AND coalesce(crcode,0) <> 0
+    ),
+    nn_rk AS (
+        SELECT DISTINCT
+            CASE 
+                WHEN ftype = 0 THEN     
+                    concat(cptin,'\' , to_char(crtdate,'yyyymm'),'\ПН\ПН ',nmr,' від ',to_char(crtdate,'dd mm yyyy'),'.pdf') 
+                WHEN ftype = 1 THEN
+                    concat(cptin,'\' , to_char(crtdate,'yyyymm'), '\ПН\ПН ',corrnmr,' від ',(SELECT to_char(crtdate,'dd mm yyyy') FROM t_tax_cabinet_erpn_api AS src WHERE src.code = api.crcode),' РК ',nmr,' ',to_char(crtdate,'dd mm yyyy'),'.pdf') 
+            END AS file_name,
+            concat('https://cabinet.tax.gov.ua/ws/api/file/nlnkhd/pdf?code=',api.code,'&impdate=',impdate) AS url,
+            *
+        FROM t_tax_cabinet_erpn_api AS api
+            INNER JOIN (    
+                SELECT 
+                    code AS block_code
+                FROM doc_pn
+                UNION ALL 
+                SELECT 
+                    crcode
+                FROM doc_rk
+            ) AS api_block
+            ON api.code = api_block.block_code
+    )
+    SELECT DISTINCT
+        file_name,
+        url,
+        code,
+        impdate,
+        0 AS kvt_number
+    FROM nn_rk AS api 
+    UNION ALL 
+    SELECT DISTINCT
+        REPLACE(file_name,'.pdf',' KVT1.pdf') file_name,
+        concat('https://cabinet.tax.gov.ua/ws/api/file/nlnkhd/pdf/kvt?code=',nn_rk.code,'&impdate=',impdate) AS url
+        ,code,
+        impdate,
+        1 AS kvt_number
+    FROM nn_rk
+    UNION ALL 
+    SELECT DISTINCT
+        REPLACE(file_name,'.pdf',' KVT2.pdf') file_name,
+        concat('https://cabinet.tax.gov.ua/ws/api/file/nlnkhd/pdf/kvt2?code=',api.code,'&impdate=',impdate) AS url    
+        ,code,
+        impdate,
+        2 AS kvt_number
+    FROM nn_rk AS api 
+    WHERE api.kvt2 <> 0
+    UNION ALL 
+    SELECT DISTINCT
+        REPLACE(file_name,'.pdf',' KVT3.pdf') file_name,
+        concat('https://cabinet.tax.gov.ua/ws/api/file/nlnkhd/pdf/kvt3?code=',api.code,'&impdate=',impdate) AS url    
+        ,code,
+        impdate,
+        3 AS kvt_number
+    FROM nn_rk AS api 
+    WHERE api.kvt3 <> 0
+    UNION ALL 
+    SELECT DISTINCT
+        REPLACE(file_name,'.pdf',' KVT4.pdf') file_name,
+        concat('https://cabinet.tax.gov.ua/ws/api/file/nlnkhd/pdf/kvt4?code=',api.code,'&impdate=',impdate) AS url    
+        ,code,
+        impdate,
+        4 AS kvt_number
+    FROM nn_rk AS api 
+    WHERE api.kvt4 <> 0
+    ORDER BY file_name
+    ;
+
+"""
+
+
+def buffers(plan):
+    """Сумма shared hit/read блоков по всему дереву плана."""
+    hit = plan.get("Shared Hit Blocks", 0)
+    read = plan.get("Shared Read Blocks", 0)
+    for child in plan.get("Plans", []):
+        child_hit, child_read = buffers(child)
+        hit += child_hit
+        read += child_read
+    return hit, read
+
+
+async def explain(conn, sql):
+    result = await conn.fetchval(f"EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) {sql.strip().rstrip(';')}")
+    return (json.loads(result) if isinstance(result, str) else result)[0]
+
+
+def file_set_sql(sql):
+    return f"SELECT file_name, code, impdate, kvt_number FROM ({sql.strip().rstrip(';')}) AS files"
+
+
+async def main(repeats):
+    await ensure_download_targets()
+    async with acquire_connection() as conn:
+        for title, sql in (("прежний запрос", LEGACY_SQL), ("таблица целей", DOWNLOAD_TARGETS_SQL)):
+            times = []
+            for _ in range(repeats):
+                report = await explain(conn, sql)
+                times.append(report["Planning Time"] + report["Execution Time"])
+            hit, read = buffers(report["Plan"])
+            print(f"{title:<16} лучшее {min(times):10.1f} мс  строк {report['Plan']['Actual Rows']:8}  "
+                  f"буферов hit {hit:9} read {read:9}")
+
+        missing = await conn.fetchval(
+            f"SELECT count(*) FROM ({file_set_sql(LEGACY_SQL)} EXCEPT {file_set_sql(DOWNLOAD_TARGETS_SQL)}) AS diff"
+        )
+        extra = await conn.fetchval(
+            f"SELECT count(*) FROM ({file_set_sql(DOWNLOAD_TARGETS_SQL)} EXCEPT {file_set_sql(LEGACY_SQL)}) AS diff"
+        )
+        print(f"Нет в таблице целей: {missing}, лишних в таблице целей: {extra}")
+    await close_pool()
+
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 3))
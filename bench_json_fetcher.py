@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+"""
+bench_json_fetcher.py
+Сравнивает получение JSON по списку url:
+    - ProcessPoolExecutor(6) + requests.get (как было в run_map_get_list)
+    - fetch_json_bulk (aiohttp, keep-alive, ограничение параллельности)
+Запросы идут к локальному тестовому HTTP серверу, который отвечает с задержкой,
+имитируя сервер 1С.
+
+Запуск: python bench_json_fetcher.py [кол-во url] [задержка ответа, мс]
+"""
+
+import asyncio
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from aiohttp import web
+
+from AsyncPostgresql import fetch_json_bulk, get_json_from_url
+
+HOST = "127.0.0.1"
+
+
+def start_stub_server(delay):
+    """Запускает тестовый сервер в отдельном потоке и возвращает его порт."""
+    started = threading.Event()
+    port_holder = {}
+
+    async def handle(request):
+        await asyncio.sleep(delay)
+        item_id = int(request.match_info["item_id"])
+        return web.json_response([{"id": item_id, "name": f"item {item_id}", "amount": item_id * 1.5}])
+
+    async def serve():
+        app = web.Application()
+        app.router.add_get("/items/{item_id}", handle)
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        site = web.TCPSite(runner, HOST, 0)
+        await site.start()
+        port_holder["port"] = site._server.sockets[0].getsockname()[1]
+        started.set()
+        await asyncio.Event().wait()
+
+    threading.Thread(target=lambda: asyncio.run(serve()), daemon=True).start()
+    started.wait()
+    return port_holder["port"]
+
+
+def run_process_pool(urls):
+    with ProcessPoolExecutor(max_workers=6) as executor:
+        return list(executor.map(get_json_from_url, urls))
+
+
+def measure(title, func, urls):
+    start = time.perf_counter()
+    results = func(urls)
+    elapsed = time.perf_counter() - start
+    failed = sum(1 for result in results if result is None)
+    print(f"{title:<32} {elapsed:8.2f} сек  {len(urls) / elapsed:8.1f} url/сек  ошибок: {failed}")
+
+
+if __name__ == "__main__":
+    urls_count = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    delay_ms = float(sys.argv[2]) if len(sys.argv) > 2 else 50
+    port = start_stub_server(delay_ms / 1000)
+    urls = [f"http://{HOST}:{port}/items/{i}" for i in range(urls_count)]
+    print(f"url: {urls_count}, задержка сервера: {delay_ms} мс")
+
+    measure("ProcessPoolExecutor + requests", run_process_pool, urls)
+    for concurrency in (6, 20, 50):
+        measure(f"fetch_json_bulk({concurrency})",
+                lambda items: asyncio.run(fetch_json_bulk(items, concurrency=concurrency)), urls)
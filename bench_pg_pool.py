@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+"""
+bench_pg_pool.py
+Сравнивает пропускную способность (запросов в секунду) при открытии
+нового соединения на каждый запрос и при работе через общий пул asyncpg.
+
+Запуск: python bench_pg_pool.py [кол-во запросов] [параллельность]
+"""
+
+import asyncio
+import sys
+import time
+
+import asyncpg
+
+from AsyncPostgresql import CONN_PARAMS, close_pool, get_result_one_column
+
+SQL = "SELECT 1"
+
+
+async def query_without_pool():
+    # так работали все функции AsyncPostgresql до появления пула
+    conn = await asyncpg.connect(**CONN_PARAMS)
+    try:
+        return await conn.fetchval(SQL)
+    finally:
+        await conn.close()
+
+
+async def run(func, total, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one():
+        async with semaphore:
+            await func()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(total)))
+    return total / (time.perf_counter() - start)
+
+
+async def main(total, concurrency):
+    print(f"Запросов: {total}, параллельно: {concurrency}")
+    qps = await run(query_without_pool, total, concurrency)
+    print(f"Без пула: {qps:10.1f} запросов/сек")
+
+    await get_result_one_column(SQL)  # прогрев: пул создается при первом обращении
+    qps_pool = await run(lambda: get_result_one_column(SQL), total, concurrency)
+    print(f"С пулом:  {qps_pool:10.1f} запросов/сек (x{qps_pool / qps:.1f})")
+    await close_pool()
+
+
+if __name__ == "__main__":
+    total_queries = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    parallel = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    asyncio.run(main(total_queries, parallel))
@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+"""
+bench_records_to_df.py
+Сравнивает построение DataFrame из результата запроса:
+    - по строкам: pd.DataFrame([dict(record) for record in records]) (как было в get_df)
+    - по колонкам: records_to_df с типами из OID PostgreSQL
+на синтетическом результате (по умолчанию 1 000 000 строк) со структурой t_tax_cabinet_erpn_api.
+База данных не нужна.
+
+Запуск: python bench_records_to_df.py [кол-во строк]
+"""
+
+import random
+import sys
+import time
+import tracemalloc
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+
+import pandas as pd
+
+from AsyncPostgresql import (
+    PG_DATE_OID,
+    PG_NUMERIC_OID,
+    PG_TIMESTAMP_OID,
+    records_to_df,
+)
+
+COLUMNS = [
+    ("code", 20),
+    ("impdate", PG_TIMESTAMP_OID),
+    ("crtdate", PG_DATE_OID),
+    ("hsmcstt", 23),
+    ("cptin", 25),
+    ("nmr", 25),
+    ("sum_total", PG_NUMERIC_OID),
+]
+
+
+def make_records(count):
+    random.seed(1)
+    start = datetime(2024, 1, 1)
+    tins = [str(random.randint(10 ** 9, 10 ** 10)) for _ in range(500)]
+    records = []
+    for i in range(count):
+        impdate = start + timedelta(minutes=i)
+        records.append((
+            10 ** 9 + i,
+            impdate,
+            impdate.date() if i % 50 else None,
+            random.choice((1, 2, 13, 14, 15, 18)),
+            random.choice(tins),
+            str(i % 10000),
+            Decimal(random.randint(0, 10 ** 8)) / 100,
+        ))
+    return records
+
+
+def measure(title, func):
+    tracemalloc.start()
+    start = time.perf_counter()
+    df = func()
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    size = df.memory_usage(deep=True).sum()
+    print(f"{title:<28} {elapsed:8.2f} сек  пик {peak / 2 ** 20:8.1f} МБ  DataFrame {size / 2 ** 20:8.1f} МБ")
+    return df
+
+
+if __name__ == "__main__":
+    rows_count = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    print(f"Генерация {rows_count} строк...")
+    records = make_records(rows_count)
+    names = [name for name, _ in COLUMNS]
+
+    measure("по строкам (dict)", lambda: pd.DataFrame([dict(zip(names, record)) for record in records]))
+    measure("по колонкам", lambda: records_to_df(records, COLUMNS))
+    measure("по колонкам, numeric->float", lambda: records_to_df(records, COLUMNS, numeric_as_float=True))
+    df = measure("по колонкам + category", lambda: records_to_df(records, COLUMNS, category_columns={"cptin"}))
+    print(df.dtypes)
@@ -3,18 +3,21 @@
 https://aistudio.google.com/prompts/16kCR0IFokp02JaI8_RwQ02oBS7EXeLWm
 Создает PDF файлы из страниц исходных файлов, указанных в базе данных.
 PDF_create_from_pg.py
-Данные для отбора страниц берутся из базы данных. метод: fetch_scan_data через SQL запрос.
+Данные для отбора страниц берутся из базы данных. метод: iter_scan_data через SQL запрос (порциями).
 """
 
 import fitz  # PyMuPDF
 import os
 import logging
-from typing import List, Tuple, Dict
+from typing import List, Tuple, Dict, Iterator
 from pathlib import Path
 from dotenv import load_dotenv
 import pandas as pd
 import psycopg2
 from datetime import datetime
+from openpyxl import Workbook
+
+from AsyncPostgresql import iter_df_chunks_sync
 
 # --- Настройка ---
 
@@ -108,104 +111,154 @@ def extract_and_compress_pages(
 
 # --- Логика для работы с БД ---
 
-def fetch_scan_data() -> pd.DataFrame:
+SCAN_DATA_SQL = """
+    SELECT DISTINCT ON (doc_type, doc_date, doc_number, buyer_name, buyer_code, invoices_numbers, page_type)
+        doc_type,
+        doc_date,
+        doc_number,
+        buyer_name,
+        buyer_code,
+        page_number,
+        page_type,
+        invoices_numbers,
+        file_name
+    FROM 
+        t_scan_documents
+    WHERE external_id = 1170
+--        doc_date >= '01.10.2024'::date
+--        AND doc_date < '01.12.2024'::date
+    ORDER BY
+        -- Поля, по которым ищем дубликаты (должны совпадать с DISTINCT ON)
+        doc_type, doc_date, doc_number, buyer_name, buyer_code, invoices_numbers, page_type,
+        -- Поле, по которому выбираем "лучшую" запись из дубликатов (берем первую по номеру страницы)
+        page_number ASC                    
+    ;
+"""
+
+CHUNK_SIZE = 5000  # Сколько строк читать из базы за один раз
+GROUPING_KEYS = ['doc_type', 'doc_date', 'doc_number', 'buyer_name', 'buyer_code']
+
+
+def iter_scan_data(chunk_size: int = CHUNK_SIZE) -> Iterator[pd.DataFrame]:
+    """Читает t_scan_documents порциями через серверный курсор."""
     conn_string = f"dbname='{PG_DBNAME}' user='{PG_USER}' host='{PG_HOST}' password='{PG_PASSWORD}' port='{PG_PORT}'"
+    with psycopg2.connect(conn_string) as conn:
+        logger.info("Успешное подключение к базе данных.")
+        yield from iter_df_chunks_sync(SCAN_DATA_SQL, chunk_size, conn=conn)
+
+
+def fetch_scan_data() -> pd.DataFrame:
     try:
-        with psycopg2.connect(conn_string) as conn:
-            logger.info("Успешное подключение к базе данных.")
-            
-            # --- ИЗМЕНЕННЫЙ SQL-ЗАПРОС ---
-            sql = """
-                SELECT DISTINCT ON (doc_type, doc_date, doc_number, buyer_name, buyer_code, invoices_numbers, page_type)
-                    doc_type,
-                    doc_date,
-                    doc_number,
-                    buyer_name,
-                    buyer_code,
-                    page_number,
-                    page_type,
-                    invoices_numbers,
-                    file_name
-                FROM 
-                    t_scan_documents
-                WHERE external_id = 1170
---                    doc_date >= '01.10.2024'::date
---                    AND doc_date < '01.12.2024'::date
-                ORDER BY
-                    -- Поля, по которым ищем дубликаты (должны совпадать с DISTINCT ON)
-                    doc_type, doc_date, doc_number, buyer_name, buyer_code, invoices_numbers, page_type,
-                    -- Поле, по которому выбираем "лучшую" запись из дубликатов (берем первую по номеру страницы)
-                    page_number ASC                    
-                ;
-            """
-            # --- КОНЕЦ ИЗМЕНЕНИЯ ---
-
-            df = pd.read_sql_query(sql, conn)
-            logger.info(f"Загружено {len(df)} уникальных записей из t_scan_documents.")
-            return df
+        chunks = list(iter_scan_data())
+        df = pd.concat(chunks, ignore_index=True) if chunks else pd.DataFrame()
+        logger.info(f"Загружено {len(df)} уникальных записей из t_scan_documents.")
+        return df
     except Exception as e:
         logger.error(f"Ошибка подключения к БД: {e}", exc_info=True)
         return pd.DataFrame()
 
 
-def process_documents():
-    """
-    Основная функция: получает данные, группирует их и обрабатывает каждый документ.
-    """
-    df = fetch_scan_data()
-    if df.empty:
-        logger.warning("Нет данных для обработки. Завершение работы.")
-        return
+def process_group(name: tuple, group: pd.DataFrame) -> None:
+    """Создает один PDF документ из страниц группы."""
+    doc_type, doc_date, doc_number, buyer_name, buyer_code = name
 
-    # --- БЛОК СОХРАНЕНИЯ EXCEL (без изменений) ---
-    try:
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        excel_filename = f"Scan_Report_{timestamp}.xlsx"
-        excel_output_path = BASE_OUTPUT_PATH / excel_filename
-        df.to_excel(excel_output_path, index=False)
-        logger.info(f"Все загруженные данные сохранены в Excel: {excel_output_path}")
-    except Exception as e:
-        logger.error(f"Не удалось сохранить общий Excel-отчет. Ошибка: {e}")
-    # --- КОНЕЦ БЛОКА ---
+    sanitized_buyer_name = sanitize_foldername(buyer_name)
+    client_folder_name = f"{buyer_code}_{sanitized_buyer_name}"
+    output_dir = BASE_OUTPUT_PATH / client_folder_name / str(doc_type)
+
+    formatted_date = doc_date.strftime('%d %m %Y')
+    output_filename = f"{doc_type} {doc_number} {formatted_date}.pdf"
+    full_output_path = output_dir / output_filename
+
+    source_filename = group['file_name'].iloc[0]
+    full_input_path = BASE_INPUT_PATH / source_filename
+    page_numbers = group['page_number'].astype(int).tolist()
 
-    df['doc_date'] = pd.to_datetime(df['doc_date'])
-    
-    # Группировка теперь будет работать с уже уникальными данными
-    grouping_keys = ['doc_type', 'doc_date', 'doc_number', 'buyer_name', 'buyer_code']
-    grouped = df.groupby(grouping_keys, sort=False)
+    logger.info(f"--- Обработка группы: {doc_type} №{doc_number} от {formatted_date} ---")
+    logger.info(f"Исходный файл: {full_input_path}")
+    logger.info(f"Страницы для извлечения: {sorted(page_numbers)}")
+    logger.info(f"Выходной файл: {full_output_path}")
 
-    logger.info(f"Найдено {len(grouped)} уникальных документов для обработки.")
+    success, stats = extract_and_compress_pages(
+        input_path=str(full_input_path),
+        output_path=str(full_output_path),
+        page_numbers=page_numbers,
+    )
+
+    if success:
+        logger.info(f"Документ успешно создан: {stats['processed_pages']} страниц обработано.\n")
+    else:
+        logger.error(f"Не удалось создать документ. Ошибка: {stats.get('error')}\n")
 
-    for name, group in grouped:
-        doc_type, doc_date, doc_number, buyer_name, buyer_code = name
 
-        sanitized_buyer_name = sanitize_foldername(buyer_name)
-        client_folder_name = f"{buyer_code}_{sanitized_buyer_name}"
-        output_dir = BASE_OUTPUT_PATH / client_folder_name / str(doc_type)
+def _report_rows(chunk: pd.DataFrame) -> Iterator[list]:
+    """Строки порции для Excel-отчета (NaN -> пустая ячейка, как в DataFrame.to_excel)."""
+    values = chunk.astype(object).where(chunk.notna(), None)
+    for row in values.itertuples(index=False, name=None):
+        yield list(row)
 
-        formatted_date = doc_date.strftime('%d %m %Y')
-        output_filename = f"{doc_type} {doc_number} {formatted_date}.pdf"
-        full_output_path = output_dir / output_filename
 
-        source_filename = group['file_name'].iloc[0]
-        full_input_path = BASE_INPUT_PATH / source_filename
-        page_numbers = group['page_number'].astype(int).tolist()
+def process_documents():
+    """
+    Основная функция: читает данные порциями, группирует их и обрабатывает каждый документ.
+    Запрос отсортирован по полям группировки, поэтому строки одного документа идут подряд.
+    Последняя группа порции может продолжиться в следующей, ее откладываем до следующей порции.
+    Excel-отчет пишется построчно (openpyxl write-only), в памяти держится только текущая порция.
+    Если чтение из БД прервалось, отложенная группа не обрабатывается (ее страницы могли
+    остаться непрочитанными), а отчет сохраняется с пометкой _incomplete.
+    """
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet()
+    rows_count = 0
+    pending = None
+    documents_count = 0
+    failed = False
+    try:
+        for chunk in iter_scan_data():
+            if rows_count == 0:
+                sheet.append(list(chunk.columns))
+            for row in _report_rows(chunk):
+                sheet.append(row)
+            rows_count += len(chunk)
+
+            chunk['doc_date'] = pd.to_datetime(chunk['doc_date'])
+            if pending is not None:
+                chunk = pd.concat([pending, chunk], ignore_index=True)
+
+            last_key = chunk[GROUPING_KEYS].iloc[-1]
+            is_last_group = (chunk[GROUPING_KEYS] == last_key).all(axis=1)
+            pending = chunk[is_last_group]
+
+            for name, group in chunk[~is_last_group].groupby(GROUPING_KEYS, sort=False):
+                process_group(name, group)
+                documents_count += 1
+    except Exception as e:
+        failed = True
+        logger.error(f"Ошибка чтения данных из БД, обработка прервана: {e}", exc_info=True)
+
+    if pending is not None and not failed:
+        for name, group in pending.groupby(GROUPING_KEYS, sort=False):
+            process_group(name, group)
+            documents_count += 1
 
-        logger.info(f"--- Обработка группы: {doc_type} №{doc_number} от {formatted_date} ---")
-        logger.info(f"Исходный файл: {full_input_path}")
-        logger.info(f"Страницы для извлечения: {sorted(page_numbers)}")
-        logger.info(f"Выходной файл: {full_output_path}")
+    if not rows_count:
+        logger.warning("Нет данных для обработки. Завершение работы.")
+        return
 
-        success, stats = extract_and_compress_pages(
-            input_path=str(full_input_path),
-            output_path=str(full_output_path),
-            page_numbers=page_numbers,
-        )
+    logger.info(f"Загружено {rows_count} уникальных записей из t_scan_documents.")
+    logger.info(f"Обработано {documents_count} уникальных документов.")
 
-        if success:
-            logger.info(f"Документ успешно создан: {stats['processed_pages']} страниц обработано.\n")
+    try:
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        excel_filename = f"Scan_Report_{timestamp}{'_incomplete' if failed else ''}.xlsx"
+        excel_output_path = BASE_OUTPUT_PATH / excel_filename
+        workbook.save(excel_output_path)
+        if failed:
+            logger.warning(f"Чтение из БД прервано, Excel-отчет неполный: {excel_output_path}")
         else:
-            logger.error(f"Не удалось создать документ. Ошибка: {stats.get('error')}\n")
+            logger.info(f"Все загруженные данные сохранены в Excel: {excel_output_path}")
+    except Exception as e:
+        logger.error(f"Не удалось сохранить общий Excel-отчет. Ошибка: {e}")
 
 
 if __name__ == "__main__":
@@ -7,20 +7,25 @@ https://aistudio.google.com/prompts/1Lg9dAwkX7dal-giGK1L7M6ewq8mtxWuB
 Скрипт для массового скачивания и обработки документов из системы EDIN.
 """
 
-from numpy import full
-import requests
+import asyncio
 import os
 import datetime
 import logging
 import re
 import json
 from dotenv import load_dotenv
-import pandas as pd
-import psycopg2
-import fitz
+import threading
 import time
-from pdf_sign_detector_by_gemini import extract_entity_by_gemini
-from pdf_sign_detector import main_pdf_sign_detector
+from collections import deque
+from EdinClient import EdinClient
+from LazyImport import lazy_import
+
+# тяжелые зависимости (pandas, PyMuPDF, Gemini SDK) загружаются при первом использовании
+pd = lazy_import("pandas")
+psycopg2 = lazy_import("psycopg2")
+fitz = lazy_import("fitz")
+pdf_sign_detector_by_gemini = lazy_import("pdf_sign_detector_by_gemini")
+pdf_sign_detector = lazy_import("pdf_sign_detector")
 
 # --- 1. Конфигурация и загрузка переменных окружения ---
 load_dotenv()
@@ -38,12 +43,11 @@ PG_DBNAME = os.getenv("PG_DBNAME")
 if not all([EDI_LOGIN, EDI_PASSWORD, SENDER_GLN, PG_USER, PG_PASSWORD, PG_HOST_LOCAL, PG_PORT, PG_DBNAME]):
     raise ValueError("Ошибка: Не все переменные окружения заданы в .env файле.")
 
-# --- URL-адреса API EDIN ---
-AUTH_URL = "https://edo-v2.edin.ua/api/authorization/hash"
-SEARCH_URL = f"https://edo-v2.edin.ua/api/eds/docs/search?gln={SENDER_GLN}&family=edi"
-DOWNLOAD_URL_TEMPLATE = "https://edo-v2.edin.ua/api/eds/doc/download"
-RETAILERS_URL = "https://edo-v2.edin.ua/api/oas/allretailers"
-IDENTIFIERS_URL = "https://edo-v2.edin.ua/api/oas/identifiers"
+# --- Параллельность (общий лимит запросов к EDIN - EDIN_CONCURRENCY в EdinClient) ---
+EDIN_PARTNER_CONCURRENCY = int(os.getenv("EDIN_PARTNER_CONCURRENCY", 4))  # одновременных загрузок PDF одного партнера
+EDIN_PARTNERS_PARALLEL = int(os.getenv("EDIN_PARTNERS_PARALLEL", 4))  # партнеров обрабатывается одновременно
+EDIN_DOWNLOAD_WINDOW = int(os.getenv("EDIN_DOWNLOAD_WINDOW", 32))  # PDF партнера, скачанных наперед
+EDIN_GEMINI_CONCURRENCY = int(os.getenv("EDIN_GEMINI_CONCURRENCY", 1))  # одновременных проверок подписи через Gemini
 
 # --- Настройка логгирования ---
 LOG_FILENAME = "download_log.txt"
@@ -118,49 +122,14 @@ def dump_error_json(documents_to_dump):
         logging.error(f"Не удалось сохранить файл с ошибкой {error_filename}: {e}")
 
 
-def get_sid(session, login, password):
-    logging.info("Шаг 1: Получение SID...")
-    payload = {'email': login, 'password': password}
-    try:
-        response = session.post(AUTH_URL, data=payload)
-        response.raise_for_status()
-        sid = response.json().get('SID')
-        if not sid:
-            raise ValueError("SID не найден в ответе сервера. Проверьте учетные данные.")
-        logging.info("SID успешно получен.")
-        session.headers.update({'Authorization': sid})
-        return sid
-    except Exception as e:
-        logging.error(f"Критическая ошибка при авторизации: {e}")
-        return None
-
-
-def get_documents(session, direction_payload, start_date, end_date):
-    try:
-        start_ts = int(datetime.datetime.strptime(start_date, '%Y-%m-%d').timestamp())
-        end_ts = int(datetime.datetime.strptime(end_date, '%Y-%m-%d').replace(hour=23, minute=59, second=59).timestamp())
-    except ValueError:
-        logging.error("Формат даты неверный. Используйте 'YYYY-MM-DD'.")
-        return None
-    search_payload = {
-        "statuses": [], "type": [], "limit": {"offset": "0", "count": "1000000"},
-        "exchangeStatus": [], "extraParams": [], "tags": [], "loadTags": True,
-        "multiExtraParams": [], "archive": False, "direction": direction_payload,
-        "docDate": {"startTimestamp": start_ts, "finishTimestamp": end_ts},
-        "loadChain": True, "families": [1, 7, 8]
-    }
-    try:
-        response = session.post(SEARCH_URL, json=search_payload)
-        response.raise_for_status()
-        documents = response.json().get("items", [])
-        return documents
-    except Exception as e:
-        logging.error(f"Ошибка при поиске документов: {e}")
-        return None
+# detect_sign выполняется в потоках для нескольких партнеров сразу, а лимиты Gemini
+# рассчитаны на последовательные запросы
+_gemini_limit = threading.BoundedSemaphore(EDIN_GEMINI_CONCURRENCY)
 
 
 def sign_exists_in_pdf(pdf_path): 
-    result = extract_entity_by_gemini(pdf_path)
+    with _gemini_limit:
+        result = pdf_sign_detector_by_gemini.extract_entity_by_gemini(pdf_path)
     if result and isinstance(result, dict):
         return result.get('sign', False)
     return False
@@ -181,7 +150,7 @@ def detect_sign(pdf_path):
             
              # проверяем программными средствами
              # возвращает: Error/Refused/NoSign
-            is_signed = main_pdf_sign_detector(pdf_path) 
+            is_signed = pdf_sign_detector.main_pdf_sign_detector(pdf_path) 
             if is_signed == "Error":
                 
                 # Программные средства не справились, проверяем через Gemini
@@ -203,39 +172,79 @@ def detect_sign(pdf_path):
     return True    
 
 
-def process_documents(session, cursor, documents, save_to_pdf, client_folder_path):
+async def _download_document(client, doc_uuid, partner_limit):
+    """Содержимое PDF и заголовок из него."""
+    async with partner_limit:
+        pdf_content = await client.download_pdf(doc_uuid)
+    extracted_title = await asyncio.to_thread(extract_title_from_pdf, pdf_content)
+    return pdf_content, extracted_title
+
+
+def _save_pdf(full_path, pdf_content):
+    with open(full_path, 'wb') as f:
+        f.write(pdf_content)
+    return detect_sign(os.path.abspath(full_path))
+
+
+async def _save_document(previous, full_path, pdf_content):
+    # файл с тем же именем сохраняется после предыдущего, как при последовательной обработке
+    if previous is not None:
+        await asyncio.wait([previous])
+    return await asyncio.to_thread(_save_pdf, full_path, pdf_content)
+
+
+async def process_documents(client, cursor, documents, save_to_pdf, client_folder_path):
+    """
+    PDF скачиваются параллельно (не больше EDIN_PARTNER_CONCURRENCY, наперед - EDIN_DOWNLOAD_WINDOW),
+    а фильтр, дубликаты и строки отчета разбираются в порядке documents, как раньше.
+    Сохранение и проверка подписи выполняются в потоках.
+    """
     if not documents:
         return 0, [], []
     downloaded_count = 0
     downloaded_filenames = []
     excel_report_data = []
     seen_excel_entries = set()
+    if not save_to_pdf:
+        # save_document_to_db(cursor, doc)
+        return downloaded_count, downloaded_filenames, excel_report_data
+
+    partner_limit = asyncio.Semaphore(EDIN_PARTNER_CONCURRENCY)
+    pending_documents = iter(documents)
+    window = deque()
+    saving = []
+    saving_by_path = {}
+
+    def fill_window():
+        while len(window) < EDIN_DOWNLOAD_WINDOW:
+            doc = next(pending_documents, StopIteration)
+            if doc is StopIteration:
+                return
+            if not all([doc.get('doc_uuid'), doc.get('docDate')]):
+                logging.warning(f"Пропуск скачивания PDF: не хватает данных. Doc ID: {doc.get('doc_id')}")
+                continue
+            task = asyncio.create_task(_download_document(client, doc.get('doc_uuid'), partner_limit))
+            window.append((doc, task))
 
-    for doc in documents:
-        # ### ИСПРАВЛЕНО: Добавлен блок try..except для изоляции ошибок ###
-        try:
-            # save_document_to_db(cursor, doc)
-
-            if save_to_pdf:
+    try:
+        fill_window()
+        while window:
+            doc, download_task = window.popleft()
+            fill_window()
+            # ### ИСПРАВЛЕНО: Добавлен блок try..except для изоляции ошибок ###
+            try:
                 doc_uuid = doc.get('doc_uuid')
                 generic_doc_type_desc = doc.get('type', {}).get('description', 'Без типа')
                 doc_number = doc.get('docNumber', 'Без номера')
                 doc_date_ts = doc.get('docDate')
-                if not all([doc_uuid, doc_date_ts]):
-                    logging.warning(f"Пропуск скачивания PDF: не хватает данных. Doc ID: {doc.get('doc_id')}")
-                    continue
 
-                pdf_response = session.get(DOWNLOAD_URL_TEMPLATE, params={'gln': SENDER_GLN, 'doc_uuid': doc_uuid, 'format': 'pdf'})
-                pdf_response.raise_for_status()
-                pdf_content = pdf_response.content
-
-                extracted_title = extract_title_from_pdf(pdf_content)
+                pdf_content, extracted_title = await download_task
                 final_doc_title = extracted_title or generic_doc_type_desc
-                
+
                 # ### ИСПРАВЛЕНО: Извлекаем только документы, содержащие "накладна" в названии и не содержащие "транспорт" ###
                 if "накладна" not in final_doc_title.lower() or "транспорт" in final_doc_title.lower():
                     continue
-                    
+
                 logging.info(f"Загрузка PDF для doc_uuid: {doc_uuid}...")
                 dt_object = datetime.datetime.fromtimestamp(doc_date_ts)
                 dd_mm_yyyy_str_for_file = dt_object.strftime('%d %m %Y')
@@ -246,9 +255,9 @@ def process_documents(session, cursor, documents, save_to_pdf, client_folder_pat
                 if excel_key in seen_excel_entries:
                     logging.info(f"Пропуск дубликата для отчета и файла: {excel_key}")
                     continue
-                
+
                 seen_excel_entries.add(excel_key)
-                
+
                 logging.info(f"Определен тип документа: '{final_doc_title}' (уникальный)")
 
                 yyyymm_folder_name = dt_object.strftime('%Y%m')
@@ -257,30 +266,42 @@ def process_documents(session, cursor, documents, save_to_pdf, client_folder_pat
                 os.makedirs(type_folder, exist_ok=True)
 
                 file_name_base = f"{final_doc_title} №{doc_number} від {dd_mm_yyyy_str_for_file}"
-                
+
                 file_name = f"{sanitize_filename(file_name_base)}.pdf"
                 full_path = os.path.join(type_folder, file_name)
 
                 logging.info(f"Сохранение PDF: {full_path}")
-                with open(full_path, 'wb') as f:
-                    f.write(pdf_content)
                 abs_full_path = os.path.abspath(full_path)
-                full_path = detect_sign(abs_full_path)
-                file_name = os.path.basename(abs_full_path)
-                downloaded_count += 1
-                downloaded_filenames.append(file_name)
-
-                excel_report_data.append({
+                save_task = asyncio.create_task(
+                    _save_document(saving_by_path.get(abs_full_path), full_path, pdf_content))
+                saving_by_path[abs_full_path] = save_task
+                excel_row = {
                     'Тип документа': final_doc_title,
                     'Дата': dd_mm_yyyy_str_for_excel,
                     'Номер': doc_number
-                })
-                logging.info(f"Успешно сохранен PDF: {full_path}")
-        
-        except Exception as e:
-            logging.error(f"Ошибка при обработке документа doc_id={doc.get('doc_id')}. Пропускаем. Ошибка: {e}")
-            # Пропускаем этот документ и переходим к следующему
+                }
+                saving.append((doc, os.path.basename(abs_full_path), excel_row, save_task))
+
+            except Exception as e:
+                logging.error(f"Ошибка при обработке документа doc_id={doc.get('doc_id')}. Пропускаем. Ошибка: {e}")
+                # Пропускаем этот документ и переходим к следующему
+                continue
+
+        results = await asyncio.gather(*(save_task for _, _, _, save_task in saving), return_exceptions=True)
+    finally:
+        for _, task in window:
+            task.cancel()
+        for _, _, _, task in saving:
+            task.cancel()
+
+    for (doc, file_name, excel_row, _), full_path in zip(saving, results):
+        if isinstance(full_path, Exception):
+            logging.error(f"Ошибка при обработке документа doc_id={doc.get('doc_id')}. Пропускаем. Ошибка: {full_path}")
             continue
+        downloaded_count += 1
+        downloaded_filenames.append(file_name)
+        excel_report_data.append(excel_row)
+        logging.info(f"Успешно сохранен PDF: {full_path}")
 
     return downloaded_count, downloaded_filenames, excel_report_data
 
@@ -316,74 +337,118 @@ def create_client_excel_report(report_data, client_folder_path, client_name, sta
         logging.error(f"Не удалось создать Excel-отчет для клиента {client_name}: {e}")
 
 
-def _get_base_partner_list(session):
-    logging.info("Шаг 2.1: Получение базового списка GLN всех партнеров...")
-    try:
-        response = session.get(RETAILERS_URL)
-        response.raise_for_status()
-        base_partners = response.json()
-        logging.info(f"Найдено базовых партнеров: {len(base_partners)}")
-        return base_partners
-    except Exception as e:
-        logging.error(f"Не удалось получить базовый список партнеров: {e}")
-        return []
-
-
-def _get_partner_details(session, partner_gln, sender_gln):
-    params = {'gln': sender_gln, 'query': partner_gln}
-    try:
-        response = session.get(IDENTIFIERS_URL, params=params)
-        response.raise_for_status()
-        results = response.json()
-        if results and isinstance(results, list):
-            return results[0]
-        elif results and isinstance(results, dict):
-            return results
-    except Exception as e:
-        logging.warning(f"Не удалось получить детали для GLN {partner_gln}: {e}")
-    return None
-
-
-def get_all_partners_with_details(session, sender_gln):
-    base_partners = _get_base_partner_list(session)
+async def get_all_partners_with_details(client, sender_gln):
+    base_partners = await client.get_retailers()
     if not base_partners:
         return []
     
     logging.info("Шаг 2.2: Обогащение данных по каждому партнеру (получение ЕГРПОУ)...")
-    detailed_partners = []
+    partners = []
     for partner in base_partners:
         if not isinstance(partner, dict):
             logging.warning(f"Пропуск некорректной записи в базовом списке: {partner}")
             continue
-        
-        partner_gln = partner.get('gln')
-        if not partner_gln:
-            continue
-            
-        details = _get_partner_details(session, partner_gln, sender_gln)
+        if partner.get('gln'):
+            partners.append(partner)
+
+    # запросы идут параллельно (в пределах лимита клиента), порядок партнеров сохраняется
+    all_details = await asyncio.gather(
+        *(client.get_partner_details(partner.get('gln'), sender_gln) for partner in partners))
+    detailed_partners = []
+    for partner, details in zip(partners, all_details):
         if details:
             detailed_partners.append(details)
         else:
-            logging.warning(f"Детали для партнера {partner.get('name')} (GLN: {partner_gln}) не найдены. Будут использованы базовые данные.")
+            logging.warning(f"Детали для партнера {partner.get('name')} (GLN: {partner.get('gln')}) не найдены. Будут использованы базовые данные.")
             detailed_partners.append(partner)
             
     logging.info(f"Готово к обработке партнеров с детальной информацией: {len(detailed_partners)}")
     return detailed_partners
 
 
-def main(start_date, end_date, save_to_pdf, client_identifier=None):
+async def process_partner(client, partner, start_date, end_date, save_to_pdf, folder_locks, partners_limit):
+    client_gln = str(partner.get('gln'))
+    client_name = partner.get('name', '').strip()
+    client_kpp = partner.get('companyKpp')
+
+    if not client_gln:
+        logging.warning(f"Пропуск партнера '{client_name}' из-за отсутствия GLN.")
+        return
+
+    client_folder_base = f"{client_kpp}" if client_kpp else f"{client_gln}"
+    client_folder_path = sanitize_filename(client_folder_base)
+
+    # партнеры с общей папкой обрабатываются по очереди, чтобы documents.log и отчет в ней
+    # оставались от последнего партнера, как при последовательной обработке
+    async with folder_locks.setdefault(client_folder_path, asyncio.Lock()), partners_limit:
+        if client_kpp:
+            logging.info(f"--- Начало обработки партнера: {client_name} (ЕГРПОУ: {client_kpp}) ---")
+        else:
+            logging.info(f"--- Начало обработки партнера: {client_name} (GLN: {client_gln}, ЕГРПОУ отсутствует) ---")
+
+        all_docs_for_partner = []
+        conn = None
+        try:
+            logging.info("Поиск исходящих и входящих документов...")
+            dir_out = {"type": "EQ", "sender": [SENDER_GLN], "receiver": [client_gln]}
+            dir_in = {"type": "EQ", "sender": [client_gln], "receiver": [SENDER_GLN]}
+            out_docs, in_docs = await asyncio.gather(
+                client.get_documents(dir_out, start_date, end_date),
+                client.get_documents(dir_in, start_date, end_date),
+            )
+
+            all_docs_for_partner = (out_docs or []) + (in_docs or [])
+
+            if not all_docs_for_partner:
+                logging.info(f"Документы для партнера {client_name} в указанном периоде не найдены.")
+                return
+
+            logging.info(f"Всего найдено документов от API: {len(all_docs_for_partner)}")
+
+            # у каждого партнера своя транзакция: commit/rollback одного не затрагивает других
+            conn = await asyncio.to_thread(get_db_connection)
+            if not conn:
+                raise ConnectionError("Нет подключения к PostgreSQL")
+            with conn.cursor() as cursor:
+                downloaded_count, downloaded_filenames, excel_data = await process_documents(
+                    client, cursor, all_docs_for_partner, save_to_pdf, client_folder_path
+                )
+
+            conn.commit()
+            logging.info(f"Изменения в базе данных для {client_name} успешно сохранены.")
+
+            if save_to_pdf and downloaded_count > 0:
+                create_filenames_log(client_folder_path, downloaded_filenames)
+                create_client_excel_report(excel_data, client_folder_path, client_name, start_date, end_date)
+
+        except Exception as e:
+            logging.error(f"Ошибка при обработке партнера {client_name}. Откат изменений для этого партнера. Ошибка: {e}")
+            if all_docs_for_partner:
+                dump_error_json(all_docs_for_partner)
+            if conn:
+                conn.rollback()
+        finally:
+            if conn:
+                conn.close()
+
+        logging.info(f"--- Завершение обработки партнера: {client_name} ---")
+
+
+async def main_async(start_date, end_date, save_to_pdf, client_identifier=None):
+    # проверка доступности БД до входа в EDIN; партнеры работают через свои соединения
     conn = get_db_connection()
     if not conn: return
+    conn.close()
 
     try:
-        with requests.Session() as session:
-            sid = get_sid(session, EDI_LOGIN, EDI_PASSWORD)
+        async with EdinClient(SENDER_GLN) as client:
+            sid = await client.get_sid(EDI_LOGIN, EDI_PASSWORD)
             if not sid: return
 
             target_partners = []
             if client_identifier:
                 logging.info(f"Шаг 2: Запрошена обработка для одного клиента по идентификатору: {client_identifier}")
-                partner = _get_partner_details(session, client_identifier, SENDER_GLN)
+                partner = await client.get_partner_details(client_identifier, SENDER_GLN)
                 if partner:
                     target_partners.append(partner)
                 else:
@@ -391,73 +456,24 @@ def main(start_date, end_date, save_to_pdf, client_identifier=None):
                     return
             else:
                 logging.info("Шаг 2: Идентификатор клиента не указан. Получаем и обрабатываем всех партнеров...")
-                target_partners = get_all_partners_with_details(session, SENDER_GLN)
+                target_partners = await get_all_partners_with_details(client, SENDER_GLN)
                 if not target_partners:
                     logging.warning("Не найдено партнеров для обработки.")
                     return
 
-            for partner in target_partners:
-                client_gln = str(partner.get('gln'))
-                client_name = partner.get('name', '').strip()
-                client_kpp = partner.get('companyKpp')
-
-                if not client_gln:
-                    logging.warning(f"Пропуск партнера '{client_name}' из-за отсутствия GLN.")
-                    continue
-
-                if client_kpp:
-                    client_folder_base = f"{client_kpp}"
-                    logging.info(f"--- Начало обработки партнера: {client_name} (ЕГРПОУ: {client_kpp}) ---")
-                else:
-                    client_folder_base = f"{client_gln}"
-                    logging.info(f"--- Начало обработки партнера: {client_name} (GLN: {client_gln}, ЕГРПОУ отсутствует) ---")
-
-                client_folder_path = sanitize_filename(client_folder_base)
-
-                all_docs_for_partner = []
-                try:
-                    logging.info("Поиск исходящих документов...")
-                    dir_out = {"type": "EQ", "sender": [SENDER_GLN], "receiver": [client_gln]}
-                    out_docs = get_documents(session, dir_out, start_date, end_date)
-
-                    logging.info("Поиск входящих документов...")
-                    dir_in = {"type": "EQ", "sender": [client_gln], "receiver": [SENDER_GLN]}
-                    in_docs = get_documents(session, dir_in, start_date, end_date)
-
-                    all_docs_for_partner = (out_docs or []) + (in_docs or [])
-                    
-                    if not all_docs_for_partner:
-                        logging.info(f"Документы для партнера {client_name} в указанном периоде не найдены.")
-                        continue
-                    
-                    logging.info(f"Всего найдено документов от API: {len(all_docs_for_partner)}")
-
-                    with conn.cursor() as cursor:
-                        downloaded_count, downloaded_filenames, excel_data = process_documents(
-                            session, cursor, all_docs_for_partner, save_to_pdf, client_folder_path
-                        )
-
-                    conn.commit()
-                    logging.info(f"Изменения в базе данных для {client_name} успешно сохранены.")
-
-                    if save_to_pdf and downloaded_count > 0:
-                        create_filenames_log(client_folder_path, downloaded_filenames)
-                        create_client_excel_report(excel_data, client_folder_path, client_name, start_date, end_date)
-
-                except Exception as e:
-                    logging.error(f"Ошибка при обработке партнера {client_name}. Откат изменений для этого партнера. Ошибка: {e}")
-                    if all_docs_for_partner:
-                        dump_error_json(all_docs_for_partner)
-                    conn.rollback()
-
-                logging.info(f"--- Завершение обработки партнера: {client_name} ---")
+            folder_locks = {}
+            partners_limit = asyncio.Semaphore(EDIN_PARTNERS_PARALLEL)
+            await asyncio.gather(*(
+                process_partner(client, partner, start_date, end_date, save_to_pdf, folder_locks, partners_limit)
+                for partner in target_partners
+            ))
 
     except Exception as e:
         logging.error(f"Произошла глобальная ошибка: {e}")
-    finally:
-        if conn:
-            conn.close()
-            logging.info("Соединение с PostgreSQL закрыто.")
+
+
+def main(start_date, end_date, save_to_pdf, client_identifier=None):
+    asyncio.run(main_async(start_date, end_date, save_to_pdf, client_identifier))
 
 if __name__ == "__main__":
     START_DATE = "2024-09-01"
@@ -67,7 +67,6 @@ https://aistudio.google.com/prompts/1T6A_xzSS7Mol8SihX7R716K_s7NcrGO7
 """
 
 import asyncio
-import base64
 import os
 import re
 import logging
@@ -78,6 +77,8 @@ from dotenv import load_dotenv
 import aiohttp
 from dateutil.relativedelta import relativedelta
 
+from AsyncDiskWriter import DownloadStats, iter_base64_decoded, stream_to_file
+
 load_dotenv()
 
 logging.basicConfig(
@@ -154,7 +155,8 @@ async def fetch_one_url(session: aiohttp.ClientSession, url: str, semaphore: asy
             return None
 
 async def get_document_as_pdf(session: aiohttp.ClientSession, doc: Dict[str, Any], semaphore: asyncio.Semaphore,
-                              facsimile: bool, output_dir: str, suffix: str = "") -> Optional[str]:
+                              facsimile: bool, output_dir: str, suffix: str = "",
+                              stats: Optional[DownloadStats] = None) -> Optional[str]:
     doc_id = doc.get('doc_id')
     url = f"http://{HOSTNAME_PUBLIC}:63777/api/Info/PrintDocPDF?idOrg={ID_ORG}&docID={doc_id}&facsimile={str(facsimile).lower()}"
     data = await fetch_one_url(session, url, semaphore)
@@ -199,12 +201,11 @@ async def get_document_as_pdf(session: aiohttp.ClientSession, doc: Dict[str, Any
         final_name = base_name.replace('.', ' ').upper()
         final_file_name = f"{clean_filename(final_name)}{suffix}.PDF"
 
-        os.makedirs(output_dir, exist_ok=True)
         file_path = os.path.join(output_dir, final_file_name)
-        
-        file_data = base64.b64decode(file_raw)
-        with open(file_path, 'wb') as f:
-            f.write(file_data)
+
+        # API отдает файл base64 строкой внутри JSON: сам ответ приходится читать целиком,
+        # но декодированные байты пишутся на диск порциями, без блокировки цикла событий
+        await stream_to_file(iter_base64_decoded(file_raw), file_path, stats)
         return file_path
     except Exception as e:
         logging.error(f"Произошла непредвиденная ошибка при обработке doc_id {doc_id}: {e}")
@@ -266,12 +267,14 @@ async def download_documents_for_partner(session: aiohttp.ClientSession, partner
     print(f"Всего найдено в реестре (с дубликатами): {len(partner_docs)} документов.")
     print(f"Найдено уникальных документов (с учетом 'moddate'): {len(unique_partner_docs)}. Начинаю загрузку PDF...")
 
+    stats = DownloadStats()
     tasks = []
     for doc in unique_partner_docs:
         doc_type_folder_name = get_doc_type_name(doc.get('docname'))
         doc_specific_output_dir = os.path.join(base_output_dir, doc_type_folder_name)
         
-        task = get_document_as_pdf(session, doc, semaphore, facsimile=True, output_dir=doc_specific_output_dir)
+        task = get_document_as_pdf(session, doc, semaphore, facsimile=True, output_dir=doc_specific_output_dir,
+                                   stats=stats)
         tasks.append(task)
 
     results = await asyncio.gather(*tasks)
@@ -295,6 +298,7 @@ async def download_documents_for_partner(session: aiohttp.ClientSession, partner
     print(f"Найдено уникальных документов: {len(unique_partner_docs)}")
     print(f"✅ Успешно загружено по данным скрипта: {successful_count}")
     print(f"💽 Фактически файлов в папках: {total_files_on_disk}")
+    print(f"💽 {stats.report()}")
         
     if failed_docs:
         failed_ids = [d.get('doc_id', 'N/A') for d in failed_docs]
@@ -1,14 +1,23 @@
 # -*- coding: utf-8 -*-
 
+import argparse
 import asyncio
+import hashlib
 import os
+from contextlib import aclosing
 from datetime import datetime
-from urllib.parse import quote
+from functools import partial
+from urllib.parse import quote, urlparse
 import asyncpg
 import aiohttp
 from dateutil.parser import parse
 from dotenv import load_dotenv
-from AsyncPostgresql import sql_to_df_async
+from AsyncDiskWriter import DownloadStats, save_response
+from AsyncPostgresql import iter_records
+from DownloadManifest import DownloadManifest
+from ErpnDownloadTargets import DOWNLOAD_TARGETS_SQL, ensure_download_targets
+from DownloadScheduler import DownloadScheduler, TransientError, is_transient_status, parse_retry_after
+from TokenManager import TokenManager
 
 # Загружаем переменные окружения
 load_dotenv()
@@ -18,17 +27,10 @@ DB_PASS = os.getenv('PG_PASSWORD')
 DB_HOST = os.getenv('PG_HOST')
 DB_NAME = os.getenv('PG_DBNAME')
 
-# Импортируем вашу рабочую функцию для получения токена
-try:
-    from TaxGovUaConfig import get_token
-except ImportError:
-    print("🔥 Ошибка: Не удалось найти файл 'TaxGovUaConfig.py' с функцией get_token().")
-    print("Пожалуйста, убедитесь, что файл находится в той же директории.")
-    exit()
-
 # --- КОНФИГУРАЦИЯ И ГЛОБАЛЬНЫЕ ПЕРЕМЕННЫЕ ---
 
 URL_API_BASE = "https://cabinet.tax.gov.ua/ws/api"
+API_HOST = urlparse(URL_API_BASE).netloc
 URL_DOC_LIST = f"{URL_API_BASE}/nlnk/nlnkhd"
 URL_PDF_DOC = f"{URL_API_BASE}/file/nlnkhd/pdf"
 URL_PDF_RECEIPT1 = f"{URL_API_BASE}/file/nlnkhd/pdf/kvt"
@@ -36,169 +38,161 @@ URL_PDF_RECEIPT2 = f"{URL_API_BASE}/file/nlnkhd/pdf/kvt2"
 URL_PDF_RECEIPT3 = f"{URL_API_BASE}/file/nlnkhd/pdf/kvt3"
 URL_PDF_RECEIPT4 = f"{URL_API_BASE}/file/nlnkhd/pdf/kvt4"
 DOWNLOADS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "downloads")
+MANIFEST_PATH = os.getenv("ERPN_MANIFEST_PATH", os.path.join(DOWNLOADS_DIR, "manifest.sqlite3"))
 DESIRED_STATUSES = {1, 2, 13, 14, 15, 18}  # Статусы, заблокированных документов
+CHUNK_SIZE = 1000  # Сколько строк читать из базы за один раз (серверный курсор)
+
 
-SQL = r"""
-    WITH 
-    doc_pn AS (
-        SELECT code 
-        FROM t_tax_cabinet_erpn_api
-        WHERE crtdate > current_date - 365 AND (hsmcstt in (1, 2, 13, 14, 15, 18))
-    ),
-    doc_rk AS (
-        SELECT crcode
-        FROM t_tax_cabinet_erpn_api
-        WHERE crtdate > current_date - 365 AND (hsmcstt in (1, 2, 13, 14, 15, 18))
-            AND coalesce(crcode,0) <> 0
-    ),
-    nn_rk AS (
-        SELECT DISTINCT
-            CASE 
-                WHEN ftype = 0 THEN     
-                    concat(cptin,'\' , to_char(crtdate,'yyyymm'),'\ПН\ПН ',nmr,' від ',to_char(crtdate,'dd mm yyyy'),'.pdf') 
-                WHEN ftype = 1 THEN
-                    concat(cptin,'\' , to_char(crtdate,'yyyymm'), '\ПН\ПН ',corrnmr,' від ',(SELECT to_char(crtdate,'dd mm yyyy') FROM t_tax_cabinet_erpn_api AS src WHERE src.code = api.crcode),' РК ',nmr,' ',to_char(crtdate,'dd mm yyyy'),'.pdf') 
-            END AS file_name,
-            concat('https://cabinet.tax.gov.ua/ws/api/file/nlnkhd/pdf?code=',api.code,'&impdate=',impdate) AS url,
-            *
-        FROM t_tax_cabinet_erpn_api AS api
-            INNER JOIN (    
-                SELECT 
-                    code AS block_code
-                FROM doc_pn
-                UNION ALL 
-                SELECT 
-                    crcode
-                FROM doc_rk
-            ) AS api_block
-            ON api.code = api_block.block_code
-    )
-    SELECT DISTINCT
-        file_name,
-        url,
-        code,
-        impdate,
-        0 AS kvt_number
-    FROM nn_rk AS api 
-    UNION ALL 
-    SELECT DISTINCT
-        REPLACE(file_name,'.pdf',' KVT1.pdf') file_name,
-        concat('https://cabinet.tax.gov.ua/ws/api/file/nlnkhd/pdf/kvt?code=',nn_rk.code,'&impdate=',impdate) AS url
-        ,code,
-        impdate,
-        1 AS kvt_number
-    FROM nn_rk
-    UNION ALL 
-    SELECT DISTINCT
-        REPLACE(file_name,'.pdf',' KVT2.pdf') file_name,
-        concat('https://cabinet.tax.gov.ua/ws/api/file/nlnkhd/pdf/kvt2?code=',api.code,'&impdate=',impdate) AS url    
-        ,code,
-        impdate,
-        2 AS kvt_number
-    FROM nn_rk AS api 
-    WHERE api.kvt2 <> 0
-    UNION ALL 
-    SELECT DISTINCT
-        REPLACE(file_name,'.pdf',' KVT3.pdf') file_name,
-        concat('https://cabinet.tax.gov.ua/ws/api/file/nlnkhd/pdf/kvt3?code=',api.code,'&impdate=',impdate) AS url    
-        ,code,
-        impdate,
-        3 AS kvt_number
-    FROM nn_rk AS api 
-    WHERE api.kvt3 <> 0
-    UNION ALL 
-    SELECT DISTINCT
-        REPLACE(file_name,'.pdf',' KVT4.pdf') file_name,
-        concat('https://cabinet.tax.gov.ua/ws/api/file/nlnkhd/pdf/kvt4?code=',api.code,'&impdate=',impdate) AS url    
-        ,code,
-        impdate,
-        4 AS kvt_number
-    FROM nn_rk AS api 
-    WHERE api.kvt4 <> 0
-    ORDER BY file_name
-    ;
-
-"""
-
-
-async def download_pdf_async(session, url, headers, file_path, params_with_page):
-    try:
-        path_file = os.path.dirname(file_path)
-        file_name = os.path.basename(file_path)
-        path_file = os.path.join(DOWNLOADS_DIR, path_file)
-        os.makedirs(path_file, exist_ok=True)
-    except Exception as e:
-        print(f"🔥 Ошибка: Не удалось создать директорию для файла {path_file}: {e}")
-        return
-
-    file_path = os.path.join(path_file, file_name)
-
-    for attempt in range(5):
+async def download_pdf_async(session, url, token_manager, file_path, params_with_page, stats=None):
+    # одна попытка; повторы и ограничение нагрузки на сервер - в DownloadScheduler.
+    # Исключение - 401: токен обновляется (один вход на все задачи) и запрос повторяется
+    # возвращает (путь, размер, sha256) для манифеста или None, если сервер отказал
+    file_name = os.path.basename(file_path)
+    file_path = os.path.join(DOWNLOADS_DIR, file_path)
+    hasher = hashlib.sha256()
+    token = await token_manager.get_token()
+
+    for attempt in range(2):
+        headers = {"Authorization": token, "Content-Type": "application/json"}
         try:
             async with session.get(url, headers=headers, params=params_with_page, timeout=45) as response:
                 if response.status == 200:
-                    with open(file_path, 'wb') as f:
-                        f.write(await response.read())
+                    # тело пишется на диск порциями по мере получения, без блокировки цикла событий
+                    size = await save_response(response, file_path, stats, hasher)
                     print(f"  ✅ Файл сохранен: {os.path.basename(file_path)}")
-                    return
-                else:
-                    print(f"  ❌ Ошибка {response.status} при скачивании {os.path.basename(file_path)}")
-                    if 400 <= response.status < 500: break
-        except Exception as e:
-            pass
-            # print(f"  ❌ Ошибка сети при скачивании {os.path.basename(file_path)}: {e}")
-
-        await asyncio.sleep(2 ** attempt)
-    print(f"🔥 Не удалось скачать файл: {os.path.basename(file_path)}")
-
-
-async def main():
+                    return file_path, size, hasher.hexdigest()
+                if response.status == 401 and attempt == 0:
+                    token = await token_manager.refresh(token)
+                    continue
+                if is_transient_status(response.status):
+                    raise TransientError(f"Ошибка {response.status} при скачивании {file_name}", response.status,
+                                         parse_retry_after(response.headers.get("Retry-After")))
+                print(f"  ❌ Ошибка {response.status} при скачивании {os.path.basename(file_path)}")
+                return None
+        except (aiohttp.ClientConnectionError, aiohttp.ClientPayloadError, asyncio.TimeoutError) as e:
+            raise TransientError(f"Ошибка сети при скачивании {file_name}: {e!r}") from e
+
+
+def manifest_key(record):
+    return DownloadManifest.make_key(record['code'], record['impdate'].strftime('%Y-%m-%d %H:%M:%S'),
+                                     record['kvt_number'])
+
+
+def create_download_task(session, token_manager, record, stats=None):
+    # строка выборки -> функция, создающая корутину загрузки нужного документа или квитанции
+    params_with_page = {
+        'code': int(record['code']),
+        'impdate': record['impdate'].strftime('%Y-%m-%d %H:%M:%S')
+    }
+
+    kvt_number = record['kvt_number']
+    file_path = record['file_name']
+    if kvt_number == 0:
+        url = URL_PDF_DOC
+    elif kvt_number == 1:
+        url = URL_PDF_RECEIPT1
+    elif kvt_number == 2:
+        url = URL_PDF_RECEIPT2
+    elif kvt_number == 3:
+        url = URL_PDF_RECEIPT3
+    elif kvt_number == 4:
+        url = URL_PDF_RECEIPT4
+
+    return partial(download_pdf_async, session, url, token_manager, file_path, params_with_page, stats)
+
+
+async def produce_downloads(scheduler, session, manifest, stats, counts, token_manager, force, verify):
+    """
+    Производитель: читает цели загрузки серверным курсором и ставит задания в очередь планировщика.
+    Очередь ограничена, поэтому в памяти не больше одной порции строк и очереди заданий,
+    а первые загрузки начинаются сразу после первой порции.
+    Возвращает False, если не удалось получить токен.
+    """
+    token_checked = False
+    # aclosing: при выходе из цикла раньше времени соединение с курсором сразу возвращается в пул
+    async with aclosing(iter_records(DOWNLOAD_TARGETS_SQL, chunk_size=CHUNK_SIZE)) as chunks:
+        async for records in chunks:
+            targets = [(manifest_key(record), os.path.join(DOWNLOADS_DIR, record['file_name'])) for record in records]
+            # проверка файлов на диске (stat, при verify - хэш) - одним вызовом в потоке на порцию
+            fresh_flags = [False] * len(records) if force else \
+                await asyncio.to_thread(manifest.check_fresh, targets, verify)
+            for record, (key, _), fresh in zip(records, targets, fresh_flags):
+                if fresh:
+                    counts["skipped"] += 1
+                    continue
+
+                # токен нужен только если есть что скачивать; из кэша - мгновенно, иначе вход через браузер
+                if not token_checked:
+                    print("Получение токена аутентификации...")
+                    try:
+                        await token_manager.get_token()
+                    except Exception as e:
+                        print(f"🔥 Критическая ошибка: Не удалось получить токен ({e}). Завершение работы.")
+                        return False
+                    print("✅ Токен успешно получен.")
+                    token_checked = True
+
+                await scheduler.submit(create_download_task(session, token_manager, record, stats), host=API_HOST,
+                                       key=(key, record['file_name']))
+    return True
+
+
+async def record_results(results, manifest, counts):
+    """Приемник результатов: записывает загруженные файлы в манифест и считает итоги."""
+    while True:
+        item = await results.get()
+        if item is None:
+            return
+        (key, file_name), result, error = item
+        if error is not None:
+            counts["failed"] += 1
+            print(f"🔥 Не удалось скачать файл: {os.path.basename(file_name)}: {error}")
+        elif result is None:
+            counts["refused"] += 1
+        else:
+            counts["downloaded"] += 1
+            await asyncio.to_thread(manifest.record, key, *result)
+
+
+async def main(force=False, verify=False):
+    """
+    force - скачать все файлы заново, не глядя в манифест.
+    verify - сверять sha256 файлов на диске с манифестом (иначе только путь и размер).
+    """
     print("🚀 Запуск скрипта для загрузки PDF документов...")
-    print("Получение токена аутентификации...")
-    driver, token = get_token()
-    if not token:
-        print("🔥 Критическая ошибка: Не удалось получить токен. Завершение работы.")
-        if driver: driver.quit()
-        return
-    print("✅ Токен успешно получен.")
-    headers = {"Authorization": token, "Content-Type": "application/json"}
-
-    async with aiohttp.ClientSession() as session:
-        download_tasks = []
-
-        df = await sql_to_df_async(SQL)
-        for _, row in df.iterrows():
-
-            params_with_page = {
-                'code': row['code'],
-                'impdate': row['impdate'].strftime('%Y-%m-%d %H:%M:%S')
-            }
-
-            kvt_number = row['kvt_number']
-            file_path = row['file_name']
-            if kvt_number == 0:
-                url = URL_PDF_DOC
-            elif kvt_number == 1:
-                url = URL_PDF_RECEIPT1
-            elif kvt_number == 2:
-                url = URL_PDF_RECEIPT2
-            elif kvt_number == 3:
-                url = URL_PDF_RECEIPT3
-            elif kvt_number == 4:
-                url = URL_PDF_RECEIPT4
-
-            download_tasks.append(download_pdf_async(session, url, headers, file_path, params_with_page))
-
-        if download_tasks:
-            await asyncio.gather(*download_tasks)
-
-    if driver:
-        driver.quit()
+    # список файлов хранится готовым в t_tax_cabinet_erpn_download_target (см. ErpnDownloadTargets)
+    await ensure_download_targets()
+
+    stats = DownloadStats()
+    counts = {"downloaded": 0, "skipped": 0, "refused": 0, "failed": 0}
+    token_manager = TokenManager()
+    results = asyncio.Queue()
+
+    # производитель (курсор БД) -> ограниченная очередь -> исполнители планировщика -> приемник результатов
+    with DownloadManifest(MANIFEST_PATH) as manifest:
+        sink = asyncio.create_task(record_results(results, manifest, counts))
+        async with aiohttp.ClientSession() as session:
+            async with DownloadScheduler(
+                on_done=lambda key, result: results.put_nowait((key, result, None)),
+                on_error=lambda key, error: results.put_nowait((key, None, error)),
+            ) as scheduler:
+                await produce_downloads(scheduler, session, manifest, stats, counts, token_manager, force, verify)
+        await results.put(None)
+        await sink
+
+    print(f"✅ Загружено: {counts['downloaded']}, ⏭️ пропущено (уже загружены): {counts['skipped']}, "
+          f"❌ отказано сервером: {counts['refused']}, 🔥 ошибок: {counts['failed']}")
+    print(f"💽 {stats.report()}")
     print("\n✅ Все задачи выполнены. Скрипт завершил работу.")
 
 
 if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Загрузка PDF заблокированных НН/РК и квитанций")
+    arg_parser.add_argument("--force", action="store_true", help="скачать все файлы заново")
+    arg_parser.add_argument("--verify", action="store_true", help="сверять sha256 файлов с манифестом")
+    args = arg_parser.parse_args()
+
     start_time = datetime.now()
-    asyncio.run(main())
+    asyncio.run(main(force=args.force, verify=args.verify))
     end_time = datetime.now()
     print(f"⏱️ Общее время выполнения: {end_time - start_time}")
\ No newline at end of file